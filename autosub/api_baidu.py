@@ -9,7 +9,8 @@ from urllib.parse import urlencode
 import json
 import gettext
 import os
-import base64
+import time
+import hashlib
 
 # Import third-party modules
 import requests
@@ -18,6 +19,8 @@ import requests
 # Any changes to the path and your own modules
 from autosub import constants
 from autosub import exceptions
+from autosub import net_utils
+from autosub import cache_utils
 
 
 API_BAIDU_TEXT = gettext.translation(domain=__name__,
@@ -62,19 +65,22 @@ def get_baidu_transcript(
         return ""
 
 
-def get_baidu_token(
+def request_baidu_token(
         api_key,
         api_secret,
-        token_url=constants.BAIDU_TOKEN_URL
+        token_url=constants.BAIDU_TOKEN_URL,
+        timeout=None,
+        proxies=None
 ):
     """
-    Function for getting Baidu ASR API token
+    Function for getting Baidu ASR API token and its lifetime in seconds
     """
     requests_params = {"grant_type": "client_credentials",
                        "client_id": api_key,
                        "client_secret": api_secret}
     post_data = urlencode(requests_params).encode("utf-8")
-    result = requests.post(token_url, data=post_data)
+    result = net_utils.get_http_session().post(
+        token_url, data=post_data, timeout=timeout, proxies=proxies)
     result_str = result.content.decode("utf-8")
     # get the one with valid content
     try:
@@ -83,12 +89,114 @@ def get_baidu_token(
             if "audio_voice_assistant_get" not in result_dict["scope"].split(" "):
                 raise exceptions.SpeechToTextException(
                     _("Error: Check you project if its ASR feature is enabled."))
-            return result_dict["access_token"]
+            return result_dict["access_token"], result_dict.get("expires_in", 0)
         raise exceptions.SpeechToTextException(
             json.dumps(result_dict, indent=4, ensure_ascii=False))
     except (ValueError, IndexError):
         # no result
-        return ""
+        return "", 0
+
+
+def get_baidu_token(
+        api_key,
+        api_secret,
+        token_url=constants.BAIDU_TOKEN_URL,
+        timeout=None,
+        proxies=None
+):
+    """
+    Function for getting Baidu ASR API token
+    """
+    return request_baidu_token(
+        api_key=api_key,
+        api_secret=api_secret,
+        token_url=token_url,
+        timeout=timeout,
+        proxies=proxies)[0]
+
+
+def get_cached_baidu_token(  # pylint: disable=too-many-arguments
+        api_key,
+        api_secret,
+        token_url=constants.BAIDU_TOKEN_URL,
+        cache_file=os.path.join(constants.DEFAULT_CACHE_PATH,
+                                constants.BAIDU_TOKEN_CACHE_NAME),
+        margin=constants.BAIDU_TOKEN_REFRESH_MARGIN,
+        rejected_token=None,
+        timeout=None,
+        proxies=None
+):
+    """
+    Give the api key and the api secret and return a Baidu ASR API token
+    cached in the token cache file.
+    Only a token close to its expiry or rejected by Baidu is requested again
+    and a rejected token is deleted from the file if no new one is got.
+    The file is locked while a token is requested
+    so the concurrent jobs share one request.
+    """
+    try:
+        cache_dir = os.path.dirname(cache_file)
+        if cache_dir and not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir, exist_ok=True)
+        # the tokens are readable only by the user
+        token_file = os.fdopen(
+            os.open(cache_file, os.O_RDWR | os.O_CREAT, 0o600),
+            "r+", encoding="utf-8")
+    except OSError:
+        # no writable cache directory
+        return get_baidu_token(
+            api_key=api_key,
+            api_secret=api_secret,
+            token_url=token_url,
+            timeout=timeout,
+            proxies=proxies)
+    # a changed secret gets a new token
+    secret_hash = hashlib.sha256(api_secret.encode("utf-8")).hexdigest()
+    with token_file:
+        net_utils.lock_file(token_file)
+        try:
+            token_file.seek(0)
+            try:
+                tokens = json.loads(token_file.read())
+            except ValueError:
+                tokens = {}
+            now = time.time()
+            token = tokens.get(api_key)
+            if token and token.get("secret_hash") == secret_hash \
+                    and token["expires_at"] - margin > now \
+                    and token["access_token"] != rejected_token:
+                return token["access_token"]
+            if token and token["access_token"] == rejected_token:
+                # another job may not refresh it
+                del tokens[api_key]
+            try:
+                access_token, expires_in = request_baidu_token(
+                    api_key=api_key,
+                    api_secret=api_secret,
+                    token_url=token_url,
+                    timeout=timeout,
+                    proxies=proxies)
+            except (exceptions.SpeechToTextException,
+                    requests.exceptions.RequestException):
+                if not rejected_token:
+                    raise
+                access_token = ""
+            if access_token:
+                tokens[api_key] = {"access_token": access_token,
+                                   "secret_hash": secret_hash,
+                                   "expires_at": now + expires_in}
+            if access_token or rejected_token:
+                token_file.seek(0)
+                token_file.truncate()
+                token_file.write(json.dumps(tokens))
+                token_file.flush()
+            return access_token
+        finally:
+            net_utils.unlock_file(token_file)
+
+
+REFRESHED_TOKENS = {}
+# New tokens of the tokens rejected by Baidu in the current process
 
 
 class BaiduASRAPI:  # pylint: disable=too-few-public-methods
@@ -101,16 +209,60 @@ class BaiduASRAPI:  # pylint: disable=too-few-public-methods
                  retries=3,
                  is_keep=False,
                  is_full_result=False,
-                 delete_chars=None):
+                 delete_chars=None,
+                 transcript_cache=None,
+                 retry_policy=None,
+                 credential_pool=None,
+                 api_key=None,
+                 api_secret=None):
         # pylint: disable=too-many-arguments
         self.config = config
         self.api_url = api_url
-        self.retries = retries
         self.is_keep = is_keep
         self.is_full_result = is_full_result
         self.delete_chars = delete_chars
+        self.transcript_cache = transcript_cache
+        self.credential_pool = credential_pool
+        # the api key and secret to request a new token
+        self.api_key = api_key
+        self.api_secret = api_secret
+        if retry_policy:
+            self.retry_policy = retry_policy
+        else:
+            self.retry_policy = net_utils.RetryPolicy(retries=retries)
 
-    def __call__(self, filename):
+    def refresh_token(self,
+                      token,
+                      credential=None):
+        """
+        Give a token rejected by Baidu and its credential,
+        request a new token into the token cache
+        and return whether it is got.
+        """
+        proxies = None
+        if credential:
+            api_key = credential.get("api_key")
+            api_secret = credential.get("api_secret")
+            proxies = net_utils.get_proxies(credential.get("proxy"))
+        else:
+            api_key = self.api_key
+            api_secret = self.api_secret
+        if not api_key or not api_secret:
+            return False
+        # a stalled token request doesn't hold up the worker
+        new_token = get_cached_baidu_token(
+            api_key=api_key,
+            api_secret=api_secret,
+            rejected_token=token,
+            timeout=(self.retry_policy.connect_timeout,
+                     self.retry_policy.read_timeout),
+            proxies=proxies)
+        if not new_token or new_token == token:
+            return False
+        REFRESHED_TOKENS[token] = new_token
+        return True
+
+    def __call__(self, filename):  # pylint: disable=too-many-branches
         try:  # pylint: disable=too-many-nested-blocks
             audio_file = open(filename, mode="rb")
             audio_data = audio_file.read()
@@ -118,16 +270,53 @@ class BaiduASRAPI:  # pylint: disable=too-few-public-methods
             if not self.is_keep:
                 os.remove(filename)
 
-            for _ in range(self.retries):
+            cache_key = None
+            if self.transcript_cache:
+                # the token and the audio itself don't decide the result
+                cache_key = cache_utils.get_cache_key(
+                    audio_data=audio_data,
+                    speech_api="baidu",
+                    context={key: value for key, value in self.config.items()
+                             if key not in ("speech", "len", "token", "cuid")})
+                is_cached, result_dict = self.transcript_cache.get(cache_key)
+                if is_cached:
+                    if not self.is_full_result:
+                        return get_baidu_transcript(result_dict, self.delete_chars)
+                    return result_dict
+
+            # the request bodies of the tokens
+            bodies = {}
+            is_token_refreshed = False
+            for timeout in self.retry_policy.attempts():
                 # Reference: https://github.com/Baidu-AIP/speech-demo/blob/master
                 #            /rest-api-asr/python/asr_json.py
-                self.config["speech"] = base64.b64encode(audio_data).decode('utf-8')
-                self.config["len"] = len(audio_data)
-                config_json = json.dumps(self.config, ensure_ascii=False)
+                credential_index = None
+                credential = None
+                token = self.config.get("token")
+                api_url = self.api_url
+                proxies = None
+                if self.credential_pool:
+                    credential_index, credential = self.credential_pool.acquire()
+                    api_url = credential.get("api_url", self.api_url)
+                    proxies = net_utils.get_proxies(credential.get("proxy"))
+                    token = credential["token"]
+                token = REFRESHED_TOKENS.get(token, token)
+                if token not in bodies:
+                    request_data = dict(self.config)
+                    request_data["token"] = token
+                    request_data["speech"] = net_utils.BASE64_PLACEHOLDER
+                    request_data["len"] = len(audio_data)
+                    bodies[token] = net_utils.encode_json_body(request_data, audio_data)
                 try:
                     requests_result = \
-                        requests.post(self.api_url, data=config_json)
-                except requests.exceptions.ConnectionError:
+                        net_utils.get_http_session().post(
+                            api_url, data=bodies[token], timeout=timeout,
+                            proxies=proxies)
+                except net_utils.RETRYABLE_ERRORS:
+                    net_utils.report_congestion()
+                    continue
+                if net_utils.is_congested_status(requests_result.status_code):
+                    net_utils.report_congestion()
                     continue
                 requests_result_json = requests_result.content.decode("utf-8")
                 try:
@@ -136,6 +325,28 @@ class BaiduASRAPI:  # pylint: disable=too-few-public-methods
                     # no result
                     continue
 
+                if self.credential_pool and isinstance(result_dict, dict) \
+                        and result_dict.get("err_no") in constants.BAIDU_QUOTA_CODES:
+                    # try another credential
+                    self.credential_pool.evict(credential_index)
+                    continue
+
+                if not is_token_refreshed and isinstance(result_dict, dict) \
+                        and result_dict.get("err_no") in constants.BAIDU_TOKEN_CODES:
+                    # request a new token once before failing
+                    is_token_refreshed = True
+                    if self.refresh_token(token, credential):
+                        continue
+
+                if isinstance(result_dict, dict) \
+                        and result_dict.get("err_no") in constants.BAIDU_CONGESTION_CODES:
+                    net_utils.report_congestion()
+                    continue
+
+                if cache_key and isinstance(result_dict, dict) \
+                        and result_dict.get("err_no") == 0:
+                    self.transcript_cache.put(cache_key, result_dict)
+
                 if not self.is_full_result:
                     return get_baidu_transcript(result_dict, self.delete_chars)
                 return result_dict
@@ -5,24 +5,30 @@ Defines Google API used by autosub.
 """
 # Import built-in modules
 import os
-import base64
 import json
+import threading
 
 # Import third-party modules
-import requests
-
 # Any changes to the path and your own modules
 from autosub import exceptions
 from autosub import constants
+from autosub import net_utils
+from autosub import cache_utils
 
 if constants.IS_GOOGLECLOUDCLIENT:
     from google.cloud import speech_v1p1beta1
     from google.protobuf.json_format import MessageToDict
     from google.cloud.speech_v1p1beta1 import enums
+    from google.api_core import exceptions as google_exceptions
+    RETRYABLE_GRPC_ERRORS = (google_exceptions.ServiceUnavailable,
+                             google_exceptions.DeadlineExceeded,
+                             google_exceptions.ResourceExhausted,
+                             google_exceptions.InternalServerError)
 else:
     speech_v1p1beta1 = None  # pylint: disable=invalid-name
     MessageToDict = None  # pylint: disable=invalid-name
     enums = None  # pylint: disable=invalid-name
+    RETRYABLE_GRPC_ERRORS = ()
 
 
 def google_ext_to_enc(
@@ -190,14 +196,22 @@ class GoogleSpeechV2:  # pylint: disable=too-few-public-methods
                  min_confidence=0.0,
                  retries=3,
                  is_keep=False,
-                 is_full_result=False):
+                 is_full_result=False,
+                 transcript_cache=None,
+                 retry_policy=None,
+                 credential_pool=None):
         # pylint: disable=too-many-arguments
         self.min_confidence = min_confidence
-        self.retries = retries
         self.api_url = api_url
         self.is_keep = is_keep
         self.headers = headers
         self.is_full_result = is_full_result
+        self.transcript_cache = transcript_cache
+        self.credential_pool = credential_pool
+        if retry_policy:
+            self.retry_policy = retry_policy
+        else:
+            self.retry_policy = net_utils.RetryPolicy(retries=retries)
 
     def __call__(self, filename):
         try:  # pylint: disable=too-many-nested-blocks
@@ -206,15 +220,48 @@ class GoogleSpeechV2:  # pylint: disable=too-few-public-methods
             audio_file.close()
             if not self.is_keep:
                 os.remove(filename)
-            for _ in range(self.retries):
+
+            cache_key = None
+            if self.transcript_cache:
+                cache_key = cache_utils.get_cache_key(
+                    audio_data=audio_data,
+                    speech_api="gsv2",
+                    context=[cache_utils.strip_url_key(self.api_url), self.headers],
+                    min_confidence=self.min_confidence)
+                is_cached, line_dict = self.transcript_cache.get(cache_key)
+                if is_cached:
+                    return self.get_result(line_dict)
+
+            for timeout in self.retry_policy.attempts():
+                credential_index = None
+                api_url = self.api_url
+                proxies = None
+                if self.credential_pool:
+                    credential_index, credential = self.credential_pool.acquire()
+                    api_url = credential.get("api_url", self.api_url)
+                    proxies = net_utils.get_proxies(credential.get("proxy"))
                 try:
-                    result = requests.post(self.api_url, data=audio_data, headers=self.headers)
-                except requests.exceptions.ConnectionError:
+                    result = net_utils.get_http_session().post(
+                        api_url, data=audio_data, headers=self.headers,
+                        timeout=timeout, proxies=proxies)
+                except net_utils.RETRYABLE_ERRORS:
+                    net_utils.report_congestion()
+                    continue
+
+                if self.credential_pool \
+                        and net_utils.is_quota_status(result.status_code):
+                    # try another credential
+                    self.credential_pool.evict(credential_index)
+                    continue
+
+                if net_utils.is_congested_status(result.status_code):
+                    net_utils.report_congestion()
                     continue
 
                 # receive several results delimited by LF
                 result_list = result.content.decode('utf-8').split("\n")
                 # get the one with valid content
+                valid_dict = None
                 for line in result_list:
                     try:
                         line_dict = json.loads(line)
@@ -223,29 +270,65 @@ class GoogleSpeechV2:  # pylint: disable=too-few-public-methods
                             line_dict)
                         if transcript:
                             # make sure it is the valid transcript
-                            if not self.is_full_result:
-                                return transcript
-                            return line_dict
+                            valid_dict = line_dict
+                            break
 
                     except (ValueError, IndexError):
                         # no result
                         continue
 
+                if cache_key and result.status_code == 200 and valid_dict:
+                    self.transcript_cache.put(cache_key, valid_dict)
                 # Every line of the result can't be loaded to json
-                return None
+                # if there's no valid dict
+                return self.get_result(valid_dict)
 
         except KeyboardInterrupt:
             return None
 
         return None
 
+    def get_result(self, line_dict):
+        """
+        Give the valid line of the result
+        and return the transcript or the full result.
+        """
+        if not line_dict:
+            return None
+        if not self.is_full_result:
+            return get_google_speech_v2_transcript(
+                self.min_confidence,
+                line_dict)
+        return line_dict
+
+
+SPEECH_CLIENT = {"lock": threading.Lock()}
+# Google Cloud speech-to-text client of the current process
+
+
+def get_speech_client():
+    """
+    Return the Google Cloud speech-to-text client of the current process.
+    The client is created in the process using it
+    instead of being pickled to it, and its grpc channel
+    is reused by every fragment the process recognizes.
+    """
+    with SPEECH_CLIENT["lock"]:
+        # a grpc channel can't be shared across fork
+        if SPEECH_CLIENT.get("pid") != os.getpid():
+            SPEECH_CLIENT["client"] = speech_v1p1beta1.SpeechClient()
+            SPEECH_CLIENT["pid"] = os.getpid()
+        return SPEECH_CLIENT["client"]
+
 
 def gcsv1p1beta1_service_client(
         filename,
         is_keep,
         config,
         min_confidence,
-        is_full_result=False):
+        is_full_result=False,
+        transcript_cache=None,
+        retry_policy=None):
     """
     Function for performing Speech-to-Text
     using Google Cloud Speech-to-Text V1P1Beta1 API client for an input FLAC file.
@@ -257,15 +340,41 @@ def gcsv1p1beta1_service_client(
         if not is_keep:
             os.remove(filename)
 
+        cache_key = None
+        if transcript_cache:
+            cache_key = cache_utils.get_cache_key(
+                audio_data=audio_data,
+                speech_api="gcsv1",
+                context=config,
+                min_confidence=min_confidence)
+            is_cached, result_dict = transcript_cache.get(cache_key)
+            if is_cached:
+                if not is_full_result:
+                    return get_gcsv1p1beta1_transcript(min_confidence, result_dict)
+                return result_dict
+
         # https://cloud.google.com/speech-to-text/docs/quickstart-client-libraries
         # https://cloud.google.com/speech-to-text/docs/basics
         # https://cloud.google.com/speech-to-text/docs/reference/rpc/google.cloud.speech.v1p1beta1#google.cloud.speech.v1p1beta1.SpeechRecognitionResult
-        client = speech_v1p1beta1.SpeechClient()
+        client = get_speech_client()
         audio_dict = {"content": audio_data}
-        recognize_response = client.recognize(config, audio_dict)
+        if not retry_policy:
+            retry_policy = net_utils.RetryPolicy()
+        recognize_response = None
+        for timeout in retry_policy.attempts():
+            try:
+                recognize_response = client.recognize(
+                    config, audio_dict, timeout=timeout[1])
+                break
+            except RETRYABLE_GRPC_ERRORS:
+                net_utils.report_congestion()
+        if recognize_response is None:
+            return None
         result_dict = MessageToDict(
             recognize_response,
             preserving_proto_field_name=True)
+        if cache_key:
+            transcript_cache.put(cache_key, result_dict)
 
         if not is_full_result:
             return get_gcsv1p1beta1_transcript(min_confidence, result_dict)
@@ -287,15 +396,23 @@ class GCSV1P1Beta1URL:  # pylint: disable=too-few-public-methods, duplicate-code
                  min_confidence=0.0,
                  retries=3,
                  is_keep=False,
-                 is_full_result=False):
+                 is_full_result=False,
+                 transcript_cache=None,
+                 retry_policy=None,
+                 credential_pool=None):
         # pylint: disable=too-many-arguments
         self.config = config
         self.api_url = api_url
         self.headers = headers
         self.min_confidence = min_confidence
-        self.retries = retries
         self.is_keep = is_keep
         self.is_full_result = is_full_result
+        self.transcript_cache = transcript_cache
+        self.credential_pool = credential_pool
+        if retry_policy:
+            self.retry_policy = retry_policy
+        else:
+            self.retry_policy = net_utils.RetryPolicy(retries=retries)
 
     def __call__(self, filename):
         try:  # pylint: disable=too-many-nested-blocks
@@ -305,20 +422,53 @@ class GCSV1P1Beta1URL:  # pylint: disable=too-few-public-methods, duplicate-code
             if not self.is_keep:
                 os.remove(filename)
 
-            for _ in range(self.retries):
-                # https://cloud.google.com/speech-to-text/docs/quickstart-protocol
-                # https://cloud.google.com/speech-to-text/docs/base64-encoding
-                # https://gist.github.com/bretmcg/07e0efe27611d7039c2e4051b4354908
-                audio_dict = \
-                    {"content": base64.b64encode(audio_data).decode("utf-8")}
-                request_data = {"config": self.config, "audio": audio_dict}
-                config_json = json.dumps(request_data, ensure_ascii=False)
+            cache_key = None
+            if self.transcript_cache:
+                cache_key = cache_utils.get_cache_key(
+                    audio_data=audio_data,
+                    speech_api="gcsv1",
+                    context=[cache_utils.strip_url_key(self.api_url), self.config],
+                    min_confidence=self.min_confidence)
+                is_cached, result_dict = self.transcript_cache.get(cache_key)
+                if is_cached:
+                    if not self.is_full_result:
+                        return get_gcsv1p1beta1_transcript(self.min_confidence, result_dict)
+                    return result_dict
+
+            # https://cloud.google.com/speech-to-text/docs/quickstart-protocol
+            # https://cloud.google.com/speech-to-text/docs/base64-encoding
+            # https://gist.github.com/bretmcg/07e0efe27611d7039c2e4051b4354908
+            audio_dict = {"content": net_utils.BASE64_PLACEHOLDER}
+            request_data = {"config": self.config, "audio": audio_dict}
+            # built once and posted again on every retry
+            request_body = net_utils.encode_json_body(request_data, audio_data)
+            for timeout in self.retry_policy.attempts():
+                credential_index = None
+                api_url = self.api_url
+                proxies = None
+                if self.credential_pool:
+                    credential_index, credential = self.credential_pool.acquire()
+                    api_url = credential.get("api_url", self.api_url)
+                    proxies = net_utils.get_proxies(credential.get("proxy"))
 
                 try:
                     requests_result = \
-                        requests.post(self.api_url, data=config_json, headers=self.headers)
+                        net_utils.get_http_session().post(
+                            api_url, data=request_body, headers=self.headers,
+                            timeout=timeout, proxies=proxies)
+
+                except net_utils.RETRYABLE_ERRORS:
+                    net_utils.report_congestion()
+                    continue
 
-                except requests.exceptions.ConnectionError:
+                if self.credential_pool \
+                        and net_utils.is_quota_status(requests_result.status_code):
+                    # try another credential
+                    self.credential_pool.evict(credential_index)
+                    continue
+
+                if net_utils.is_congested_status(requests_result.status_code):
+                    net_utils.report_congestion()
                     continue
 
                 requests_result_json = requests_result.content.decode('utf-8')
@@ -329,6 +479,10 @@ class GCSV1P1Beta1URL:  # pylint: disable=too-few-public-methods, duplicate-code
                     # no result
                     continue
 
+                if cache_key and requests_result.status_code == 200 \
+                        and "error" not in result_dict:
+                    self.transcript_cache.put(cache_key, result_dict)
+
                 if not self.is_full_result:
                     return get_gcsv1p1beta1_transcript(self.min_confidence, result_dict)
                 return result_dict
@@ -4,12 +4,14 @@
 Defines Xun Fei Yun API used by autosub.
 """
 # Import built-in modules
+import copy
 import datetime
 import hashlib
 import base64
 import hmac
 import json
-from urllib.parse import urlencode
+import asyncio
+from urllib.parse import urlencode, urlsplit
 import ssl
 from email.utils import formatdate
 import time
@@ -23,6 +25,8 @@ import _thread
 # Any changes to the path and your own modules
 from autosub import constants
 from autosub import exceptions
+from autosub import cache_utils
+from autosub import net_utils
 
 
 def create_xfyun_url(
@@ -89,7 +93,7 @@ def get_xfyun_transcript(
         return ""
 
 
-class XfyunWebSocketAPI:  # pylint: disable=too-many-instance-attributes, too-many-arguments, unnecessary-lambda
+class XfyunWebSocketAPI:  # pylint: disable=too-many-instance-attributes, too-many-arguments
     """
     Class for performing speech-to-text using Xun Fei Yun Speech-to-Text Websocket API.
     Reference: https://www.xfyun.cn/doc/asr/voicedictation/API.html
@@ -103,7 +107,13 @@ class XfyunWebSocketAPI:  # pylint: disable=too-many-instance-attributes, too-ma
                  api_address,
                  business_args,
                  is_full_result=False,
-                 delete_chars=None):
+                 delete_chars=None,
+                 transcript_cache=None,
+                 retry_policy=None,
+                 credential_pool=None,
+                 frame_size=constants.XFYUN_FRAME_SIZE,
+                 send_interval=constants.XFYUN_SEND_INTERVAL,
+                 is_async=False):
         self.common_args = {"app_id": app_id}
         self.api_key = api_key
         self.api_secret = api_secret
@@ -118,31 +128,279 @@ class XfyunWebSocketAPI:  # pylint: disable=too-many-instance-attributes, too-ma
         self.transcript = ""
         self.result_list = []
         self.filename = None
-        self.web_socket_app = None
+        self.transcript_cache = transcript_cache
+        if retry_policy:
+            self.retry_policy = retry_policy
+        else:
+            self.retry_policy = net_utils.RetryPolicy()
+        self.credential_pool = credential_pool
+        self.frame_size = frame_size
+        # 0 means sending the frames as fast as the service accepts them
+        self.send_interval = send_interval
+        # run the sessions as coroutines in the event loop of the speech pool
+        self.is_async = is_async and constants.websockets_ is not None
+        self.is_failed = False
+        self.is_quota_error = False
 
-    def __call__(self, filename):
+    def get_cache_key(self, filename):
+        """
+        Give an audio fragment and return its cache key
+        or None if there's no transcript cache.
+        """
+        if not self.transcript_cache:
+            return None
+        with open(filename, "rb") as audio_file:
+            return cache_utils.get_cache_key(
+                audio_data=audio_file.read(),
+                speech_api="xfyun",
+                context=[self.api_address, self.business_args])
+
+    def get_result(self, result_list):
+        """
+        Give the results of a session
+        and return them or their transcript.
+        """
         if self.is_full_result:
-            self.result_list = []
-        else:
-            self.transcript = ""
+            return result_list
+        transcript = ""
+        for result_dict in result_list:
+            if result_dict.get("code") == 0:
+                transcript = transcript + get_xfyun_transcript(
+                    result_dict=result_dict,
+                    delete_chars=self.delete_chars)
+        return transcript
+
+    def get_credential(self):
+        """
+        Return the credential of the recognizer itself.
+        """
+        return {"app_id": self.common_args["app_id"],
+                "api_key": self.api_key,
+                "api_secret": self.api_secret,
+                "api_address": self.api_address}
+
+    def get_frames(self,
+                   filename,
+                   common_args):
+        """
+        Give an audio fragment and the common args
+        and yield the json frames to send.
+        """
+        data = dict(self.data)
+        status = 0  # 音频的状态信息，标识音频是第一帧，还是中间帧、最后一帧
+        with open(filename, "rb") as audio_file:
+            while True:
+                buf = audio_file.read(self.frame_size)
+                # 文件结束
+                if not buf:
+                    status = 2
+                data["audio"] = str(base64.b64encode(buf), "utf-8")
+                # 第一帧处理
+                # 发送第一帧音频，带business 参数
+                # appid 必须带上，只需第一帧发送
+                if status == 0:
+                    data["status"] = 0
+                    web_socket_data = {
+                        "common": common_args,
+                        "business": self.business_args,
+                        "data": data}
+                    status = 1
+                # 中间帧处理
+                elif status == 1:
+                    data["status"] = 1
+                    web_socket_data = {"data": data}
+                # 最后一帧处理
+                else:
+                    data["status"] = 2
+                    yield json.dumps({"data": data})
+                    # the socket is closed by the last result
+                    return
+                yield json.dumps(web_socket_data)
+
+    def __call__(self, filename):
+        # the callbacks keep the session in the recognizer
+        # so every call runs on its own shallow copy
+        return copy.copy(self).recognize(filename)
+
+    def recognize(self, filename):
+        """
+        Give an audio fragment and return its result
+        by the WebSocket sessions of the websocket app.
+        """
+        self.result_list = []
+        self.transcript = ""
         self.filename = filename
+        cache_key = self.get_cache_key(filename)
+        if cache_key:
+            is_cached, result_list = self.transcript_cache.get(cache_key)
+            if is_cached:
+                return self.get_result(result_list)
         websocket.enableTrace(False)
-        # Ref: https://stackoverflow.com/questions/26980966
-        # /using-a-websocket-client-as-a-class-in-python
-        self.web_socket_app = websocket.WebSocketApp(
-            create_xfyun_url(
-                api_key=self.api_key,
-                api_secret=self.api_secret,
-                api_address=self.api_address),
-            on_message=lambda web_socket, msg: self.on_message(web_socket, msg),
-            on_error=lambda web_socket, msg: self.on_error(web_socket, msg),
-            on_close=lambda web_socket: self.on_close(web_socket),
-            on_open=lambda web_socket: self.on_open(web_socket))
-        self.web_socket_app.run_forever(sslopt={"cert_reqs": ssl.CERT_NONE})
+        for timeout in self.retry_policy.attempts():
+            self.result_list = []
+            self.transcript = ""
+            self.is_failed = False
+            self.is_quota_error = False
+            credential = self.get_credential()
+            credential_index = None
+            if self.credential_pool:
+                credential_index, credential = self.credential_pool.acquire()
+                self.common_args = {"app_id": credential["app_id"]}
+            proxy_args = {}
+            if credential.get("proxy"):
+                proxy = urlsplit(credential["proxy"])
+                proxy_args = {"http_proxy_host": proxy.hostname,
+                              "http_proxy_port": proxy.port}
+            try:
+                web_socket = websocket.create_connection(
+                    create_xfyun_url(
+                        api_key=credential["api_key"],
+                        api_secret=credential["api_secret"],
+                        api_address=credential.get("api_address", self.api_address)),
+                    timeout=timeout[0],
+                    sslopt={"cert_reqs": ssl.CERT_NONE},
+                    **proxy_args)
+            except (websocket.WebSocketException, OSError) as error:
+                self.on_error(None, error)
+                continue
+            # the timeouts are set per connection
+            # because the threads share the default one
+            web_socket.settimeout(timeout[1])
+            self.on_open(web_socket)
+            try:
+                while web_socket.connected:
+                    result = web_socket.recv()
+                    if not result:
+                        break
+                    self.on_message(web_socket, result)
+            except (websocket.WebSocketException, OSError) as error:
+                self.on_error(web_socket, error)
+            finally:
+                web_socket.close()
+            if self.credential_pool and self.is_quota_error:
+                # try another credential
+                self.credential_pool.evict(credential_index)
+                continue
+            if not self.is_failed:
+                break
+        if cache_key and self.result_list \
+                and all(item.get("code") == 0 for item in self.result_list):
+            self.transcript_cache.put(cache_key, self.result_list)
         if self.is_full_result:
             return self.result_list
         return self.transcript
 
+    async def call_async(self,
+                         filename,
+                         feedback=None):
+        """
+        Give an audio fragment and return its result like calling the recognizer
+        but run the WebSocket session as a coroutine in the running event loop.
+        Nothing of the session is kept in the recognizer
+        so one recognizer serves all the concurrent sessions.
+        """
+        cache_key = self.get_cache_key(filename)
+        if cache_key:
+            is_cached, result_list = self.transcript_cache.get(cache_key)
+            if is_cached:
+                return self.get_result(result_list)
+        result_list = []
+        async for timeout in self.retry_policy.attempts_async():
+            credential = self.get_credential()
+            credential_index = None
+            if self.credential_pool:
+                credential_index, credential = \
+                    await self.credential_pool.acquire_async()
+            result_list, is_failed, is_quota_error = await self.recognize_async(
+                filename=filename,
+                credential=credential,
+                timeout=timeout,
+                feedback=feedback)
+            if self.credential_pool and is_quota_error:
+                # try another credential
+                self.credential_pool.evict(credential_index)
+                continue
+            if not is_failed:
+                break
+        if cache_key and result_list \
+                and all(item.get("code") == 0 for item in result_list):
+            self.transcript_cache.put(cache_key, result_list)
+        return self.get_result(result_list)
+
+    async def recognize_async(  # pylint: disable=too-many-locals
+            self,
+            filename,
+            credential,
+            timeout,
+            feedback=None):
+        """
+        Give an audio fragment, a credential and the (connect, read) timeouts,
+        run a WebSocket session and return its results,
+        whether it failed and whether it met a quota error.
+        """
+        web_socket_errors = (OSError,
+                             asyncio.TimeoutError,
+                             constants.websockets_.WebSocketException)
+        ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+        ssl_context.check_hostname = False
+        ssl_context.verify_mode = ssl.CERT_NONE
+        try:
+            web_socket = await asyncio.wait_for(
+                constants.websockets_.connect(
+                    create_xfyun_url(
+                        api_key=credential["api_key"],
+                        api_secret=credential["api_secret"],
+                        api_address=credential.get("api_address", self.api_address)),
+                    ssl=ssl_context,
+                    max_size=None),
+                timeout[0])
+        except web_socket_errors:
+            net_utils.report_congestion(feedback)
+            return [], True, False
+
+        async def send():
+            for index, web_socket_json in enumerate(self.get_frames(
+                    filename, {"app_id": credential["app_id"]})):
+                if index and self.send_interval:
+                    await asyncio.sleep(self.send_interval)
+                try:
+                    await web_socket.send(web_socket_json)
+                except web_socket_errors:
+                    # closed by an error result
+                    return
+
+        result_list = []
+        is_failed = False
+        is_quota_error = False
+        sender = asyncio.ensure_future(send())
+        try:
+            while True:
+                try:
+                    web_socket_result = json.loads(
+                        await asyncio.wait_for(web_socket.recv(), timeout[1]))
+                except ValueError:
+                    continue
+                if not isinstance(web_socket_result, dict):
+                    continue
+                result_list.append(web_socket_result)
+                code = web_socket_result.get("code")
+                if code in constants.XFYUN_CONGESTION_CODES:
+                    net_utils.report_congestion(feedback)
+                    is_failed = True
+                if code in constants.XFYUN_QUOTA_CODES:
+                    is_quota_error = True
+                if code != 0 \
+                        or (web_socket_result.get("data") or {}).get("status") == 2:
+                    # no more results after an error or the last result
+                    break
+        except web_socket_errors:
+            net_utils.report_congestion(feedback)
+            is_failed = True
+        finally:
+            sender.cancel()
+            await web_socket.close()
+        return result_list, is_failed, is_quota_error
+
     def on_message(self, web_socket, result):  # pylint: disable=unused-argument
         """
         Process the message received from WebSocket.
@@ -151,69 +409,49 @@ class XfyunWebSocketAPI:  # pylint: disable=too-many-instance-attributes, too-ma
             web_socket_result = json.loads(result)
         except ValueError:
             return
+        if isinstance(web_socket_result, dict) \
+                and web_socket_result.get("code") in constants.XFYUN_CONGESTION_CODES:
+            net_utils.report_congestion()
+            self.is_failed = True
+        if isinstance(web_socket_result, dict) \
+                and web_socket_result.get("code") in constants.XFYUN_QUOTA_CODES:
+            self.is_quota_error = True
         if not self.is_full_result:
             self.transcript = self.transcript + \
                               get_xfyun_transcript(
                                   result_dict=web_socket_result,
                                   delete_chars=self.delete_chars)
-        else:
+        if self.is_full_result or self.transcript_cache:
             self.result_list.append(web_socket_result)
+        if not isinstance(web_socket_result, dict):
+            return
+        if web_socket_result.get("code") != 0 \
+                or (web_socket_result.get("data") or {}).get("status") == 2:
+            # no more results after an error or the last result
+            web_socket.close()
 
-    def on_error(self, web_socket, error):  # pylint: disable=no-self-use
+    def on_error(self, web_socket, error):  # pylint: disable=unused-argument
         """
         Process the error from WebSocket.
         """
-        raise exceptions.SpeechToTextException(error)
-
-    def on_close(self, web_socket):  # pylint: disable=no-self-use, unused-argument
-        """
-        Process the connection close from WebSocket.
-        """
-        return
+        net_utils.report_congestion()
+        self.is_failed = True
 
     def on_open(self, web_socket):
         """
         Process the connection open from WebSocket.
         """
         def run():
-            frame_size = 8000  # 每一帧的音频大小
-            interval = 0.04  # 发送音频间隔(单位:s)
-            status = 0  # 音频的状态信息，标识音频是第一帧，还是中间帧、最后一帧
-            with open(self.filename, "rb") as audio_file:
-                while True:
-                    buf = audio_file.read(frame_size)
-                    # 文件结束
-                    if not buf:
-                        status = 2
-                    self.data["audio"] = str(base64.b64encode(buf), "utf-8")
-                    # 第一帧处理
-                    # 发送第一帧音频，带business 参数
-                    # appid 必须带上，只需第一帧发送
-                    if status == 0:
-                        self.data["status"] = 0
-                        web_socket_data = {
-                            "common": self.common_args,
-                            "business": self.business_args,
-                            "data": self.data}
-                        status = 1
-                    # 中间帧处理
-                    elif status == 1:
-                        self.data["status"] = 1
-                        web_socket_data = {"data": self.data}
-                    # 最后一帧处理
-                    elif status == 2:
-                        self.data["status"] = 2
-                        web_socket_data = {"data": self.data}
-                        web_socket_json = json.dumps(web_socket_data)
-                        web_socket.send(web_socket_json)
-                        time.sleep(1)
-                        break
-
-                    web_socket_json = json.dumps(web_socket_data)
+            for index, web_socket_json in enumerate(self.get_frames(
+                    self.filename, self.common_args)):
+                # 模拟音频采样间隔
+                if index and self.send_interval:
+                    time.sleep(self.send_interval)
+                try:
                     web_socket.send(web_socket_json)
-                    # 模拟音频采样间隔
-                    time.sleep(interval)
-            web_socket.close()
+                except websocket.WebSocketException:
+                    # closed by an error result
+                    break
         _thread.start_new_thread(run, ())
 
 
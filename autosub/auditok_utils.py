@@ -5,6 +5,9 @@ Defines utils used by auditok.
 """
 
 # Import built-in modules
+import queue
+import threading
+import wave
 
 # Import third-party modules
 import auditok
@@ -14,6 +17,61 @@ import pysubs2
 from autosub import constants
 
 
+def is_pcm_buffer(audio_wav):
+    """
+    Check whether audio_wav is an in-memory pcm buffer instead of a file path.
+    """
+    return isinstance(audio_wav, (bytes, bytearray))
+
+
+def get_audio_source(
+        audio_wav,
+        record=True):
+    """
+    Give an audio file path or an in-memory pcm buffer
+    and return an auditok audio data source.
+    """
+    if is_pcm_buffer(audio_wav):
+        # raw pcm decoded by ffmpeg through the stdout pipe
+        return auditok.ADSFactory.ads(
+            data_buffer=audio_wav,
+            sampling_rate=constants.AUDITOK_SAMPLE_RATE,
+            sample_width=constants.AUDITOK_SAMPLE_WIDTH,
+            channels=constants.AUDITOK_CHANNEL,
+            record=record)
+    return auditok.ADSFactory.ads(
+        filename=audio_wav, record=record)
+
+
+def get_audio_length(audio_wav):
+    """
+    Give an audio file path or an in-memory pcm buffer
+    and return its length in milliseconds.
+    """
+    if is_pcm_buffer(audio_wav):
+        frame_size = constants.AUDITOK_SAMPLE_WIDTH * constants.AUDITOK_CHANNEL
+        return len(audio_wav) // frame_size * 1000 // constants.AUDITOK_SAMPLE_RATE
+    reader = wave.open(audio_wav)
+    audio_length = int(float(reader.getnframes()) / float(reader.getframerate())) * 1000
+    reader.close()
+    return audio_length
+
+
+def pcm_buffer_to_wav(
+        audio_buffer,
+        audio_wav):
+    """
+    Write an in-memory pcm buffer to a wav file.
+    """
+    writer = wave.open(audio_wav, "wb")
+    writer.setnchannels(constants.AUDITOK_CHANNEL)
+    writer.setsampwidth(constants.AUDITOK_SAMPLE_WIDTH)
+    writer.setframerate(constants.AUDITOK_SAMPLE_RATE)
+    writer.writeframes(audio_buffer)
+    writer.close()
+    return audio_wav
+
+
 def auditok_gen_speech_regions(  # pylint: disable=too-many-arguments
         audio_wav,
         energy_threshold=constants.DEFAULT_ENERGY_THRESHOLD,
@@ -25,8 +83,8 @@ def auditok_gen_speech_regions(  # pylint: disable=too-many-arguments
     """
     Give an input audio/video file, generate proper speech regions.
     """
-    asource = auditok.ADSFactory.ads(
-        filename=audio_wav, record=True)
+    asource = get_audio_source(
+        audio_wav, record=not is_pcm_buffer(audio_wav))
     validator = auditok.AudioEnergyValidator(
         sample_width=asource.get_sample_width(),
         energy_threshold=energy_threshold)
@@ -57,6 +115,55 @@ def auditok_gen_speech_regions(  # pylint: disable=too-many-arguments
     return regions
 
 
+def auditok_iter_speech_regions(  # pylint: disable=too-many-arguments
+        audio_wav,
+        energy_threshold=constants.DEFAULT_ENERGY_THRESHOLD,
+        min_region_size=constants.DEFAULT_MIN_REGION_SIZE,
+        max_region_size=constants.DEFAULT_MAX_REGION_SIZE,
+        max_continuous_silence=constants.DEFAULT_CONTINUOUS_SILENCE,
+        mode=auditok.StreamTokenizer.STRICT_MIN_LENGTH,
+        queue_size=constants.DEFAULT_STREAM_QUEUE_SIZE):
+    """
+    Give an input audio/video file and yield speech regions
+    as soon as the tokenizer detects them.
+    """
+    region_queue = queue.Queue(maxsize=queue_size)
+
+    def tokenize():
+        try:
+            asource = get_audio_source(audio_wav, record=False)
+            validator = auditok.AudioEnergyValidator(
+                sample_width=asource.get_sample_width(),
+                energy_threshold=energy_threshold)
+            asource.open()
+            tokenizer = auditok.StreamTokenizer(
+                validator=validator,
+                min_length=int(min_region_size * 100),
+                max_length=int(max_region_size * 100),
+                max_continuous_silence=int(max_continuous_silence * 100),
+                mode=mode)
+            tokenizer.tokenize(
+                asource,
+                callback=lambda data, start, end: region_queue.put((start * 10, end * 10)))
+            asource.close()
+        except Exception as error:  # pylint: disable=broad-except
+            # forward the error to the consumer
+            region_queue.put(error)
+        region_queue.put(None)
+
+    thread = threading.Thread(target=tokenize)
+    thread.daemon = True
+    thread.start()
+
+    while True:
+        region = region_queue.get()
+        if region is None:
+            break
+        if isinstance(region, Exception):
+            raise region
+        yield region
+
+
 def validate_atrim_config(
         trim_dict,
         args=None):
@@ -221,6 +328,20 @@ def auditok_gen_stats_regions(
 
     # auditok.StreamTokenizer.DROP_TRAILING_SILENCE
     tokens = tokenizer.tokenize(asource)
+    # reference
+    # auditok.readthedocs.io/en/latest/apitutorial.html#examples-using-real-audio-data
+    return set_stats_regions(
+        auditok_stats,
+        [(token[1], token[2]) for token in tokens])
+
+
+def set_stats_regions(
+        auditok_stats,
+        tokens):
+    """
+    Give an AuditokSTATS and tokens as (start, end) frame indexes
+    and return the AuditokSTATS with regions.
+    """
     max_region_size = int(auditok_stats.mxrs * 1000)
     small_region_size = max_region_size >> 3
     big_region_size = max_region_size - (max_region_size >> 2)
@@ -228,9 +349,9 @@ def auditok_gen_stats_regions(
     for token in tokens:
         # get start and end times
         auditok_stats.events.append(pysubs2.SSAEvent(
-            start=token[1] * 10,
-            end=token[2] * 10))
-        dura = (token[2] - token[1]) * 10
+            start=token[0] * 10,
+            end=token[1] * 10))
+        dura = (token[1] - token[0]) * 10
         total_region_size = total_region_size + dura
         if dura <= small_region_size:
             auditok_stats.small_region_count = auditok_stats.small_region_count + 1
@@ -238,6 +359,4 @@ def auditok_gen_stats_regions(
             auditok_stats.big_region_count = auditok_stats.big_region_count + 1
     average_region_size = total_region_size / len(auditok_stats.events)
     auditok_stats.delta_region_size = abs(average_region_size - (max_region_size >> 1))
-    # reference
-    # auditok.readthedocs.io/en/latest/apitutorial.html#examples-using-real-audio-data
     return auditok_stats
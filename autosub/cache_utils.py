@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Defines the persistent transcript cache used by the speech-to-text api clients.
+"""
+# Import built-in modules
+import os
+import json
+import time
+import uuid
+import hashlib
+import sqlite3
+import threading
+import multiprocessing.util
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+# Any changes to the path and your own modules
+from autosub import constants
+
+CACHE_CONNECTION = threading.local()
+# Sqlite connections of the current thread
+
+CACHE_PENDING = {}
+# Lookups of the current process not written to the cache yet
+
+CACHE_FLUSH_SIZE = 64
+CACHE_FLUSH_INTERVAL = 1.0
+# Lookups and seconds after which the pending lookups are written
+
+
+def get_cache_key(
+        audio_data,
+        speech_api,
+        context,
+        min_confidence=0.0):
+    """
+    Give the bytes of an audio fragment and the request context
+    and return the key of its speech-to-text result.
+    """
+    context_json = json.dumps(
+        [speech_api, context, min_confidence],
+        sort_keys=True,
+        ensure_ascii=False)
+    key = hashlib.sha256(audio_data)
+    key.update(context_json.encode("utf-8"))
+    return key.hexdigest()
+
+
+def strip_url_key(url):
+    """
+    Give an api url and return it without the api key in its query.
+    """
+    parts = urlsplit(url)
+    query = [(name, value) for name, value in parse_qsl(parts.query)
+             if name != "key"]
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+class TranscriptCache:
+    """
+    Class for caching the speech-to-text results in a sqlite database.
+    Only the path is pickled to the worker processes
+    and every process or thread opens its own connection.
+    A lookup only reads the database
+    and its count and access time are written in batches.
+    A worker process writes its last batch when it exits,
+    so the batch is lost if the pool is terminated
+    by Ctrl-C or an error. Only the hit and miss counts and the access times
+    used to evict the results are lost, never the results themselves.
+    """
+    def __init__(self,
+                 cache_file,
+                 max_size=constants.DEFAULT_TRANSCRIPT_CACHE_SIZE,
+                 run_id=None):
+        self.cache_file = cache_file
+        self.max_size = max_size
+        if run_id:
+            self.run_id = run_id
+        else:
+            self.run_id = uuid.uuid4().hex
+        cache_dir = os.path.dirname(cache_file)
+        if cache_dir and not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        connection = self.get_connection()
+        with connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS transcripts ("
+                "key TEXT PRIMARY KEY, result TEXT, "
+                "size INTEGER, accessed REAL)")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS counters ("
+                "run_id TEXT PRIMARY KEY, hits INTEGER, misses INTEGER)")
+            connection.execute(
+                "INSERT OR IGNORE INTO counters VALUES (?, 0, 0)",
+                (self.run_id,))
+
+    def get_connection(self):
+        """
+        Return the sqlite connection of the current process and thread.
+        """
+        connections = getattr(CACHE_CONNECTION, "connections", None)
+        if connections is None or CACHE_CONNECTION.pid != os.getpid():
+            # a connection can't be shared across fork
+            connections = {}
+            CACHE_CONNECTION.connections = connections
+            CACHE_CONNECTION.pid = os.getpid()
+        if self.cache_file not in connections:
+            connection = sqlite3.connect(self.cache_file, timeout=60)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connections[self.cache_file] = connection
+        return connections[self.cache_file]
+
+    def get_pending_lock(self):
+        """
+        Return the lock of the pending lookups of the current process.
+        """
+        if CACHE_PENDING.get("pid") != os.getpid():
+            # the lookups inherited through fork are the parent's
+            CACHE_PENDING.clear()
+            CACHE_PENDING["lock"] = threading.Lock()
+            CACHE_PENDING["flushed"] = set()
+            CACHE_PENDING["pid"] = os.getpid()
+        if (self.cache_file, self.run_id) not in CACHE_PENDING["flushed"]:
+            # a worker process writes its last lookups when it exits
+            CACHE_PENDING["flushed"].add((self.cache_file, self.run_id))
+            multiprocessing.util.Finalize(None, self.flush, exitpriority=10)
+        return CACHE_PENDING["lock"]
+
+    def pop_pending(self):
+        """
+        Remove the pending lookups of the current process and return them.
+        """
+        with self.get_pending_lock():
+            return CACHE_PENDING.pop(
+                (self.cache_file, self.run_id),
+                {"hits": 0, "misses": 0, "accessed": {}})
+
+    def write_pending(self, connection):
+        """
+        Give a connection in a transaction
+        and write the pending lookups of the current process.
+        """
+        pending = self.pop_pending()
+        if pending["accessed"]:
+            connection.executemany(
+                "UPDATE transcripts SET accessed = ? WHERE key = ?",
+                [(accessed, key) for key, accessed in pending["accessed"].items()])
+        if pending["hits"] or pending["misses"]:
+            connection.execute(
+                "UPDATE counters SET hits = hits + ?, misses = misses + ? "
+                "WHERE run_id = ?",
+                (pending["hits"], pending["misses"], self.run_id))
+
+    def flush(self):
+        """
+        Write the pending lookups of the current process.
+        """
+        if (self.cache_file, self.run_id) not in CACHE_PENDING:
+            return
+        connection = self.get_connection()
+        with connection:
+            self.write_pending(connection)
+
+    def get(self, key):
+        """
+        Give a cache key and return whether it is found and its result.
+        """
+        row = self.get_connection().execute(
+            "SELECT result FROM transcripts WHERE key = ?",
+            (key,)).fetchone()
+        with self.get_pending_lock():
+            pending = CACHE_PENDING.setdefault(
+                (self.cache_file, self.run_id),
+                {"hits": 0, "misses": 0, "accessed": {}, "time": time.monotonic()})
+            if row:
+                pending["hits"] = pending["hits"] + 1
+                pending["accessed"][key] = time.time()
+            else:
+                pending["misses"] = pending["misses"] + 1
+            is_due = pending["hits"] + pending["misses"] >= CACHE_FLUSH_SIZE \
+                or time.monotonic() - pending["time"] >= CACHE_FLUSH_INTERVAL
+        if is_due:
+            self.flush()
+        if row:
+            return True, json.loads(row[0])
+        return False, None
+
+    def put(self, key, result):
+        """
+        Give a cache key and save its result.
+        An empty result isn't saved.
+        """
+        if not result:
+            return
+        result_json = json.dumps(result, ensure_ascii=False)
+        connection = self.get_connection()
+        with connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO transcripts VALUES (?, ?, ?, ?)",
+                (key, result_json, len(result_json.encode("utf-8")), time.time()))
+            self.write_pending(connection)
+
+    def evict(self):
+        """
+        Delete the least recently used results
+        until the cache size is no bigger than the max size
+        and return the number of deleted results.
+        """
+        connection = self.get_connection()
+        with connection:
+            self.write_pending(connection)
+            total_size = connection.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM transcripts").fetchone()[0]
+            if total_size <= self.max_size:
+                return 0
+            deleted_count = 0
+            for key, size in connection.execute(
+                    "SELECT key, size FROM transcripts "
+                    "ORDER BY accessed").fetchall():
+                if total_size <= self.max_size:
+                    break
+                connection.execute(
+                    "DELETE FROM transcripts WHERE key = ?", (key,))
+                total_size = total_size - size
+                deleted_count = deleted_count + 1
+        return deleted_count
+
+    def get_stats(self):
+        """
+        Return the hits and misses of this run,
+        the number of the cached results and their size.
+        """
+        self.flush()
+        connection = self.get_connection()
+        hits, misses = connection.execute(
+            "SELECT hits, misses FROM counters WHERE run_id = ?",
+            (self.run_id,)).fetchone()
+        count, size = connection.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM transcripts").fetchone()
+        return hits, misses, count, size
+
+    def close(self):
+        """
+        Delete the counters of this run and close the connection.
+        """
+        connection = self.get_connection()
+        with connection:
+            connection.execute(
+                "DELETE FROM counters WHERE run_id = ?", (self.run_id,))
+        connection.close()
+        del CACHE_CONNECTION.connections[self.cache_file]
@@ -29,6 +29,10 @@ from autosub import sub_utils
 from autosub import api_google
 from autosub import api_baidu
 from autosub import auditok_utils
+from autosub import vad_utils
+from autosub import cache_utils
+from autosub import journal_utils
+from autosub import net_utils
 
 CMDLINE_UTILS_TEXT = gettext.translation(domain=__name__,
                                          localedir=constants.LOCALE_PATH,
@@ -126,6 +130,14 @@ def validate_io(  # pylint: disable=too-many-branches, too-many-statements
             _("Error: arg of \"-i\"/\"--input\": \"{path}\" isn't valid. "
               "You need to give a valid path.").format(path=args.input))
 
+    if args.rate_limit:
+        try:
+            args.rate_limit = net_utils.parse_rate_limits(args.rate_limit)
+        except ValueError as error:
+            raise exceptions.AutosubException(
+                _("Error: arg of \"-rl\"/\"--rate-limit\": \"{arg}\" isn't valid. "
+                  "Use the format like \"gsv2=10/s\".").format(arg=error))
+
     if args.styles:  # pylint: disable=too-many-nested-blocks
         if not os.path.isfile(args.styles):
             raise exceptions.AutosubException(
@@ -261,6 +273,21 @@ def validate_json_config(config_file):
     return config_dict
 
 
+def normalize_speech_credential(credential):
+    """
+    Give a speech credential dict
+    and rename its keys copied from the API console.
+    """
+    for key, aliases in (("app_id", ("APPID", "AppID")),
+                         ("api_key", ("APIKey", "API key")),
+                         ("api_secret", ("APISecret", "Secret Key"))):
+        for alias in aliases:
+            if alias in credential:
+                credential[key] = credential[alias]
+                del credential[alias]
+                break
+
+
 def validate_speech_config(args):  # pylint: disable=too-many-branches, too-many-return-statements, too-many-statements
     """
     Check that the speech-config args passed to autosub are valid
@@ -303,38 +330,44 @@ def validate_speech_config(args):  # pylint: disable=too-many-branches, too-many
         args.api_suffix = ".pcm"
         args.api_sample_rate = 16000
 
-        if "APPID" in config_dict:
-            config_dict["app_id"] = config_dict["APPID"]
-            del config_dict["APPID"]
-        elif "AppID" in config_dict:
-            config_dict["app_id"] = config_dict["AppID"]
-            del config_dict["AppID"]
-        elif "app_id" not in config_dict:
-            raise exceptions.AutosubException(
-                _("Error: No \"app_id\" found in speech config file \"{filename}\"."
-                  ).format(filename=args.speech_config))
-
-        if "APIKey" in config_dict:
-            config_dict["api_key"] = config_dict["APIKey"]
-            del config_dict["APIKey"]
-        elif "API key" in config_dict:
-            config_dict["api_key"] = config_dict["API key"]
-            del config_dict["API key"]
-        elif "api_key" not in config_dict:
+        credentials = config_dict.get("credentials")
+        if credentials is not None and \
+                (not isinstance(credentials, list) or not credentials
+                 or not all(isinstance(credential, dict) for credential in credentials)):
             raise exceptions.AutosubException(
-                _("Error: No \"api_key\" found in speech config file \"{filename}\"."
-                  ).format(filename=args.speech_config))
-
-        if "APISecret" in config_dict:
-            config_dict["api_secret"] = config_dict["APISecret"]
-            del config_dict["APISecret"]
-        elif "Secret Key" in config_dict:
-            config_dict["api_secret"] = config_dict["Secret Key"]
-            del config_dict["Secret Key"]
-        elif "api_secret" not in config_dict:
-            raise exceptions.AutosubException(
-                _("Error: No \"api_secret\" found in speech config file \"{filename}\"."
-                  ).format(filename=args.speech_config))
+                _("Error: \"credentials\" in speech config file \"{filename}\" "
+                  "isn't a list of credentials.").format(filename=args.speech_config))
+
+        normalize_speech_credential(config_dict)
+        if credentials:
+            # the top-level fields are the defaults of every credential
+            config_dict["credentials"] = []
+            for credential in credentials:
+                credential = dict(credential)
+                normalize_speech_credential(credential)
+                for key in constants.SPEECH_CREDENTIAL_KEYS:
+                    if key not in credential and key in config_dict:
+                        credential[key] = config_dict[key]
+                config_dict["credentials"].append(credential)
+            for key in constants.SPEECH_CREDENTIAL_KEYS:
+                if key not in config_dict and key in config_dict["credentials"][0]:
+                    config_dict[key] = config_dict["credentials"][0][key]
+
+        for credential in [config_dict] + config_dict.get("credentials", []):
+            if "app_id" not in credential:
+                raise exceptions.AutosubException(
+                    _("Error: No \"app_id\" found in speech config file \"{filename}\"."
+                      ).format(filename=args.speech_config))
+
+            if "api_key" not in credential:
+                raise exceptions.AutosubException(
+                    _("Error: No \"api_key\" found in speech config file \"{filename}\"."
+                      ).format(filename=args.speech_config))
+
+            if "api_secret" not in credential:
+                raise exceptions.AutosubException(
+                    _("Error: No \"api_secret\" found in speech config file \"{filename}\"."
+                      ).format(filename=args.speech_config))
 
         if args.speech_api == "xfyun":
             if "business" not in config_dict:
@@ -368,8 +401,8 @@ def validate_speech_config(args):  # pylint: disable=too-many-branches, too-many
 
             if "disable_qps_limit" not in config_dict \
                     or config_dict["disable_qps_limit"] is not True:
-                # Queries per second limit
-                args.speech_concurrency = 1
+                # Queries per second limit of every credential
+                args.speech_concurrency = len(config_dict.get("credentials", [None]))
 
     args.speech_config = config_dict
 
@@ -806,7 +839,14 @@ def sub_processing(  # pylint: disable=too-many-branches, too-many-statements, t
         # get ass events from external regions
         if not ass_events:
             print(_("External regions file is a video or audio file."))
-            if ext_fmt != ".wav":
+            if args.audio_in_memory:
+                audio_wav = convert_pcm(
+                    input_=args.ext_regions,
+                    conversion_cmd=args.audio_conversion_cmd,
+                    output_=args.output,
+                    keep=args.keep
+                )
+            elif ext_fmt != ".wav":
                 audio_wav = convert_wav(
                     input_=args.ext_regions,
                     conversion_cmd=args.audio_conversion_cmd,
@@ -820,22 +860,22 @@ def sub_processing(  # pylint: disable=too-many-branches, too-many-statements, t
                 astats = args.auditok_config["astats"]
                 ass_events = core.auditok_opt_opt(config_dict=astats,
                                                   audio_wav=audio_wav,
-                                                  concurrency=args.audio_concurrency)
+                                                  concurrency=args.audio_concurrency,
+                                                  vad_engine=args.vad_engine)
                 args.max_continuous_silence = astats["result_mxcs"]
                 args.energy_threshold = astats["result_et"]
             else:
-                ass_events = auditok_utils.auditok_gen_speech_regions(
+                ass_events = gen_speech_regions(
+                    args=args,
                     audio_wav=audio_wav,
-                    energy_threshold=args.energy_threshold,
-                    min_region_size=args.min_region_size,
-                    max_region_size=args.max_region_size,
-                    max_continuous_silence=args.max_continuous_silence,
-                    mode=args.auditok_mode,
                     is_ssa_event=True)
 
             gc.collect(0)
             print(_("Auditok detection completed."))
-            if not args.keep and audio_wav != args.ext_regions:
+            if auditok_utils.is_pcm_buffer(audio_wav):
+                del audio_wav
+                gc.collect(0)
+            elif not args.keep and audio_wav != args.ext_regions:
                 os.remove(audio_wav)
                 print(_("\"{name}\" has been deleted.").format(name=audio_wav))
 
@@ -883,10 +923,6 @@ def sub_processing(  # pylint: disable=too-many-branches, too-many-statements, t
 
     try:
         args.join_control.remove("trim")
-        if new_sub:
-            regions = events_to_regions(new_sub.events)
-        else:
-            regions = events_to_regions(src_sub.events)
         if args.auditok_config is not None and "trim" in args.auditok_config:
             trim_dict = args.auditok_config["trim"]
         else:
@@ -897,29 +933,47 @@ def sub_processing(  # pylint: disable=too-many-branches, too-many-statements, t
             mode = auditok.StreamTokenizer.STRICT_MIN_LENGTH
         if trim_dict["dts"]:
             mode = mode | auditok.StreamTokenizer.DROP_TRAILING_SILENCE
-        audio_fragments = core.bulk_audio_conversion(
-            source_file=args.ext_regions,
-            output=args.output,
-            regions=regions,
-            split_cmd=args.audio_split_cmd,
-            suffix=".wav",
-            concurrency=args.audio_concurrency,
-            is_keep=args.keep,
-            include_before=trim_dict["include_before"],
-            include_after=trim_dict["include_after"])
-        gc.collect(0)
-        core.trim_audio_regions(
-            audio_fragments=audio_fragments,
-            events=new_sub.events,
-            max_speed=trim_dict["max_speed"],
-            delta=int(trim_dict["include_before"] * 1000),
-            is_keep=args.keep,
-            trim_size=int(trim_dict["trim_size"] * 1000),
-            energy_threshold=trim_dict["et"],
-            min_region_size=trim_dict["mnrs"],
-            max_region_size=trim_dict["mxrs"],
-            max_continuous_silence=trim_dict["mxcs"],
-            mode=mode)
+        if args.vad_engine == "numpy" and constants.numpy_:
+            # no fragment is split when the envelope is available
+            core.energy_trim_audio_regions(
+                energies=gen_source_energies(
+                    args=args,
+                    input_=args.ext_regions),
+                events=new_sub.events,
+                max_speed=trim_dict["max_speed"],
+                delta=int(trim_dict["include_before"] * 1000),
+                include_after=int(trim_dict["include_after"] * 1000),
+                trim_size=int(trim_dict["trim_size"] * 1000),
+                energy_threshold=trim_dict["et"],
+                min_region_size=trim_dict["mnrs"],
+                max_region_size=trim_dict["mxrs"],
+                max_continuous_silence=trim_dict["mxcs"],
+                mode=mode)
+        else:
+            if new_sub:
+                regions = events_to_regions(new_sub.events)
+            else:
+                regions = events_to_regions(src_sub.events)
+            audio_fragments = split_audio_regions(
+                args=args,
+                source_file=args.ext_regions,
+                regions=regions,
+                suffix=".wav",
+                include_before=trim_dict["include_before"],
+                include_after=trim_dict["include_after"])
+            gc.collect(0)
+            core.trim_audio_regions(
+                audio_fragments=audio_fragments,
+                events=new_sub.events,
+                max_speed=trim_dict["max_speed"],
+                delta=int(trim_dict["include_before"] * 1000),
+                is_keep=args.keep,
+                trim_size=int(trim_dict["trim_size"] * 1000),
+                energy_threshold=trim_dict["et"],
+                min_region_size=trim_dict["mnrs"],
+                max_region_size=trim_dict["mxrs"],
+                max_continuous_silence=trim_dict["mxcs"],
+                mode=mode)
     except KeyError:
         pass
 
@@ -1099,7 +1153,9 @@ def sub_trans(  # pylint: disable=too-many-branches, too-many-statements, too-ma
         size_per_trans=args.max_trans_size,
         sleep_seconds=args.sleep_seconds,
         drop_override_codes=args.drop_override_codes,
-        delete_chars=args.trans_delete_chars)
+        delete_chars=args.trans_delete_chars,
+        rate_limiter=net_utils.get_rate_limiter(
+            args.rate_limit, "googletrans", args.rate_limit_dir))
 
     if not translated_text or len(translated_text) != len(text_list):
         raise exceptions.AutosubException(
@@ -1306,8 +1362,8 @@ def convert_wav(
             suffix=".wav")
     command = conversion_cmd.format(
         in_=input_,
-        channel=1,
-        sample_rate=48000,
+        channel=constants.AUDITOK_CHANNEL,
+        sample_rate=constants.AUDITOK_SAMPLE_RATE,
         out_=audio_wav)
     print(_("\nConvert source file to \"{name}\" "
             "to detect audio regions.").format(
@@ -1329,47 +1385,353 @@ def convert_wav(
     return audio_wav
 
 
-def audio_or_video_prcs(  # pylint: disable=too-many-branches, too-many-statements, too-many-locals, too-many-arguments
+def convert_pcm(
+        input_,
+        conversion_cmd,
+        output_=None,
+        keep=False
+):
+    """
+    Convert an input audio to an in-memory pcm buffer
+    through the ffmpeg stdout pipe.
+    """
+    print(_("\nConvert source file to in-memory pcm data "
+            "to detect audio regions."))
+    audio_buffer = ffmpeg_utils.ffmpeg_decode_pcm(
+        input_=input_,
+        conversion_cmd=conversion_cmd,
+        channel=constants.AUDITOK_CHANNEL,
+        sample_rate=constants.AUDITOK_SAMPLE_RATE)
+
+    if output_ and keep:
+        audio_wav = "{output_}.used{suffix}".format(
+            output_=output_,
+            suffix=".wav")
+        auditok_utils.pcm_buffer_to_wav(
+            audio_buffer=audio_buffer,
+            audio_wav=audio_wav)
+        print(_("Converted audio data has been kept at \"{name}\".").format(
+            name=audio_wav))
+
+    return audio_buffer
+
+
+def gen_source_energies(
         args,
-        input_m=input,
-        fps=30.0,
-        styles_list=None):
+        input_):
     """
-    Give args and process an input audio or video file.
+    Give the args and an input audio/video file
+    and return the frame energies of its audio.
+    Use the energy index if it is enabled.
     """
-    audio_wav = convert_wav(
-        input_=args.input,
+    index_file = None
+    index_key = None
+    if args.energy_index and args.vad_engine == "numpy":
+        index_key = vad_utils.get_energy_index_key(
+            input_=input_,
+            conversion_cmd=args.audio_conversion_cmd)
+        index_file = vad_utils.get_energy_index_path(
+            input_=input_,
+            index_dir=args.energy_index,
+            index_key=index_key)
+        energies = vad_utils.load_energy_index(
+            index_file=index_file,
+            index_key=index_key)
+        if energies is not None:
+            print(_("Use the energy index \"{name}\".").format(
+                name=index_file))
+            return energies
+
+    print(_("\nConvert source file to in-memory pcm data "
+            "to compute the frame energies."))
+    audio_buffer = ffmpeg_utils.ffmpeg_decode_pcm(
+        input_=input_,
         conversion_cmd=args.audio_conversion_cmd,
-        output_=args.output,
-        keep=args.keep
-    )
+        channel=constants.AUDITOK_CHANNEL,
+        sample_rate=constants.AUDITOK_SAMPLE_RATE)
+    energies = vad_utils.parallel_gen_frame_energies(
+        audio_buffer,
+        concurrency=args.audio_concurrency)
+    if index_file:
+        vad_utils.save_energy_index(
+            index_file=index_file,
+            index_key=index_key,
+            energies=energies,
+            duration=auditok_utils.get_audio_length(audio_buffer))
+        print(_("Energy index has been saved at \"{name}\".").format(
+            name=index_file))
+    del audio_buffer
+    gc.collect(0)
+    return energies
 
-    if args.ext_regions:
-        # use external speech regions
-        print(_("Use external speech regions."))
-        regions = sub_utils.sub_to_speech_regions(
-            audio_wav=audio_wav,
-            sub_file=args.ext_regions)
 
-    else:
-        print(_("Conversion completed.\nUse Auditok to detect speech regions."))
-        regions = auditok_utils.auditok_gen_speech_regions(
-            audio_wav=audio_wav,
+def gen_speech_regions(
+        args,
+        audio_wav,
+        is_ssa_event=False,
+        index_file=None,
+        index_key=None):
+    """
+    Give the args and generate the speech regions
+    of the audio by the vad engine.
+    Save the frame energies to the index file if it is given.
+    """
+    if index_file and args.vad_engine == "numpy" and constants.numpy_:
+        energies = vad_utils.parallel_gen_frame_energies(
+            audio_wav,
+            concurrency=args.audio_concurrency)
+        vad_utils.save_energy_index(
+            index_file=index_file,
+            index_key=index_key,
+            energies=energies,
+            duration=auditok_utils.get_audio_length(audio_wav))
+        print(_("Energy index has been saved at \"{name}\".").format(
+            name=index_file))
+        return vad_utils.energies_to_speech_regions(
+            energies=energies,
             energy_threshold=args.energy_threshold,
             min_region_size=args.min_region_size,
             max_region_size=args.max_region_size,
             max_continuous_silence=args.max_continuous_silence,
-            mode=args.auditok_mode)
-        gc.collect(0)
-        print(_("Auditok detection completed."))
+            mode=args.auditok_mode,
+            is_ssa_event=is_ssa_event,
+            concurrency=args.audio_concurrency)
+
+    if args.vad_engine == "numpy":
+        if constants.numpy_:
+            return vad_utils.numpy_gen_speech_regions(
+                audio_wav=audio_wav,
+                energy_threshold=args.energy_threshold,
+                min_region_size=args.min_region_size,
+                max_region_size=args.max_region_size,
+                max_continuous_silence=args.max_continuous_silence,
+                mode=args.auditok_mode,
+                is_ssa_event=is_ssa_event,
+                concurrency=args.audio_concurrency)
+        print(_("Warning: Dependency numpy "
+                "not found on this machine. "
+                "Use auditok instead."))
+
+    return auditok_utils.auditok_gen_speech_regions(
+        audio_wav=audio_wav,
+        energy_threshold=args.energy_threshold,
+        min_region_size=args.min_region_size,
+        max_region_size=args.max_region_size,
+        max_continuous_silence=args.max_continuous_silence,
+        mode=args.auditok_mode,
+        is_ssa_event=is_ssa_event)
+
+
+def iter_speech_regions(
+        args,
+        audio_wav,
+        index_file=None,
+        index_key=None):
+    """
+    Give the args and yield the speech regions of the audio
+    while the vad engine is still detecting.
+    """
+    if index_file or args.vad_engine == "numpy":
+        # the whole envelope is computed at once
+        return iter(gen_speech_regions(
+            args=args,
+            audio_wav=audio_wav,
+            index_file=index_file,
+            index_key=index_key))
+
+    return auditok_utils.auditok_iter_speech_regions(
+        audio_wav=audio_wav,
+        energy_threshold=args.energy_threshold,
+        min_region_size=args.min_region_size,
+        max_region_size=args.max_region_size,
+        max_continuous_silence=args.max_continuous_silence,
+        mode=args.auditok_mode)
+
+
+def get_encode_cmd(suffix):
+    """
+    Give the audio suffix and return the command
+    to encode the in-memory pcm data.
+    """
+    encode_cmd = constants.DEFAULT_AUDIO_ENCODE_CMD
+    if suffix == ".ogg":
+        # regard ogg as ogg_opus
+        encode_cmd = encode_cmd.replace("-vn", "-vn -c:a libopus")
+    return encode_cmd
+
+
+def get_segment_output_cmd(
+        args,
+        suffix):
+    """
+    Give the args and the audio suffix and return the output part
+    of the segment command.
+    """
+    output_cmd = constants.DEFAULT_AUDIO_SEGMENT_OUTPUT
+    if suffix == ".ogg":
+        # regard ogg as ogg_opus
+        output_cmd = output_cmd.replace("-vn", "-vn -c:a libopus")
+    elif suffix == ".pcm":
+        # raw pcm
+        output_cmd = output_cmd.replace("-vn", "-vn -c:a pcm_s16le -f s16le")
+    return output_cmd.replace(
+        "{channel}", str(args.api_audio_channel)).replace(
+            "{sample_rate}", str(args.api_sample_rate))
+
+
+def iter_split_audio_regions(
+        args,
+        source_file,
+        regions,
+        suffix):
+    """
+    Give the args and an iterable of regions of the source file
+    and yield every region with its short-term audio fragment in order
+    as soon as it is converted.
+    """
+    if args.audio_split_mode == "pcm":
+        print(_("\nDecoding source file to pcm data "
+                "while splitting speech regions."))
+        # only the pcm data from the current region on is kept
+        converter = ffmpeg_utils.EncodePCMAudioPiece(
+            cmd=get_encode_cmd(suffix),
+            suffix=suffix,
+            output=args.output,
+            is_keep=args.keep)
+        return ((pcm_region[0], audio_fragment)
+                for pcm_region, audio_fragment in core.iter_audio_conversion(
+                    converter=converter,
+                    regions=ffmpeg_utils.iter_pcm_regions(
+                        input_=source_file,
+                        conversion_cmd=args.audio_conversion_cmd,
+                        regions=regions,
+                        channel=args.api_audio_channel,
+                        sample_rate=args.api_sample_rate),
+                    concurrency=args.audio_concurrency,
+                    initializer=ffmpeg_utils.init_pcm_source,
+                    initargs=(None, args.api_sample_rate, args.api_audio_channel)))
+
+    if args.audio_split_mode == "segment":
+        converter = ffmpeg_utils.SplitIntoAudioSegments(
+            source_path=source_file,
+            cmd=constants.DEFAULT_AUDIO_SEGMENT_CMD,
+            output_cmd=get_segment_output_cmd(args, suffix),
+            suffix=suffix,
+            output=args.output,
+            is_keep=args.keep)
+        return core.iter_audio_conversion(
+            converter=converter,
+            regions=regions,
+            concurrency=args.audio_concurrency,
+            batch_size=constants.DEFAULT_STREAM_SEGMENTS_PER_CMD)
+
+    converter = ffmpeg_utils.SplitIntoAudioPiece(
+        source_path=source_file,
+        cmd=args.audio_split_cmd,
+        suffix=suffix,
+        output=args.output,
+        is_keep=args.keep)
+    return core.iter_audio_conversion(
+        converter=converter,
+        regions=regions,
+        concurrency=args.audio_concurrency)
+
+
+def iter_region_fragments(
+        region_fragments,
+        region_list):
+    """
+    Give the regions with their audio fragments
+    and yield the fragments while appending their regions to the region list.
+    Raise as soon as a region fails to convert
+    so every text is recognized for its own region.
+    """
+    for region, audio_fragment in region_fragments:
+        if not audio_fragment:
+            raise exceptions.ConversionException(
+                _("Error: Conversion failed."))
+        region_list.append(region)
+        yield audio_fragment
+
+
+def split_audio_regions(
+        args,
+        source_file,
+        regions,
+        suffix,
+        include_before=0.0,
+        include_after=0.0):
+    """
+    Give the args and split the regions of the source file
+    into short-term audio fragments by the audio split mode.
+    """
+    if args.audio_split_mode == "pcm":
+        return core.bulk_pcm_conversion(
+            source_file=source_file,
+            output=args.output,
+            regions=regions,
+            conversion_cmd=args.audio_conversion_cmd,
+            encode_cmd=get_encode_cmd(suffix),
+            suffix=suffix,
+            channel=args.api_audio_channel,
+            sample_rate=args.api_sample_rate,
+            concurrency=args.audio_concurrency,
+            is_keep=args.keep,
+            include_before=include_before,
+            include_after=include_after)
 
-    if not args.keep:
+    if args.audio_split_mode == "segment":
+        return core.bulk_segment_conversion(
+            source_file=source_file,
+            output=args.output,
+            regions=regions,
+            segment_cmd=constants.DEFAULT_AUDIO_SEGMENT_CMD,
+            output_cmd=get_segment_output_cmd(args, suffix),
+            suffix=suffix,
+            concurrency=args.audio_concurrency,
+            is_keep=args.keep,
+            include_before=include_before,
+            include_after=include_after)
+
+    return core.bulk_audio_conversion(
+        source_file=source_file,
+        output=args.output,
+        regions=regions,
+        split_cmd=args.audio_split_cmd,
+        suffix=suffix,
+        concurrency=args.audio_concurrency,
+        is_keep=args.keep,
+        include_before=include_before,
+        include_after=include_after)
+
+
+def release_audio_wav(
+        args,
+        audio_wav):
+    """
+    Release the in-memory pcm data
+    or delete the converted audio file if it isn't kept.
+    """
+    if auditok_utils.is_pcm_buffer(audio_wav):
+        # release the in-memory pcm data
+        del audio_wav
+        gc.collect(0)
+    elif audio_wav and not args.keep:
         os.remove(audio_wav)
         print(_("\"{name}\" has been deleted.").format(name=audio_wav))
+    return None
 
-    if not regions:
-        raise exceptions.AutosubException(
-            _("Error: Can't get speech regions."))
+
+def write_times_file(
+        args,
+        regions,
+        fps=30.0,
+        styles_list=None,
+        input_m=input):
+    """
+    Give the args and the speech regions
+    and write them to the times file if it is needed.
+    """
     try:
         args.output_files.remove("regions")
         if args.styles and \
@@ -1403,33 +1765,94 @@ def audio_or_video_prcs(  # pylint: disable=too-many-branches, too-many-statemen
     except KeyError:
         pass
 
-    audio_fragments = core.bulk_audio_conversion(
-        source_file=args.input,
-        output=args.output,
-        regions=regions,
-        split_cmd=args.audio_split_cmd,
-        suffix=args.api_suffix,
-        concurrency=args.audio_concurrency,
-        is_keep=args.keep)
-    gc.collect(0)
 
-    if not audio_fragments or \
-            len(audio_fragments) != len(regions):
-        if not args.keep:
-            for audio_fragment in audio_fragments:
-                os.remove(audio_fragment)
-        raise exceptions.ConversionException(
-            _("Error: Conversion failed."))
-
-    if args.audio_process and 's' in args.audio_process:
-        raise exceptions.AutosubException(
-            _("Audio processing complete.\nAll work done."))
+def speech_to_text(  # pylint: disable=too-many-branches, too-many-statements, too-many-locals
+        args,
+        audio_fragments,
+        result_list=None,
+        journal=None,
+        regions=None):
+    """
+    Give the args and the audio fragments
+    and return the text list from the speech-to-text api.
+    """
+    if args.partial_subtitles and regions is not None:
+        partial_writer = sub_utils.PartialSrtWriter(
+            output="{base}.{nt}.partial.srt".format(
+                base=args.output,
+                nt=args.speech_language),
+            regions=regions,
+            is_empty_dropped=args.drop_empty_regions)
+        print(_("Write the recognized subtitles to \"{name}\" "
+                "as they arrive.").format(name=partial_writer.output))
+    else:
+        partial_writer = None
+
+    if args.transcript_cache:
+        transcript_cache = cache_utils.TranscriptCache(
+            cache_file=os.path.join(
+                args.transcript_cache,
+                constants.TRANSCRIPT_CACHE_NAME),
+            max_size=args.transcript_cache_size << 20)
+    else:
+        transcript_cache = None
 
-    try:
-        args.output_files.remove("full-src")
-        result_list = []
-    except KeyError:
-        result_list = None
+    if journal and regions is not None:
+        # only the regions without results are sent
+        fragment_regions = [regions[index] for index in journal.get_missing_indexes()]
+    else:
+        fragment_regions = regions
+
+    if args.speech_max_concurrency:
+        # the pool is as big as the max and the controller limits the requests
+        controller = net_utils.AIMDController(
+            initial_limit=args.speech_concurrency,
+            max_limit=args.speech_max_concurrency)
+        concurrency = controller.max_limit
+    else:
+        controller = None
+        concurrency = args.speech_concurrency
+
+    retry_policy = net_utils.RetryPolicy(
+        retries=args.speech_retries,
+        connect_timeout=args.speech_timeout[0],
+        read_timeout=args.speech_timeout[1],
+        backoff_base=args.speech_backoff[0],
+        backoff_max=args.speech_backoff[1],
+        deadline=args.speech_deadline,
+        rate_limiter=net_utils.get_rate_limiter(
+            args.rate_limit, args.speech_api, args.rate_limit_dir))
+
+    if args.speech_schedule == "lpt" and not isinstance(audio_fragments, list):
+        # the fragments are still being generated
+        schedule = "timeline"
+    else:
+        schedule = args.speech_schedule
+
+    if args.speech_hedge:
+        hedger = net_utils.RequestHedger(
+            concurrency=concurrency,
+            max_ratio=args.speech_hedge)
+        # a duplicate request reads the fragment again
+        # so the fragments are deleted after all the requests
+        is_keep = True
+        if isinstance(audio_fragments, list):
+            sent_fragments = audio_fragments
+        else:
+            sent_fragments = []
+            audio_fragments = core.record_iterable(audio_fragments, sent_fragments)
+    else:
+        hedger = None
+        is_keep = args.keep
+
+    if args.speech_api in ("xfyun", "baidu"):
+        credential_pool = net_utils.get_credential_pool(
+            args.speech_api,
+            args.speech_config.get("credentials"),
+            args.rate_limit_dir)
+    else:
+        # set by the Google API keys
+        credential_pool = None
 
     if args.speech_api == "gsv2":
         # Google speech-to-text v2
@@ -1441,13 +1864,19 @@ def audio_or_video_prcs(  # pylint: disable=too-many-branches, too-many-statemen
                            constants.GOOGLE_SPEECH_V2_API_URL
 
         if args.speech_key:
-            gsv2_api_url = gsv2_api_url.format(
+            gsv2_api_urls = [gsv2_api_url.format(
                 lang=args.speech_language,
-                key=args.speech_key)
+                key=speech_key) for speech_key in args.speech_key]
         else:
-            gsv2_api_url = gsv2_api_url.format(
+            gsv2_api_urls = [gsv2_api_url.format(
                 lang=args.speech_language,
-                key=constants.GOOGLE_SPEECH_V2_API_KEY)
+                key=constants.GOOGLE_SPEECH_V2_API_KEY)]
+        gsv2_api_url = gsv2_api_urls[0]
+        if len(gsv2_api_urls) > 1:
+            credential_pool = net_utils.get_credential_pool(
+                "gsv2",
+                [{"api_url": api_url} for api_url in gsv2_api_urls],
+                args.rate_limit_dir)
 
         if args.api_suffix == ".flac":
             headers = \
@@ -1460,10 +1889,20 @@ def audio_or_video_prcs(  # pylint: disable=too-many-branches, too-many-statemen
             audio_fragments=audio_fragments,
             api_url=gsv2_api_url,
             headers=headers,
-            concurrency=args.speech_concurrency,
+            concurrency=concurrency,
             min_confidence=args.min_confidence,
-            is_keep=args.keep,
-            result_list=result_list)
+            is_keep=is_keep,
+            result_list=result_list,
+            speech_engine=args.speech_engine,
+            transcript_cache=transcript_cache,
+            journal=journal,
+            controller=controller,
+            retry_policy=retry_policy,
+            hedger=hedger,
+            credential_pool=credential_pool,
+            schedule=schedule,
+            on_text=partial_writer,
+            regions=fragment_regions)
         gc.collect(0)
 
     elif args.speech_api == "gcsv1":
@@ -1471,10 +1910,16 @@ def audio_or_video_prcs(  # pylint: disable=too-many-branches, too-many-statemen
         if args.speech_key:
             headers = \
                 {"Content-Type": "application/json"}
-            gcsv1_api_url = \
-                "https://speech.googleapis.com/" \
+            gcsv1_api_urls = [
+                "https://speech.googleapis.com/"
                 "v1p1beta1/speech:recognize?key={api_key}".format(
-                    api_key=args.speech_key)
+                    api_key=speech_key) for speech_key in args.speech_key]
+            gcsv1_api_url = gcsv1_api_urls[0]
+            if len(gcsv1_api_urls) > 1:
+                credential_pool = net_utils.get_credential_pool(
+                    "gcsv1",
+                    [{"api_url": api_url} for api_url in gcsv1_api_urls],
+                    args.rate_limit_dir)
             print(_("Use the API key "
                     "given in the option \"-skey\"/\"--speech-key\"."))
             text_list = core.gcsv1_to_text(
@@ -1483,11 +1928,21 @@ def audio_or_video_prcs(  # pylint: disable=too-many-branches, too-many-statemen
                 api_url=gcsv1_api_url,
                 headers=headers,
                 config=args.speech_config,
-                concurrency=args.speech_concurrency,
+                concurrency=concurrency,
                 src_language=args.speech_language,
                 min_confidence=args.min_confidence,
-                is_keep=args.keep,
-                result_list=result_list)
+                is_keep=is_keep,
+                result_list=result_list,
+                speech_engine=args.speech_engine,
+                transcript_cache=transcript_cache,
+                journal=journal,
+                controller=controller,
+                retry_policy=retry_policy,
+                hedger=hedger,
+                credential_pool=credential_pool,
+                schedule=schedule,
+                on_text=partial_writer,
+                regions=fragment_regions)
         elif not constants.IS_GOOGLECLOUDCLIENT:
             raise exceptions.SpeechToTextException(
                 _("Error: Current build version doesn't support "
@@ -1502,11 +1957,21 @@ def audio_or_video_prcs(  # pylint: disable=too-many-branches, too-many-statemen
                 audio_fragments=audio_fragments,
                 sample_rate=args.api_sample_rate,
                 config=args.speech_config,
-                concurrency=args.speech_concurrency,
+                concurrency=concurrency,
                 src_language=args.speech_language,
                 min_confidence=args.min_confidence,
-                is_keep=args.keep,
-                result_list=result_list)
+                is_keep=is_keep,
+                result_list=result_list,
+                speech_engine=args.speech_engine,
+                transcript_cache=transcript_cache,
+                journal=journal,
+                controller=controller,
+                retry_policy=retry_policy,
+                hedger=hedger,
+                credential_pool=credential_pool,
+                schedule=schedule,
+                on_text=partial_writer,
+                regions=fragment_regions)
         else:
             if 'GOOGLE_APPLICATION_CREDENTIALS' in os.environ:
                 print(_("Use the GOOGLE_APPLICATION_CREDENTIALS "
@@ -1515,11 +1980,21 @@ def audio_or_video_prcs(  # pylint: disable=too-many-branches, too-many-statemen
                     audio_fragments=audio_fragments,
                     sample_rate=args.api_sample_rate,
                     config=args.speech_config,
-                    concurrency=args.speech_concurrency,
+                    concurrency=concurrency,
                     src_language=args.speech_language,
                     min_confidence=args.min_confidence,
-                    is_keep=args.keep,
-                    result_list=result_list)
+                    is_keep=is_keep,
+                    result_list=result_list,
+                    speech_engine=args.speech_engine,
+                    transcript_cache=transcript_cache,
+                    journal=journal,
+                    controller=controller,
+                    retry_policy=retry_policy,
+                    hedger=hedger,
+                    credential_pool=credential_pool,
+                    schedule=schedule,
+                    on_text=partial_writer,
+                    regions=fragment_regions)
             else:
                 print(_("No available GOOGLE_APPLICATION_CREDENTIALS. "
                         "Use \"-sa\"/\"--service-account\" to set one."))
@@ -1530,21 +2005,286 @@ def audio_or_video_prcs(  # pylint: disable=too-many-branches, too-many-statemen
         text_list = core.xfyun_to_text(
             audio_fragments=audio_fragments,
             config=args.speech_config,
-            concurrency=args.speech_concurrency,
-            is_keep=False,
-            result_list=result_list)
+            concurrency=concurrency,
+            is_keep=hedger is not None,
+            result_list=result_list,
+            speech_engine=args.speech_engine,
+            transcript_cache=transcript_cache,
+            journal=journal,
+            controller=controller,
+            retry_policy=retry_policy,
+            hedger=hedger,
+            credential_pool=credential_pool,
+            schedule=schedule,
+            on_text=partial_writer,
+            regions=fragment_regions)
     elif args.speech_api == "baidu":
         # Baidu ASR API
         text_list = core.baidu_to_text(
             audio_fragments=audio_fragments,
             config=args.speech_config,
-            concurrency=args.speech_concurrency,
-            is_keep=False,
-            result_list=result_list)
+            concurrency=concurrency,
+            is_keep=hedger is not None,
+            result_list=result_list,
+            speech_engine=args.speech_engine,
+            transcript_cache=transcript_cache,
+            journal=journal,
+            controller=controller,
+            retry_policy=retry_policy,
+            hedger=hedger,
+            credential_pool=credential_pool,
+            schedule=schedule,
+            on_text=partial_writer,
+            regions=fragment_regions)
     else:
         text_list = None
 
-    gc.collect(0)
+    if partial_writer:
+        partial_writer.close()
+
+    if transcript_cache:
+        deleted_count = transcript_cache.evict()
+        hits, misses, count, size = transcript_cache.get_stats()
+        transcript_cache.close()
+        print(_("Transcript cache: {hits} hits, {misses} misses. "
+                "{count} results ({size:.1f} MB) cached, "
+                "{deleted} evicted.").format(
+                    hits=hits,
+                    misses=misses,
+                    count=count,
+                    size=size / 1048576.0,
+                    deleted=deleted_count))
+
+    if hedger:
+        if not args.keep or args.speech_api in ("xfyun", "baidu"):
+            for audio_fragment in sent_fragments:
+                if os.path.isfile(audio_fragment):
+                    os.remove(audio_fragment)
+        print(_("Hedged {hedged} of {sent} speech requests "
+                "and {won} duplicates won.").format(
+                    hedged=hedger.hedged_count,
+                    sent=hedger.sent_count,
+                    won=hedger.won_count))
+
+    if controller:
+        print(_("Adaptive speech concurrency ended at {limit} "
+                "with {count} congested requests.").format(
+                    limit=controller.get_limit(),
+                    count=controller.congested_count))
+
+    return text_list
+
+
+def audio_or_video_prcs(  # pylint: disable=too-many-branches, too-many-statements, too-many-locals, too-many-arguments
+        args,
+        input_m=input,
+        fps=30.0,
+        styles_list=None):
+    """
+    Give args and process an input audio or video file.
+    """
+    index_file = None
+    index_key = None
+    energies = None
+    audio_wav = None
+    journal = None
+    is_resumed = False
+    if args.resume:
+        journal = journal_utils.RecognitionJournal(
+            journal_file="{base}.journal.jsonl".format(base=args.output),
+            job_key=journal_utils.get_job_key(args))
+        is_resumed = journal.load()
+        if is_resumed:
+            print(_("Resume the job from the journal \"{name}\". "
+                    "{done}/{total} speech regions have been recognized.").format(
+                        name=journal.journal_file,
+                        done=len(journal.results),
+                        total=len(journal.regions)))
+        else:
+            print(_("Record the job to the journal \"{name}\".").format(
+                name=journal.journal_file))
+
+    # the regions must be complete before any of them is journaled
+    is_streaming = args.streaming and not args.ext_regions and not journal \
+        and not (args.audio_process and 's' in args.audio_process) \
+        and bool(args.output_files - {"regions", "full-src"})
+    if args.energy_index and not args.ext_regions and not is_resumed:
+        if args.vad_engine != "numpy":
+            print(_("Warning: Energy index is only used "
+                    "by \"-ve\"/\"--vad-engine\" numpy."))
+        elif constants.numpy_:
+            index_key = vad_utils.get_energy_index_key(
+                input_=args.input,
+                conversion_cmd=args.audio_conversion_cmd)
+            index_file = vad_utils.get_energy_index_path(
+                input_=args.input,
+                index_dir=args.energy_index,
+                index_key=index_key)
+            energies = vad_utils.load_energy_index(
+                index_file=index_file,
+                index_key=index_key)
+        else:
+            print(_("Warning: Dependency numpy "
+                    "not found on this machine. "
+                    "Energy index is not used."))
+
+    if is_resumed:
+        # skip the conversion and the detection
+        regions = journal.regions
+
+    elif energies is not None:
+        # skip the conversion and derive regions from the index
+        print(_("Use the energy index \"{name}\" "
+                "to detect speech regions.").format(name=index_file))
+        regions = vad_utils.energies_to_speech_regions(
+            energies=energies,
+            energy_threshold=args.energy_threshold,
+            min_region_size=args.min_region_size,
+            max_region_size=args.max_region_size,
+            max_continuous_silence=args.max_continuous_silence,
+            mode=args.auditok_mode,
+            concurrency=args.audio_concurrency)
+        del energies
+        print(_("Auditok detection completed."))
+
+    else:
+        if args.audio_in_memory:
+            audio_wav = convert_pcm(
+                input_=args.input,
+                conversion_cmd=args.audio_conversion_cmd,
+                output_=args.output,
+                keep=args.keep
+            )
+        else:
+            audio_wav = convert_wav(
+                input_=args.input,
+                conversion_cmd=args.audio_conversion_cmd,
+                output_=args.output,
+                keep=args.keep
+            )
+
+        if args.ext_regions:
+            # use external speech regions
+            print(_("Use external speech regions."))
+            regions = sub_utils.sub_to_speech_regions(
+                audio_wav=audio_wav,
+                sub_file=args.ext_regions)
+
+        else:
+            print(_("Conversion completed.\nUse Auditok to detect speech regions."))
+            if is_streaming:
+                # regions are generated while the following stages run
+                regions = iter_speech_regions(
+                    args=args,
+                    audio_wav=audio_wav,
+                    index_file=index_file,
+                    index_key=index_key)
+            else:
+                regions = gen_speech_regions(
+                    args=args,
+                    audio_wav=audio_wav,
+                    index_file=index_file,
+                    index_key=index_key)
+                gc.collect(0)
+                print(_("Auditok detection completed."))
+
+        if not is_streaming:
+            audio_wav = release_audio_wav(args, audio_wav)
+
+    if is_streaming:
+        try:
+            args.output_files.remove("full-src")
+            result_list = []
+        except KeyError:
+            result_list = None
+
+        print(_("Split and recognize speech regions "
+                "while detecting them."))
+        region_list = []
+        audio_fragments = iter_region_fragments(
+            iter_split_audio_regions(
+                args=args,
+                source_file=args.input,
+                regions=regions,
+                suffix=args.api_suffix),
+            region_list)
+        text_list = speech_to_text(
+            args=args,
+            audio_fragments=audio_fragments,
+            result_list=result_list,
+            regions=region_list)
+        gc.collect(0)
+        audio_wav = release_audio_wav(args, audio_wav)
+        regions = region_list
+
+        if not regions:
+            raise exceptions.AutosubException(
+                _("Error: Can't get speech regions."))
+        write_times_file(
+            args=args,
+            regions=regions,
+            fps=fps,
+            styles_list=styles_list,
+            input_m=input_m)
+
+    else:
+        if not regions:
+            raise exceptions.AutosubException(
+                _("Error: Can't get speech regions."))
+
+        if journal and not is_resumed:
+            journal.record_regions(regions)
+
+        write_times_file(
+            args=args,
+            regions=regions,
+            fps=fps,
+            styles_list=styles_list,
+            input_m=input_m)
+
+        if journal:
+            # only split the regions without results
+            split_regions = [regions[index] for index in journal.get_missing_indexes()]
+        else:
+            split_regions = regions
+
+        if split_regions:
+            audio_fragments = split_audio_regions(
+                args=args,
+                source_file=args.input,
+                regions=split_regions,
+                suffix=args.api_suffix)
+            gc.collect(0)
+
+            if not audio_fragments or \
+                    len(audio_fragments) != len(split_regions):
+                if not args.keep:
+                    for audio_fragment in audio_fragments:
+                        os.remove(audio_fragment)
+                raise exceptions.ConversionException(
+                    _("Error: Conversion failed."))
+        else:
+            audio_fragments = []
+
+        if args.audio_process and 's' in args.audio_process:
+            raise exceptions.AutosubException(
+                _("Audio processing complete.\nAll work done."))
+
+        try:
+            args.output_files.remove("full-src")
+            result_list = []
+        except KeyError:
+            result_list = None
+
+        text_list = speech_to_text(
+            args=args,
+            audio_fragments=audio_fragments,
+            result_list=result_list,
+            journal=journal,
+            regions=regions)
+        gc.collect(0)
+        if journal:
+            journal.close()
 
     if result_list and result_list is not None:
         timed_result = get_timed_text(
@@ -1619,7 +2359,9 @@ def audio_or_video_prcs(  # pylint: disable=too-many-branches, too-many-statemen
         size_per_trans=args.max_trans_size,
         sleep_seconds=args.sleep_seconds,
         drop_override_codes=args.drop_override_codes,
-        delete_chars=args.trans_delete_chars)
+        delete_chars=args.trans_delete_chars,
+        rate_limiter=net_utils.get_rate_limiter(
+            args.rate_limit, "googletrans", args.rate_limit_dir))
 
     if not translated_text or len(translated_text) != len(regions):
         raise exceptions.AutosubException(
@@ -9,6 +9,7 @@ import re
 import sys
 import shlex
 import locale
+import tempfile
 import multiprocessing
 from pkg_resources import DistributionNotFound
 
@@ -25,6 +26,16 @@ try:
 except ImportError:
     langcodes_ = None
 
+try:
+    import numpy as numpy_  # pylint: disable=unused-import
+except ImportError:
+    numpy_ = None
+
+try:
+    import websockets as websockets_  # pylint: disable=unused-import
+except ImportError:
+    websockets_ = None
+
 # Any changes to the path and your own modules
 
 SUPPORTED_LOCALE = {
@@ -52,6 +63,13 @@ else:
 
 LOCALE_PATH = os.path.abspath(os.path.join(APP_PATH, "data/locale"))
 
+if IS_UNIX:
+    DEFAULT_CACHE_PATH = os.path.join(
+        os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "autosub")
+else:
+    DEFAULT_CACHE_PATH = os.path.join(
+        os.environ.get("LOCALAPPDATA", os.path.expanduser("~")), "autosub", "cache")
+
 EXT_LOCALE = os.path.abspath(os.path.join(os.getcwd(), "locale"))
 if os.path.isfile(EXT_LOCALE):
     with open(EXT_LOCALE, encoding='utf-8') as in_file:
@@ -72,11 +90,52 @@ BAIDU_ASR_URL = "http://vop.baidu.com/server_api"
 BAIDU_PRO_ASR_URL = "http://vop.baidu.com/pro_api"
 BAIDU_TOKEN_URL = "http://openapi.baidu.com/oauth/2.0/token"
 
+XFYUN_FRAME_SIZE = 8000
+XFYUN_SEND_INTERVAL = 0.04
+# Xun Fei Yun audio frame size in bytes and the seconds between two frames
+XFYUN_CONGESTION_CODES = (10700, 10800)
+# Xun Fei Yun error codes of the engine error and the connection limit
+BAIDU_CONGESTION_CODES = (3303, 3304)
+# Baidu error codes of the backend error and the qps limit
+XFYUN_QUOTA_CODES = (11200, 11201)
+# Xun Fei Yun error codes of the unauthorized feature and the daily limit
+BAIDU_QUOTA_CODES = (3304, 3305)
+# Baidu error codes of the qps limit and the daily limit
+BAIDU_TOKEN_CODES = (3302, 110, 111)
+# Baidu error codes of the authentication failure and the invalid or expired token
+
 if multiprocessing.cpu_count() > 3:
     DEFAULT_CONCURRENCY = multiprocessing.cpu_count() >> 1
 else:
     DEFAULT_CONCURRENCY = 2
 
+DEFAULT_SPEECH_RETRIES = 3
+DEFAULT_CONNECT_TIMEOUT = 10.0
+DEFAULT_READ_TIMEOUT = 60.0
+DEFAULT_BACKOFF_BASE = 0.5
+DEFAULT_BACKOFF_MAX = 30.0
+DEFAULT_SPEECH_DEADLINE = 300.0
+# Retry policy of a speech-to-text request in seconds
+
+DEFAULT_HEDGE_RATIO = 0.05
+DEFAULT_HEDGE_PERCENTILE = 0.95
+DEFAULT_HEDGE_MIN_SAMPLES = 20
+DEFAULT_HEDGE_WINDOW = 200
+# Hedging policy of the slow speech-to-text requests
+
+DEFAULT_REASSEMBLY_WINDOW = 1000
+# Max speech-to-text requests submitted ahead of the next result in order
+
+RATE_LIMIT_API_NAMES = {"gsv2", "gcsv1", "xfyun", "baidu", "googletrans"}
+RATE_LIMIT_PERIODS = {"s": 1.0, "m": 60.0, "h": 3600.0}
+DEFAULT_RATE_LIMIT_DIR = os.path.join(tempfile.gettempdir(), "autosub-rate-limits")
+# Token-bucket rate limits shared by the jobs on the same host
+
+DEFAULT_CREDENTIAL_COOLDOWN = 60.0
+# Seconds to evict a credential returning quota errors
+SPEECH_CREDENTIAL_KEYS = ("app_id", "api_key", "api_secret", "api_address", "proxy")
+# Speech config fields inherited by every credential
+
 VTT_TIMESTAMP = re.compile(r'\s*((?:\d+:)?\d{2}:\d{2}.\d{3})\s*-->\s*((?:\d+:)?\d{2}:\d{2}.\d{3})')
 VTT_WORD_TIMESTAMP = re.compile(r'<(\d{1,2}):(\d{2}):(\d{2})[.,](\d{2,3})>')
 
@@ -90,6 +149,33 @@ DEFAULT_CONTINUOUS_SILENCE = 0.2
 # Maximum speech to text region length in milliseconds
 # when using external speech region control
 
+AUDITOK_SAMPLE_RATE = 48000
+AUDITOK_SAMPLE_WIDTH = 2
+AUDITOK_CHANNEL = 1
+# The audio format converted from the input to detect speech regions
+
+DEFAULT_SEGMENTS_PER_CMD = 64
+# Maximum speech regions split by a single ffmpeg command
+# when using the segment audio split mode
+
+DEFAULT_STREAM_SEGMENTS_PER_CMD = 16
+# Maximum speech regions split by a single ffmpeg command
+# when streaming speech regions
+
+DEFAULT_STREAM_QUEUE_SIZE = 64
+# Maximum speech regions buffered between the vad and the splitting
+
+DEFAULT_TRANSCRIPT_CACHE_SIZE = 256 << 20
+# Maximum size in bytes of the results in the transcript cache
+
+TRANSCRIPT_CACHE_NAME = "transcripts.sqlite3"
+# File name of the transcript cache in the cache directory
+
+BAIDU_TOKEN_CACHE_NAME = "baidu-tokens.json"
+BAIDU_TOKEN_REFRESH_MARGIN = 86400
+# File name of the Baidu token cache in the cache directory
+# and the seconds before the expiry to refresh a token
+
 DEFAULT_DST_LANGUAGE = 'en-US'
 DEFAULT_SIZE_PER_TRANS = 4000
 DEFAULT_SLEEP_SECONDS = 1
@@ -353,6 +439,19 @@ DEFAULT_AUDIO_SPLT_CMD = \
     FFMPEG_CMD + " -y -ss {start} -i \"{in_}\" -t {dura} " \
     "-vn -ac [channel] -ar [sample_rate] -loglevel error \"{out_}\""
 
+DEFAULT_AUDIO_ENCODE_CMD = \
+    FFMPEG_CMD + " -y -f s16le -ar {sample_rate} -ac {channel} -i - " \
+    "-vn -loglevel error \"{out_}\""
+
+DEFAULT_AUDIO_SEGMENT_CMD = \
+    FFMPEG_CMD + " -hide_banner -y {inputs} {outputs} -loglevel error"
+
+DEFAULT_AUDIO_SEGMENT_INPUT = \
+    "-ss {start:.3f} -t {dura:.3f} -i \"{in_}\""
+
+DEFAULT_AUDIO_SEGMENT_OUTPUT = \
+    "-map {index}:a:0 -vn -ac {channel} -ar {sample_rate} \"{out_}\""
+
 DEFAULT_VIDEO_FPS_CMD = FFPROBE_CMD + " -v 0 -of csv=p=0 -select_streams " \
                         "v:0 -show_entries stream=r_frame_rate \"{in_}\""
 
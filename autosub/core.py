@@ -12,6 +12,9 @@ import gettext
 import gc
 import re
 import operator
+import itertools
+import functools
+import collections
 
 # Import third-party modules
 import progressbar
@@ -26,8 +29,10 @@ from autosub import api_baidu
 from autosub import api_google
 from autosub import api_xfyun
 from autosub import auditok_utils
+from autosub import vad_utils
 from autosub import sub_utils
 from autosub import ffmpeg_utils
+from autosub import net_utils
 from autosub import constants
 from autosub import exceptions
 
@@ -42,7 +47,8 @@ _ = CORE_TEXT.gettext
 def auditok_opt_opt(  # pylint: disable=too-many-locals, too-many-branches, too-many-statements
         config_dict,
         audio_wav,
-        concurrency=constants.DEFAULT_CONCURRENCY):
+        concurrency=constants.DEFAULT_CONCURRENCY,
+        vad_engine="auditok"):
     """
     Function for optimize auditok options.
     """
@@ -53,8 +59,11 @@ def auditok_opt_opt(  # pylint: disable=too-many-locals, too-many-branches, too-
     delta_mxcs =\
         (config_dict["max_mxcs"] - config_dict["min_mxcs"]) / (config_dict["mxcs_pass"] + 1)
     input_stats = []
-    asource = auditok.ADSFactory.ads(
-        filename=audio_wav, record=True)
+    if not auditok_utils.is_pcm_buffer(audio_wav):
+        stats_wav = audio_wav
+    else:
+        # don't pickle the in-memory pcm data into every stats
+        stats_wav = None
 
     et_i = config_dict["min_et"] + delta_et
     while et_i < config_dict["max_et"]:
@@ -67,12 +76,24 @@ def auditok_opt_opt(  # pylint: disable=too-many-locals, too-many-branches, too-
                 mxrs=config_dict["mxrs"],
                 nsml=config_dict["nsml"],
                 dts=config_dict["dts"],
-                audio_wav=audio_wav
+                audio_wav=stats_wav
             ))
             mxcs_i = mxcs_i + delta_mxcs
         et_i = et_i + delta_et
 
-    pool = multiprocessing.Pool(concurrency)
+    if vad_engine == "numpy" and constants.numpy_:
+        # compute the frame energies only once
+        # and share them with the worker processes
+        asource = None
+        energies = vad_utils.gen_frame_energies(audio_wav)
+        pool = multiprocessing.Pool(
+            concurrency,
+            initializer=vad_utils.init_shared_energies,
+            initargs=(vad_utils.share_energies(energies),))
+        del energies
+    else:
+        asource = auditok_utils.get_audio_source(audio_wav)
+        pool = multiprocessing.Pool(concurrency)
     widgets = [_("Auditok options optimization: "),
                progressbar.Percentage(), ' ',
                progressbar.Bar(), ' ',
@@ -84,9 +105,14 @@ def auditok_opt_opt(  # pylint: disable=too-many-locals, too-many-branches, too-
         tasks = []
         result_stats = []
         for stat in input_stats:
-            tasks.append(pool.apply_async(
-                auditok_utils.auditok_gen_stats_regions,
-                args=(stat, asource)))
+            if asource:
+                tasks.append(pool.apply_async(
+                    auditok_utils.auditok_gen_stats_regions,
+                    args=(stat, asource)))
+            else:
+                tasks.append(pool.apply_async(
+                    vad_utils.energy_gen_stats_regions,
+                    args=(stat,)))
             gc.collect(0)
 
         for task in tasks:
@@ -104,25 +130,27 @@ def auditok_opt_opt(  # pylint: disable=too-many-locals, too-many-branches, too-
                 stats_.rank_count = rank_item.index(stats_) + stats_.rank_count
 
         result = min(result_stats)
-        asource.close()
+        if asource:
+            asource.close()
         pbar.finish()
         print(_("Best options for Auditok is:\n"
-                "mxcs = {mxcs}s\net = {et}").format(mxcs=result.mxcs, et=result.et))
+                "mxcs = {mxcs}s\net = {et}").format(mxcs=result.mxcs, et=result.energy_t))
         config_dict["result_mxcs"] = result.mxcs
-        config_dict["result_et"] = result.et
+        config_dict["result_et"] = result.energy_t
         pool.terminate()
         pool.join()
         return result.events
 
     except KeyboardInterrupt:
-        asource.close()
+        if asource:
+            asource.close()
         pbar.finish()
         pool.terminate()
         pool.join()
         return None
 
 
-def trim_audio_regions(  # pylint: disable=too-many-arguments, too-many-locals, too-many-branches
+def trim_audio_regions(  # pylint: disable=too-many-arguments, too-many-locals
         audio_fragments,
         events,
         delta,
@@ -145,7 +173,7 @@ def trim_audio_regions(  # pylint: disable=too-many-arguments, too-many-locals,
     pbar = progressbar.ProgressBar(widgets=widgets, maxval=len(events)).start()
     try:
         regions = []
-        for audio_fragment in audio_fragments:
+        for i, audio_fragment in enumerate(audio_fragments):
             regions.append(auditok_utils.auditok_gen_speech_regions(
                 audio_fragment,
                 energy_threshold,
@@ -154,47 +182,14 @@ def trim_audio_regions(  # pylint: disable=too-many-arguments, too-many-locals,
                 max_continuous_silence,
                 mode))
             gc.collect(0)
-
-        i = 0
-        for region in regions:
-            if region and events[i].end > events[i].start:
-                if events[i].start > delta:
-                    start_delta = events[i].start - delta
-                else:
-                    start_delta = events[i].start
-                start = 0
-                end = 0
-                speed = len(events[i].text) * 1000 // (events[i].end - events[i].start)
-                if len(region) > 1:
-                    if region[0][1] - region[0][0] <= trim_size:
-                        start = start_delta + region[1][0]
-                    if region[-1][1] - region[-1][0] <= trim_size:
-                        end = start_delta + region[-2][1]
-                if not end:
-                    end = start_delta + region[-1][1]
-                if not start:
-                    start = start_delta + region[0][0]
-                new_speed = len(events[i].text) * 1000 // (end - start)
-                if speed < new_speed:
-                    if speed < max_speed:
-                        events[i].start = start
-                        events[i].end = end
-                    else:
-                        events[i].start = (start + events[i].start) >> 1
-                        events[i].end = (end + events[i].end) >> 1
-            i = i + 1
             pbar.update(i)
 
-        i = 0
-        events_len = len(events)
-        while i < events_len:
-            if i > 0:
-                if events[i].start < events[i - 1].end:
-                    events[i].start = events[i - 1].end
-            if i < events_len - 1:
-                if events[i].end > events[i + 1].start:
-                    events[i].end = events[i + 1].start
-            i = i + 1
+        trim_events_by_regions(
+            events=events,
+            regions=regions,
+            delta=delta,
+            max_speed=max_speed,
+            trim_size=trim_size)
 
         if not is_keep:
             for audio_fragment in audio_fragments:
@@ -206,6 +201,92 @@ def trim_audio_regions(  # pylint: disable=too-many-arguments, too-many-locals,
         pbar.finish()
 
 
+def energy_trim_audio_regions(  # pylint: disable=too-many-arguments
+        energies,
+        events,
+        delta,
+        include_after,
+        max_speed,
+        trim_size=constants.DEFAULT_MIN_REGION_SIZE,
+        energy_threshold=constants.DEFAULT_ENERGY_THRESHOLD,
+        min_region_size=constants.DEFAULT_MIN_REGION_SIZE,
+        max_region_size=constants.DEFAULT_MAX_REGION_SIZE,
+        max_continuous_silence=constants.DEFAULT_CONTINUOUS_SILENCE,
+        mode=auditok.StreamTokenizer.STRICT_MIN_LENGTH):
+    """
+    Give the frame energies of the input audio and trim the events
+    without splitting any audio fragment.
+    """
+    print(_("\nTrimming events by the frame energies."))
+    regions = vad_utils.energies_trim_regions(
+        energies=energies,
+        events=events,
+        include_before=delta,
+        include_after=include_after,
+        energy_threshold=energy_threshold,
+        min_region_size=min_region_size,
+        max_region_size=max_region_size,
+        max_continuous_silence=max_continuous_silence,
+        mode=mode)
+    trim_events_by_regions(
+        events=events,
+        regions=regions,
+        delta=delta,
+        max_speed=max_speed,
+        trim_size=trim_size)
+
+
+def trim_events_by_regions(
+        events,
+        regions,
+        delta,
+        max_speed,
+        trim_size=constants.DEFAULT_MIN_REGION_SIZE):
+    """
+    Give the events and the speech regions inside each event's window
+    and trim the events.
+    """
+    i = 0
+    for region in regions:
+        if region and events[i].end > events[i].start:
+            if events[i].start > delta:
+                start_delta = events[i].start - delta
+            else:
+                start_delta = events[i].start
+            start = 0
+            end = 0
+            speed = len(events[i].text) * 1000 // (events[i].end - events[i].start)
+            if len(region) > 1:
+                if region[0][1] - region[0][0] <= trim_size:
+                    start = start_delta + region[1][0]
+                if region[-1][1] - region[-1][0] <= trim_size:
+                    end = start_delta + region[-2][1]
+            if not end:
+                end = start_delta + region[-1][1]
+            if not start:
+                start = start_delta + region[0][0]
+            new_speed = len(events[i].text) * 1000 // (end - start)
+            if speed < new_speed:
+                if speed < max_speed:
+                    events[i].start = start
+                    events[i].end = end
+                else:
+                    events[i].start = (start + events[i].start) >> 1
+                    events[i].end = (end + events[i].end) >> 1
+        i = i + 1
+
+    i = 0
+    events_len = len(events)
+    while i < events_len:
+        if i > 0:
+            if events[i].start < events[i - 1].end:
+                events[i].start = events[i - 1].end
+        if i < events_len - 1:
+            if events[i].end > events[i + 1].start:
+                events[i].end = events[i + 1].start
+        i = i + 1
+
+
 def bulk_audio_conversion(  # pylint: disable=too-many-arguments, too-many-locals
         source_file,
         regions,
@@ -260,6 +341,284 @@ def bulk_audio_conversion(  # pylint: disable=too-many-arguments, too-many-local
     return audio_fragments
 
 
+def bulk_pcm_conversion(  # pylint: disable=too-many-arguments, too-many-locals
+        source_file,
+        regions,
+        conversion_cmd,
+        encode_cmd,
+        suffix,
+        channel,
+        sample_rate,
+        concurrency=constants.DEFAULT_CONCURRENCY,
+        output=None,
+        is_keep=False,
+        include_before=0.0,
+        include_after=0.0):
+    """
+    Give an input audio/video file, decode it only once
+    and generate short-term audio fragments from the in-memory pcm data.
+    """
+
+    if not regions:
+        return None
+
+    print(_("\nDecoding source file to in-memory pcm data "
+            "to split speech regions."))
+    shared_buffer = ffmpeg_utils.share_pcm_buffer(
+        ffmpeg_utils.ffmpeg_decode_pcm(
+            input_=source_file,
+            conversion_cmd=conversion_cmd,
+            channel=channel,
+            sample_rate=sample_rate))
+
+    pool = multiprocessing.Pool(
+        concurrency,
+        initializer=ffmpeg_utils.init_pcm_source,
+        initargs=(shared_buffer, sample_rate, channel))
+
+    converter = ffmpeg_utils.SplitPCMIntoAudioPiece(
+        cmd=encode_cmd,
+        suffix=suffix,
+        output=output,
+        is_keep=is_keep,
+        include_before=include_before,
+        include_after=include_after)
+
+    print(_("\nConverting speech regions to short-term fragments."))
+    widgets = [_("Converting: "),
+               progressbar.Percentage(), ' ',
+               progressbar.Bar(), ' ',
+               progressbar.ETA()]
+    pbar = progressbar.ProgressBar(widgets=widgets, maxval=len(regions)).start()
+    try:
+        audio_fragments = []
+        for i, audio_fragment in enumerate(pool.imap(converter, regions)):
+            if audio_fragment:
+                audio_fragments.append(audio_fragment)
+            pbar.update(i)
+            gc.collect(0)
+
+    except KeyboardInterrupt:
+        return None
+
+    finally:
+        pbar.finish()
+        pool.terminate()
+        pool.join()
+        del shared_buffer
+        gc.collect(0)
+
+    return audio_fragments
+
+
+def bulk_segment_conversion(  # pylint: disable=too-many-arguments, too-many-locals
+        source_file,
+        regions,
+        segment_cmd,
+        output_cmd,
+        suffix,
+        concurrency=constants.DEFAULT_CONCURRENCY,
+        output=None,
+        is_keep=False,
+        include_before=0.0,
+        include_after=0.0,
+        segments_per_cmd=constants.DEFAULT_SEGMENTS_PER_CMD):
+    """
+    Give an input audio/video file and generate short-term audio fragments
+    by one ffmpeg command per batch of regions.
+    """
+
+    if not regions:
+        return None
+
+    batches = [regions[i:i + segments_per_cmd]
+               for i in range(0, len(regions), segments_per_cmd)]
+
+    pool = multiprocessing.Pool(concurrency)
+
+    converter = ffmpeg_utils.SplitIntoAudioSegments(
+        source_path=source_file,
+        cmd=segment_cmd,
+        output_cmd=output_cmd,
+        suffix=suffix,
+        output=output,
+        is_keep=is_keep,
+        include_before=include_before,
+        include_after=include_after)
+
+    print(_("\nConverting speech regions to short-term fragments."))
+    widgets = [_("Converting: "),
+               progressbar.Percentage(), ' ',
+               progressbar.Bar(), ' ',
+               progressbar.ETA()]
+    pbar = progressbar.ProgressBar(widgets=widgets, maxval=len(regions)).start()
+    try:
+        audio_fragments = []
+        region_count = 0
+        for audio_fragment_list in pool.imap(converter, batches):
+            for audio_fragment in audio_fragment_list:
+                if audio_fragment:
+                    audio_fragments.append(audio_fragment)
+            region_count = region_count + len(audio_fragment_list)
+            pbar.update(region_count)
+            gc.collect(0)
+        pbar.finish()
+        pool.terminate()
+        pool.join()
+
+    except KeyboardInterrupt:
+        pbar.finish()
+        pool.terminate()
+        pool.join()
+        return None
+    return audio_fragments
+
+
+def get_fragment_count(
+        audio_fragments,
+        journal=None):
+    """
+    Give audio fragments and return their count
+    or an unknown length if they are still being generated.
+    """
+    if journal:
+        # the results in the journal are counted too
+        return len(journal.regions)
+    if isinstance(audio_fragments, (list, tuple)):
+        return len(audio_fragments)
+    return progressbar.UnknownLength
+
+
+def get_result_recorder(journal=None):
+    """
+    Give the journal and return the callback recording every new result
+    as soon as it completes or None if there isn't a journal.
+    """
+    if journal:
+        return journal.record_missing_result
+    return None
+
+
+def merge_journal_results(
+        results,
+        journal=None):
+    """
+    Give the results of the audio fragments
+    and return the results of all the regions in order
+    including the ones recorded in the journal.
+    """
+    if journal:
+        return journal.merge_results(results)
+    return results
+
+
+def record_iterable(
+        iterable,
+        record_list):
+    """
+    Give an iterable and yield its items
+    while appending them to the record list.
+    """
+    for item in iterable:
+        record_list.append(item)
+        yield item
+
+
+class TextList(list):
+    """
+    Class for a text list which reports every appended text
+    with its index to a callback.
+    """
+    def __init__(self, on_append=None):
+        super().__init__()
+        self.on_append = on_append
+
+    def append(self, text):
+        super().append(text)
+        if self.on_append:
+            self.on_append(len(self) - 1, text)
+
+
+def peek_iterable(iterable):
+    """
+    Give an iterable and return its first item
+    and an iterator still yielding all the items.
+    """
+    iterator = iter(iterable)
+    try:
+        first_item = next(iterator)
+    except StopIteration:
+        return None, iter(())
+    return first_item, itertools.chain((first_item,), iterator)
+
+
+def iter_batches(
+        iterable,
+        batch_size):
+    """
+    Give an iterable and yield lists of at most batch_size items.
+    """
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def iter_audio_conversion(  # pylint: disable=too-many-arguments
+        converter,
+        regions,
+        concurrency=constants.DEFAULT_CONCURRENCY,
+        initializer=None,
+        initargs=(),
+        batch_size=0):
+    """
+    Give a converter and an iterable of regions
+    and yield every region with its short-term audio fragment in order
+    as soon as it is converted.
+    None is the fragment of a region failed to convert.
+    No more than twice the concurrency of the regions or batches
+    are taken from the iterable ahead of the next one to yield.
+    """
+    if batch_size:
+        iterator = iter_batches(regions, batch_size)
+    else:
+        iterator = iter(regions)
+    pool = None
+    try:
+        pool = multiprocessing.Pool(
+            concurrency,
+            initializer=initializer,
+            initargs=initargs)
+        in_flight = collections.deque()
+        is_exhausted = False
+        while True:
+            while not is_exhausted and len(in_flight) < 2 * concurrency:
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    is_exhausted = True
+                    break
+                in_flight.append((item, pool.apply_async(converter, (item,))))
+            if not in_flight:
+                break
+            item, async_result = in_flight.popleft()
+            if batch_size:
+                region_fragments = zip(item, async_result.get())
+            else:
+                region_fragments = [(item, async_result.get())]
+            for region_fragment in region_fragments:
+                yield region_fragment
+            gc.collect(0)
+    finally:
+        if pool:
+            pool.terminate()
+            pool.join()
+
+
 def gsv2_to_text(  # pylint: disable=too-many-locals,too-many-arguments,too-many-branches,too-many-statements
         audio_fragments,
         api_url,
@@ -267,31 +626,49 @@ def gsv2_to_text(  # pylint: disable=too-many-locals,too-many-arguments,too-many
         concurrency=constants.DEFAULT_CONCURRENCY,
         min_confidence=0.0,
         is_keep=False,
-        result_list=None):
+        result_list=None,
+        speech_engine="process",
+        transcript_cache=None,
+        journal=None,
+        controller=None,
+        retry_policy=None,
+        hedger=None,
+        credential_pool=None,
+        schedule="timeline",
+        on_text=None,
+        regions=None):
     """
     Give a list of short-term audio fragment files
     and generate text_list from Google speech-to-text V2 api.
     """
-    text_list = []
-    pool = multiprocessing.Pool(concurrency)
+    text_list = TextList(on_text)
+    pool = net_utils.get_speech_pool(concurrency, speech_engine, hedger)
 
     recognizer = api_google.GoogleSpeechV2(
         api_url=api_url,
         headers=headers,
         min_confidence=min_confidence,
         is_keep=is_keep,
-        is_full_result=result_list is not None)
+        is_full_result=result_list is not None,
+        transcript_cache=transcript_cache,
+        retry_policy=retry_policy,
+        credential_pool=credential_pool)
 
     print(_("\nSending short-term fragments to Google Speech V2 API and getting result."))
     widgets = [_("Speech-to-Text: "),
                progressbar.Percentage(), ' ',
                progressbar.Bar(), ' ',
                progressbar.ETA()]
-    pbar = progressbar.ProgressBar(widgets=widgets, maxval=len(audio_fragments)).start()
+    fragment_count = get_fragment_count(audio_fragments, journal)
+    pbar = progressbar.ProgressBar(widgets=widgets, maxval=fragment_count).start()
     try:
         # get transcript
         if result_list is None:
-            for i, transcript in enumerate(pool.imap(recognizer, audio_fragments)):
+            for i, transcript in enumerate(merge_journal_results(
+                    net_utils.speech_imap(
+                        pool, recognizer, audio_fragments,
+                        controller, hedger, schedule,
+                        get_result_recorder(journal), regions), journal)):
                 if transcript:
                     text_list.append(transcript)
                 else:
@@ -300,7 +677,11 @@ def gsv2_to_text(  # pylint: disable=too-many-locals,too-many-arguments,too-many
                 pbar.update(i)
         # get full result and transcript
         else:
-            for i, result in enumerate(pool.imap(recognizer, audio_fragments)):
+            for i, result in enumerate(merge_journal_results(
+                    net_utils.speech_imap(
+                        pool, recognizer, audio_fragments,
+                        controller, hedger, schedule,
+                        get_result_recorder(journal), regions), journal)):
                 if result:
                     result_list.append(result)
                     transcript = \
@@ -314,7 +695,8 @@ def gsv2_to_text(  # pylint: disable=too-many-locals,too-many-arguments,too-many
                 gc.collect(0)
                 pbar.update(i)
         pbar.finish()
-        pool.terminate()
+        # the workers exit by themselves to write their cache lookups
+        pool.close()
         pool.join()
 
     except (KeyboardInterrupt, AttributeError) as error:
@@ -341,14 +723,32 @@ def gcsv1_to_text(  # pylint: disable=too-many-locals,too-many-arguments,too-man
         src_language=constants.DEFAULT_SRC_LANGUAGE,
         min_confidence=0.0,
         is_keep=False,
-        result_list=None):
+        result_list=None,
+        speech_engine="process",
+        transcript_cache=None,
+        journal=None,
+        controller=None,
+        retry_policy=None,
+        hedger=None,
+        credential_pool=None,
+        schedule="timeline",
+        on_text=None,
+        regions=None):
     """
     Give a list of short-term audio fragment files
     and generate text_list from Google cloud speech-to-text V1P1Beta1 api.
     """
 
-    text_list = []
-    pool = multiprocessing.Pool(concurrency)
+    text_list = TextList(on_text)
+    fragment_count = get_fragment_count(audio_fragments, journal)
+    # the encoding is decided by the first fragment
+    first_fragment, audio_fragments = peek_iterable(audio_fragments)
+    if not first_fragment:
+        if not journal:
+            return text_list
+        # every result is in the journal
+        first_fragment = ""
+    pool = net_utils.get_speech_pool(concurrency, speech_engine, hedger)
 
     print(_("\nSending short-term fragments to Google Cloud Speech V1P1Beta1 API"
             " and getting result."))
@@ -356,7 +756,7 @@ def gcsv1_to_text(  # pylint: disable=too-many-locals,too-many-arguments,too-man
                progressbar.Percentage(), ' ',
                progressbar.Bar(), ' ',
                progressbar.ETA()]
-    pbar = progressbar.ProgressBar(widgets=widgets, maxval=len(audio_fragments)).start()
+    pbar = progressbar.ProgressBar(widgets=widgets, maxval=fragment_count).start()
 
     try:
         if api_url:
@@ -369,7 +769,7 @@ def gcsv1_to_text(  # pylint: disable=too-many-locals,too-many-arguments,too-man
                     config["language_code"] = src_language
             else:
                 config = {
-                    "encoding": api_google.google_ext_to_enc(audio_fragments[0]),
+                    "encoding": api_google.google_ext_to_enc(first_fragment),
                     "sampleRateHertz": sample_rate,
                     "languageCode": src_language}
 
@@ -379,11 +779,18 @@ def gcsv1_to_text(  # pylint: disable=too-many-locals,too-many-arguments,too-man
                 headers=headers,
                 min_confidence=min_confidence,
                 is_keep=is_keep,
-                is_full_result=result_list is not None)
+                is_full_result=result_list is not None,
+                transcript_cache=transcript_cache,
+                retry_policy=retry_policy,
+                credential_pool=credential_pool)
 
             # get transcript
             if result_list is None:
-                for i, transcript in enumerate(pool.imap(recognizer, audio_fragments)):
+                for i, transcript in enumerate(merge_journal_results(
+                        net_utils.speech_imap(
+                            pool, recognizer, audio_fragments,
+                            controller, hedger, schedule,
+                            get_result_recorder(journal), regions), journal)):
                     if transcript:
                         text_list.append(transcript)
                     else:
@@ -391,7 +798,11 @@ def gcsv1_to_text(  # pylint: disable=too-many-locals,too-many-arguments,too-man
                     pbar.update(i)
             # get full result and transcript
             else:
-                for i, result in enumerate(pool.imap(recognizer, audio_fragments)):
+                for i, result in enumerate(merge_journal_results(
+                        net_utils.speech_imap(
+                            pool, recognizer, audio_fragments,
+                            controller, hedger, schedule,
+                            get_result_recorder(journal), regions), journal)):
                     if result:
                         result_list.append(result)
                         transcript = api_google.get_gcsv1p1beta1_transcript(
@@ -410,42 +821,47 @@ def gcsv1_to_text(  # pylint: disable=too-many-locals,too-many-arguments,too-man
             if config:
                 # Use the fixed arguments
                 config["encoding"] = api_google.google_ext_to_enc(
-                    extension=audio_fragments[0],
+                    extension=first_fragment,
                     is_string=False
                 )
                 config["language_code"] = src_language
             else:
                 config = {
                     "encoding": api_google.google_ext_to_enc(
-                        extension=audio_fragments[0],
+                        extension=first_fragment,
                         is_string=False),
                     "sample_rate_hertz": sample_rate,
                     "language_code": src_language}
 
-            i = 0
-            tasks = []
-            for filename in audio_fragments:
-                # google cloud speech-to-text client can't use multiprocessing.pool
-                # based on class call, otherwise will receive pickling error
-                tasks.append(pool.apply_async(
-                    api_google.gcsv1p1beta1_service_client,
-                    args=(filename, is_keep, config, min_confidence,
-                          result_list is not None)))
-                gc.collect(0)
+            # google cloud speech-to-text client can't use multiprocessing.pool
+            # based on class call, otherwise will receive pickling error
+            # so every worker creates and reuses its own client
+            recognizer = functools.partial(
+                api_google.gcsv1p1beta1_service_client,
+                is_keep=is_keep,
+                config=config,
+                min_confidence=min_confidence,
+                is_full_result=result_list is not None,
+                transcript_cache=transcript_cache,
+                retry_policy=retry_policy)
 
             if result_list is None:
-                for task in tasks:
-                    i = i + 1
-                    transcript = task.get()
+                for i, transcript in enumerate(merge_journal_results(
+                        net_utils.speech_imap(
+                            pool, recognizer, audio_fragments,
+                            controller, hedger, schedule,
+                            get_result_recorder(journal), regions), journal)):
                     if transcript:
                         text_list.append(transcript)
                     else:
                         text_list.append("")
                     pbar.update(i)
             else:
-                for task in tasks:
-                    i = i + 1
-                    result = task.get()
+                for i, result in enumerate(merge_journal_results(
+                        net_utils.speech_imap(
+                            pool, recognizer, audio_fragments,
+                            controller, hedger, schedule,
+                            get_result_recorder(journal), regions), journal)):
                     result_list.append(result)
                     transcript = api_google.get_gcsv1p1beta1_transcript(
                         min_confidence,
@@ -457,7 +873,8 @@ def gcsv1_to_text(  # pylint: disable=too-many-locals,too-many-arguments,too-man
                     pbar.update(i)
 
         pbar.finish()
-        pool.terminate()
+        # the workers exit by themselves to write their cache lookups
+        pool.close()
         pool.join()
 
     except (KeyboardInterrupt, AttributeError) as error:
@@ -488,13 +905,23 @@ def xfyun_to_text(  # pylint: disable=too-many-locals, too-many-arguments,
         config,
         concurrency=constants.DEFAULT_CONCURRENCY,
         is_keep=False,
-        result_list=None):
+        result_list=None,
+        speech_engine="process",
+        transcript_cache=None,
+        journal=None,
+        controller=None,
+        retry_policy=None,
+        hedger=None,
+        credential_pool=None,
+        schedule="timeline",
+        on_text=None,
+        regions=None):
     """
     Give a list of short-term audio fragment files
     and generate text_list from Google cloud speech-to-text V1P1Beta1 api.
     """
 
-    text_list = []
+    text_list = TextList(on_text)
 
     if "api_address" in config:
         api_address = config["api_address"]
@@ -506,7 +933,18 @@ def xfyun_to_text(  # pylint: disable=too-many-locals, too-many-arguments,
     else:
         delete_chars = None
 
-    pool = multiprocessing.Pool(concurrency)
+    frame_size = config.get("frame_size", constants.XFYUN_FRAME_SIZE)
+    send_interval = config.get("send_interval", constants.XFYUN_SEND_INTERVAL)
+    # the websockets client doesn't connect through a proxy
+    is_async = speech_engine == "thread" and not (
+        credential_pool and any(credential.get("proxy")
+                                for credential in credential_pool.credentials))
+
+    fragment_count = get_fragment_count(audio_fragments, journal)
+    # fragments to delete after being sent
+    sent_fragments = []
+    audio_fragments = record_iterable(audio_fragments, sent_fragments)
+    pool = net_utils.get_speech_pool(concurrency, speech_engine, hedger)
 
     print(_("\nSending short-term fragments to Xun Fei Yun WebSocket API"
             " and getting result."))
@@ -514,7 +952,7 @@ def xfyun_to_text(  # pylint: disable=too-many-locals, too-many-arguments,
                progressbar.Percentage(), ' ',
                progressbar.Bar(), ' ',
                progressbar.ETA()]
-    pbar = progressbar.ProgressBar(widgets=widgets, maxval=len(audio_fragments)).start()
+    pbar = progressbar.ProgressBar(widgets=widgets, maxval=fragment_count).start()
 
     try:
         recognizer = api_xfyun.XfyunWebSocketAPI(
@@ -524,11 +962,21 @@ def xfyun_to_text(  # pylint: disable=too-many-locals, too-many-arguments,
             api_address=api_address,
             business_args=config["business"],
             is_full_result=result_list is not None,
-            delete_chars=delete_chars)
+            delete_chars=delete_chars,
+            transcript_cache=transcript_cache,
+            retry_policy=retry_policy,
+            credential_pool=credential_pool,
+            frame_size=frame_size,
+            send_interval=send_interval,
+            is_async=is_async)
 
         # get transcript
         if result_list is None:
-            for i, transcript in enumerate(pool.imap(recognizer, audio_fragments)):
+            for i, transcript in enumerate(merge_journal_results(
+                    net_utils.speech_imap(
+                        pool, recognizer, audio_fragments,
+                        controller, hedger, schedule,
+                        get_result_recorder(journal), regions), journal)):
                 if transcript:
                     text_list.append(transcript)
                 else:
@@ -536,7 +984,11 @@ def xfyun_to_text(  # pylint: disable=too-many-locals, too-many-arguments,
                 pbar.update(i)
         # get full result and transcript
         else:
-            for i, result in enumerate(pool.imap(recognizer, audio_fragments)):
+            for i, result in enumerate(merge_journal_results(
+                    net_utils.speech_imap(
+                        pool, recognizer, audio_fragments,
+                        controller, hedger, schedule,
+                        get_result_recorder(journal), regions), journal)):
                 if result:
                     result_list.append(result)
                     transcript = ""
@@ -553,17 +1005,18 @@ def xfyun_to_text(  # pylint: disable=too-many-locals, too-many-arguments,
                 text_list.append("")
                 pbar.update(i)
 
-        if not is_keep:
-            for audio_fragment in audio_fragments:
-                os.remove(audio_fragment)
-
         pbar.finish()
-        pool.terminate()
+        # the workers exit by themselves to write their cache lookups
+        pool.close()
         pool.join()
 
+        if not is_keep:
+            for audio_fragment in sent_fragments:
+                os.remove(audio_fragment)
+
     except (KeyboardInterrupt, AttributeError) as error:
         if not is_keep:
-            for audio_fragment in audio_fragments:
+            for audio_fragment in sent_fragments:
                 os.remove(audio_fragment)
         pbar.finish()
         pool.terminate()
@@ -577,7 +1030,7 @@ def xfyun_to_text(  # pylint: disable=too-many-locals, too-many-arguments,
 
     except exceptions.SpeechToTextException as err_msg:
         if not is_keep:
-            for audio_fragment in audio_fragments:
+            for audio_fragment in sent_fragments:
                 os.remove(audio_fragment)
         pbar.finish()
         pool.terminate()
@@ -595,13 +1048,23 @@ def baidu_to_text(  # pylint: disable=too-many-locals, too-many-arguments,
         config,
         concurrency=constants.DEFAULT_CONCURRENCY,
         is_keep=False,
-        result_list=None):
+        result_list=None,
+        speech_engine="process",
+        transcript_cache=None,
+        journal=None,
+        controller=None,
+        retry_policy=None,
+        hedger=None,
+        credential_pool=None,
+        schedule="timeline",
+        on_text=None,
+        regions=None):
     """
     Give a list of short-term audio fragment files
     and generate text_list from Google cloud speech-to-text V1P1Beta1 api.
     """
 
-    text_list = []
+    text_list = TextList(on_text)
 
     if config["config"]["dev_pid"] == 80001:
         # pro edition of baidu asr
@@ -618,27 +1081,43 @@ def baidu_to_text(  # pylint: disable=too-many-locals, too-many-arguments,
     else:
         delete_chars = None
 
+    if retry_policy:
+        token_timeout = (retry_policy.connect_timeout, retry_policy.read_timeout)
+    else:
+        token_timeout = (constants.DEFAULT_CONNECT_TIMEOUT, constants.DEFAULT_READ_TIMEOUT)
+
     try:
         if "token" not in config["config"]:
-            print(_("Get the token online."))
+            print(_("Get the token from the token cache or online."))
             config["config"]["token"] = \
-                api_baidu.get_baidu_token(api_secret=config["api_secret"],
-                                          api_key=config["api_key"])
+                api_baidu.get_cached_baidu_token(api_secret=config["api_secret"],
+                                                 api_key=config["api_key"],
+                                                 timeout=token_timeout)
         else:
             print(_("Use the token from the config."))
+        if credential_pool:
+            for credential in credential_pool.credentials:
+                if "token" not in credential:
+                    credential["token"] = \
+                        api_baidu.get_cached_baidu_token(
+                            api_secret=credential["api_secret"],
+                            api_key=credential["api_key"],
+                            timeout=token_timeout,
+                            proxies=net_utils.get_proxies(credential.get("proxy")))
 
     except exceptions.SpeechToTextException as err_msg:
         print(_("Failed to get the token. Error message:"))
         print(err_msg)
         return None
 
-    pool = multiprocessing.Pool(concurrency)
+    pool = net_utils.get_speech_pool(concurrency, speech_engine, hedger)
 
     widgets = [_("Speech-to-Text: "),
                progressbar.Percentage(), ' ',
                progressbar.Bar(), ' ',
                progressbar.ETA()]
-    pbar = progressbar.ProgressBar(widgets=widgets, maxval=len(audio_fragments)).start()
+    fragment_count = get_fragment_count(audio_fragments, journal)
+    pbar = progressbar.ProgressBar(widgets=widgets, maxval=fragment_count).start()
 
     try:
         recognizer = api_baidu.BaiduASRAPI(
@@ -646,11 +1125,20 @@ def baidu_to_text(  # pylint: disable=too-many-locals, too-many-arguments,
             api_url=api_url,
             is_keep=is_keep,
             is_full_result=result_list is not None,
-            delete_chars=delete_chars)
+            delete_chars=delete_chars,
+            transcript_cache=transcript_cache,
+            retry_policy=retry_policy,
+            credential_pool=credential_pool,
+            api_key=config.get("api_key"),
+            api_secret=config.get("api_secret"))
 
         # get transcript
         if result_list is None:
-            for i, transcript in enumerate(pool.imap(recognizer, audio_fragments)):
+            for i, transcript in enumerate(merge_journal_results(
+                    net_utils.speech_imap(
+                        pool, recognizer, audio_fragments,
+                        controller, hedger, schedule,
+                        get_result_recorder(journal), regions), journal)):
                 if transcript:
                     text_list.append(transcript)
                 else:
@@ -658,7 +1146,11 @@ def baidu_to_text(  # pylint: disable=too-many-locals, too-many-arguments,
                 pbar.update(i)
         # get full result and transcript
         else:
-            for i, result in enumerate(pool.imap(recognizer, audio_fragments)):
+            for i, result in enumerate(merge_journal_results(
+                    net_utils.speech_imap(
+                        pool, recognizer, audio_fragments,
+                        controller, hedger, schedule,
+                        get_result_recorder(journal), regions), journal)):
                 if result:
                     result_list.append(result)
                     transcript = api_baidu.get_baidu_transcript(
@@ -672,7 +1164,8 @@ def baidu_to_text(  # pylint: disable=too-many-locals, too-many-arguments,
                 text_list.append("")
                 pbar.update(i)
         pbar.finish()
-        pool.terminate()
+        # the workers exit by themselves to write their cache lookups
+        pool.close()
         pool.join()
 
     except (KeyboardInterrupt, AttributeError) as error:
@@ -705,7 +1198,8 @@ def list_to_googletrans(  # pylint: disable=too-many-locals, too-many-arguments,
         size_per_trans=constants.DEFAULT_SIZE_PER_TRANS,
         sleep_seconds=constants.DEFAULT_SLEEP_SECONDS,
         drop_override_codes=False,
-        delete_chars=None):
+        delete_chars=None,
+        rate_limiter=None):
     """
     Give a text list, generate translated text list from GoogleTranslatorV2 api.
     """
@@ -769,6 +1263,8 @@ def list_to_googletrans(  # pylint: disable=too-many-locals, too-many-arguments,
 
     if translator != ManualTranslator and src_language == "auto":
         content_to_trans = '\n'.join(text_list[i:partial_index[0]])
+        if rate_limiter:
+            rate_limiter.acquire()
         result_src = translator.detect(content_to_trans).lang
     else:
         result_src = src_language
@@ -793,6 +1289,8 @@ def list_to_googletrans(  # pylint: disable=too-many-locals, too-many-arguments,
             content_to_trans = '\n'.join(text_list[i:index])
             if drop_override_codes:
                 content_to_trans = "".join(re.compile(r'{.*?}').split(content_to_trans))
+            if rate_limiter:
+                rate_limiter.acquire()
             translation = translator.translate(text=content_to_trans,
                                                dest=dst_language,
                                                src=src_language)
@@ -10,6 +10,8 @@ import re
 import os
 import sys
 import gettext
+import wave
+import multiprocessing
 
 # Import third-party modules
 
@@ -99,6 +101,370 @@ class SplitIntoAudioPiece:  # pylint: disable=too-few-public-methods
                   "Check your audio processing options.")) from ffmpeg_exec_error
 
 
+def ffmpeg_pipe_to_buffer(
+        command,
+        chunk_size=1 << 20):
+    """
+    Run an ffmpeg command whose output is the stdout pipe
+    and read the raw audio data into an in-process buffer.
+    """
+    audio_buffer = bytearray()
+    with tempfile.TemporaryFile() as err_file:
+        prcs = subprocess.Popen(constants.cmd_conversion(command),
+                                stdin=open(os.devnull),
+                                stdout=subprocess.PIPE,
+                                stderr=err_file)
+        try:
+            while True:
+                chunk = prcs.stdout.read(chunk_size)
+                if not chunk:
+                    break
+                audio_buffer += chunk
+        finally:
+            prcs.stdout.close()
+            prcs.wait()
+        err_file.seek(0)
+        err = err_file.read()
+
+    if err:
+        print(err.decode(sys.stdout.encoding))
+
+    if prcs.returncode != 0 or not audio_buffer:
+        raise exceptions.ConversionException(
+            _("Error: ffmpeg can't decode your file. "
+              "Check your audio processing options."))
+
+    return audio_buffer
+
+
+PCM_OUTPUT_PATTERN = re.compile(r"([\"']?)\{out_\}\1")
+# The output placeholder of a conversion command with or without quotes
+
+
+def ffmpeg_decode_pcm(
+        input_,
+        conversion_cmd,
+        channel,
+        sample_rate):
+    """
+    Give an audio conversion command and decode the input
+    into an in-memory s16le pcm buffer through the ffmpeg stdout pipe.
+    """
+    command = get_pcm_decode_cmd(
+        input_=input_,
+        conversion_cmd=conversion_cmd,
+        channel=channel,
+        sample_rate=sample_rate)
+    print(command)
+    return ffmpeg_pipe_to_buffer(command)
+
+
+def get_pcm_decode_cmd(
+        input_,
+        conversion_cmd,
+        channel,
+        sample_rate):
+    """
+    Give an audio conversion command
+    and return the command decoding the input to the stdout pipe.
+    """
+    # the output goes to the stdout pipe whether it is quoted or not
+    command, count = PCM_OUTPUT_PATTERN.subn("-f s16le -", conversion_cmd)
+    if not count:
+        command = command + " -f s16le -"
+    return command.format(
+        in_=input_,
+        channel=channel,
+        sample_rate=sample_rate)
+
+
+def iter_pcm_regions(  # pylint: disable=too-many-arguments, too-many-locals
+        input_,
+        conversion_cmd,
+        regions,
+        channel,
+        sample_rate,
+        chunk_size=1 << 20):
+    """
+    Give an audio conversion command and an iterable of regions in time order,
+    decode the input through the ffmpeg stdout pipe
+    and yield every region with its s16le pcm data as soon as it is decoded.
+    Only the pcm data from the current region on is kept in memory.
+    """
+    command = get_pcm_decode_cmd(
+        input_=input_,
+        conversion_cmd=conversion_cmd,
+        channel=channel,
+        sample_rate=sample_rate)
+    print(command)
+    frame_width = 2 * channel
+    audio_buffer = bytearray()
+    # the byte position of the buffer in the decoded audio
+    offset = 0
+    is_eof = False
+    with tempfile.TemporaryFile() as err_file:
+        prcs = subprocess.Popen(constants.cmd_conversion(command),
+                                stdin=open(os.devnull),
+                                stdout=subprocess.PIPE,
+                                stderr=err_file)
+        try:
+            for region in regions:
+                start_ms, end_ms = region
+                start_byte = int(float(start_ms) / 1000.0 * sample_rate) * frame_width
+                end_byte = int(float(end_ms) / 1000.0 * sample_rate) * frame_width
+                while not is_eof and offset + len(audio_buffer) < end_byte:
+                    chunk = prcs.stdout.read(chunk_size)
+                    if not chunk:
+                        is_eof = True
+                        break
+                    audio_buffer += chunk
+                if start_byte > offset:
+                    # the regions after this one start no earlier
+                    del audio_buffer[:start_byte - offset]
+                    offset = start_byte
+                yield region, bytes(audio_buffer[start_byte - offset:end_byte - offset])
+        finally:
+            prcs.stdout.close()
+            if not is_eof:
+                # the audio after the last region isn't needed
+                prcs.terminate()
+            prcs.wait()
+        err_file.seek(0)
+        err = err_file.read()
+
+    if err:
+        print(err.decode(sys.stdout.encoding))
+
+    if is_eof and (prcs.returncode != 0 or not offset + len(audio_buffer)):
+        raise exceptions.ConversionException(
+            _("Error: ffmpeg can't decode your file. "
+              "Check your audio processing options."))
+
+
+PCM_SOURCE = {}
+# Decoded source audio shared with the worker processes.
+
+
+def share_pcm_buffer(audio_buffer):
+    """
+    Give the decoded audio data and copy it into a shared memory array
+    which can be passed to the worker processes without pickling.
+    """
+    shared_buffer = multiprocessing.RawArray("B", len(audio_buffer))
+    memoryview(shared_buffer).cast("B")[:] = audio_buffer
+    return shared_buffer
+
+
+def init_pcm_source(
+        shared_buffer,
+        sample_rate,
+        channel):
+    """
+    Pool initializer to share the decoded source audio with a worker process.
+    The shared buffer is None if the pcm data comes with every region.
+    """
+    if shared_buffer is not None:
+        PCM_SOURCE["buffer"] = memoryview(shared_buffer).cast("B")
+    else:
+        PCM_SOURCE["buffer"] = None
+    PCM_SOURCE["sample_rate"] = sample_rate
+    PCM_SOURCE["channel"] = channel
+
+
+class SplitPCMIntoAudioPiece:  # pylint: disable=too-few-public-methods
+    """
+    Class for cutting a region from the decoded source audio
+    and encoding it into a short-term audio file.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+            self,
+            output,
+            is_keep,
+            cmd,
+            suffix,
+            include_before=0.0,
+            include_after=0.0):
+        self.cmd = cmd
+        self.suffix = suffix
+        self.is_keep = is_keep
+        self.include_before = include_before
+        self.include_after = include_after
+        self.output = output
+
+    def encode(self, audio_data, filename):
+        """
+        Encode raw s16le audio data into the file.
+        Return whether the encoding succeeded.
+        """
+        if self.suffix == ".pcm":
+            with open(filename, mode="wb") as audio_file:
+                audio_file.write(audio_data)
+            return True
+
+        if self.suffix == ".wav":
+            writer = wave.open(filename, "wb")
+            writer.setnchannels(PCM_SOURCE["channel"])
+            writer.setsampwidth(2)
+            writer.setframerate(PCM_SOURCE["sample_rate"])
+            writer.writeframes(audio_data)
+            writer.close()
+            return True
+
+        command = self.cmd.format(sample_rate=PCM_SOURCE["sample_rate"],
+                                  channel=PCM_SOURCE["channel"],
+                                  out_=filename)
+        prcs = subprocess.Popen(constants.cmd_conversion(command),
+                                stdin=subprocess.PIPE,
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE)
+        err = prcs.communicate(input=audio_data)[1]
+        return not err
+
+    def cut(self, region):
+        """
+        Give a region and return its start and end seconds
+        and its pcm data cut from the decoded source audio.
+        """
+        start_ms, end_ms = region
+        start = float(start_ms) / 1000.0
+        end = float(end_ms) / 1000.0
+        if start > self.include_before:
+            start = start - self.include_before
+        end += self.include_after
+
+        frame_width = 2 * PCM_SOURCE["channel"]
+        start_byte = int(start * PCM_SOURCE["sample_rate"]) * frame_width
+        end_byte = int(end * PCM_SOURCE["sample_rate"]) * frame_width
+        return start, end, bytes(PCM_SOURCE["buffer"][start_byte:end_byte])
+
+    def __call__(self, region):
+        try:
+            start, end, audio_data = self.cut(region)
+
+            if not self.is_keep or not self.output:
+                temp = tempfile.NamedTemporaryFile(suffix=self.suffix, delete=False)
+                temp.close()
+                self.encode(audio_data, temp.name)
+                return temp.name
+
+            filename = self.output \
+                + "-{start:0>8.3f}-{end:0>8.3f}{suffix}".format(
+                    start=start,
+                    end=end,
+                    suffix=self.suffix)
+            if not self.encode(audio_data, filename):
+                return None
+            if os.path.getsize(filename) <= 4:
+                return None
+            return filename
+
+        except KeyboardInterrupt:
+            return None
+
+        except OSError as ffmpeg_exec_error:
+            raise exceptions.AutosubException(
+                _("Error: ffmpeg can't split your file. "
+                  "Check your audio processing options.")) from ffmpeg_exec_error
+
+
+class EncodePCMAudioPiece(SplitPCMIntoAudioPiece):  # pylint: disable=too-few-public-methods
+    """
+    Class for encoding a region decoded by iter_pcm_regions
+    with its pcm data into a short-term audio file.
+    """
+
+    def cut(self, region):
+        (start_ms, end_ms), audio_data = region
+        return float(start_ms) / 1000.0, float(end_ms) / 1000.0, audio_data
+
+
+class SplitIntoAudioSegments:  # pylint: disable=too-few-public-methods
+    """
+    Class for converting a batch of regions of an input audio or video file
+    into short-term audio files by a single ffmpeg command.
+    Every region is an input of its own seeked to the region
+    so only the regions are decoded.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+            self,
+            source_path,
+            output,
+            is_keep,
+            cmd,
+            output_cmd,
+            suffix,
+            include_before=0.0,
+            include_after=0.0,
+            input_cmd=constants.DEFAULT_AUDIO_SEGMENT_INPUT):
+        self.source_path = source_path
+        self.cmd = cmd
+        self.input_cmd = input_cmd
+        self.output_cmd = output_cmd
+        self.suffix = suffix
+        self.is_keep = is_keep
+        self.include_before = include_before
+        self.include_after = include_after
+        self.output = output
+
+    def __call__(self, regions):  # pylint: disable=too-many-locals
+        try:
+            times = []
+            for start_ms, end_ms in regions:
+                start = float(start_ms) / 1000.0
+                end = float(end_ms) / 1000.0
+                if start > self.include_before:
+                    start = start - self.include_before
+                end += self.include_after
+                times.append((start, end))
+
+            filenames = []
+            inputs = []
+            outputs = []
+            for i, (start, end) in enumerate(times):
+                inputs.append(self.input_cmd.format(start=start,
+                                                    dura=end - start,
+                                                    in_=self.source_path))
+                if not self.is_keep or not self.output:
+                    temp = tempfile.NamedTemporaryFile(suffix=self.suffix, delete=False)
+                    temp.close()
+                    filename = temp.name
+                else:
+                    filename = self.output \
+                        + "-{start:0>8.3f}-{end:0>8.3f}{suffix}".format(
+                            start=start,
+                            end=end,
+                            suffix=self.suffix)
+                filenames.append(filename)
+                outputs.append(self.output_cmd.format(index=i, out_=filename))
+
+            command = self.cmd.format(inputs=" ".join(inputs),
+                                      outputs=" ".join(outputs))
+            prcs = subprocess.Popen(constants.cmd_conversion(command),
+                                    stdout=subprocess.PIPE,
+                                    stderr=subprocess.PIPE)
+            prcs.communicate()
+
+            audio_fragments = []
+            for filename in filenames:
+                if os.path.isfile(filename) and os.path.getsize(filename) > 4:
+                    audio_fragments.append(filename)
+                    continue
+                if os.path.isfile(filename):
+                    os.remove(filename)
+                audio_fragments.append(None)
+            return audio_fragments
+
+        except KeyboardInterrupt:
+            return []
+
+        except OSError as ffmpeg_exec_error:
+            raise exceptions.AutosubException(
+                _("Error: ffmpeg can't split your file. "
+                  "Check your audio processing options.")) from ffmpeg_exec_error
+
+
 def ffprobe_get_fps(  # pylint: disable=superfluous-parens
         video_file,
         input_m=input):
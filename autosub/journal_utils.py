@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Defines the recognition journal used to resume an interrupted job.
+"""
+# Import built-in modules
+import os
+import json
+import hashlib
+import threading
+
+
+def get_job_key(args):
+    """
+    Give the args and return the key of the recognition job.
+    A journal is only resumed by the job with the same key.
+    """
+    file_stat = os.stat(args.input)
+    key_list = [os.path.abspath(args.input),
+                file_stat.st_size,
+                file_stat.st_mtime,
+                args.ext_regions,
+                args.vad_engine,
+                args.energy_threshold,
+                args.min_region_size,
+                args.max_region_size,
+                args.max_continuous_silence,
+                args.auditok_mode,
+                args.speech_api,
+                args.speech_language,
+                args.speech_config,
+                args.api_suffix,
+                args.api_sample_rate,
+                args.api_audio_channel,
+                args.min_confidence,
+                "full-src" in args.output_files]
+    return hashlib.sha1(
+        json.dumps(key_list, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class RecognitionJournal:
+    """
+    Class for recording the speech regions
+    and every completed recognition result to an append-only jsonl file.
+    Every record is flushed to the disk once it is written.
+    Empty results are recorded too so their regions aren't sent again.
+    """
+    def __init__(self,
+                 journal_file,
+                 job_key):
+        self.journal_file = journal_file
+        self.job_key = job_key
+        self.regions = None
+        self.results = {}
+        self.missing_indexes = []
+        self.journal = None
+        # the results may be recorded by the callback thread of the pool
+        self.lock = threading.Lock()
+
+    def load(self):
+        """
+        Load the records of the same job from the journal
+        and return whether there is anything to resume.
+        Start a new journal if it doesn't exist or belongs to another job.
+        """
+        records = []
+        if os.path.isfile(self.journal_file):
+            with open(self.journal_file, encoding="utf-8") as in_file:
+                for line in in_file:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        # a line torn when the job died
+                        continue
+
+        if not records or records[0].get("job") != self.job_key:
+            self.journal = open(self.journal_file, "w", encoding="utf-8")
+            self.write({"job": self.job_key})
+            return False
+
+        for record in records[1:]:
+            if "regions" in record:
+                self.regions = [tuple(region) for region in record["regions"]]
+            elif "index" in record:
+                self.results[record["index"]] = record["result"]
+        self.journal = open(self.journal_file, "a", encoding="utf-8")
+        # start a new line after a torn one
+        self.journal.write("\n")
+        if self.regions is None:
+            return False
+        self.missing_indexes = [index for index in range(len(self.regions))
+                                if index not in self.results]
+        return True
+
+    def write(self, record):
+        """
+        Append a record to the journal and flush it to the disk.
+        """
+        with self.lock:
+            self.journal.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self.journal.flush()
+            os.fsync(self.journal.fileno())
+
+    def record_regions(self, regions):
+        """
+        Record the speech regions of the job.
+        """
+        self.regions = [tuple(region) for region in regions]
+        self.missing_indexes = list(range(len(self.regions)))
+        self.write({"regions": self.regions})
+
+    def record_result(
+            self,
+            index,
+            result):
+        """
+        Record the recognition result of the region of the index.
+        """
+        self.results[index] = result
+        self.write({"index": index, "result": result})
+
+    def record_missing_result(
+            self,
+            position,
+            result):
+        """
+        Record the recognition result of the missing region
+        at the position of the missing regions.
+        """
+        self.record_result(self.missing_indexes[position], result)
+
+    def get_missing_indexes(self):
+        """
+        Return the indexes of the regions without recognition results
+        when the job starts or resumes.
+        """
+        return list(self.missing_indexes)
+
+    def merge_results(self, results):
+        """
+        Give the results of the missing regions in order
+        and yield the results of all the regions in order.
+        The new results are recorded by record_missing_result
+        as soon as they complete.
+        """
+        new_results = iter(results)
+        missing_indexes = set(self.missing_indexes)
+        for index in range(len(self.regions)):
+            if index not in missing_indexes:
+                yield self.results[index]
+                continue
+            try:
+                result = next(new_results)
+            except StopIteration:
+                return
+            yield result
+
+    def close(self):
+        """
+        Close the journal.
+        """
+        if self.journal:
+            self.journal.close()
+            self.journal = None
@@ -0,0 +1,1229 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Defines the network utils used by the speech-to-text api clients.
+"""
+# Import built-in modules
+import os
+import json
+import math
+import functools
+import base64
+import hashlib
+import time
+import random
+import asyncio
+import queue
+import threading
+import collections
+import multiprocessing
+from concurrent import futures
+
+# Import third-party modules
+import requests
+from requests import adapters
+
+# Any changes to the path and your own modules
+from autosub import constants
+
+if constants.IS_UNIX:
+    import fcntl
+    msvcrt = None  # pylint: disable=invalid-name
+else:
+    import msvcrt
+    fcntl = None  # pylint: disable=invalid-name
+
+HTTP_SESSION = {}
+HTTP_SESSION_LOCAL = threading.local()
+# Connection pool size of the current process
+# and persistent http session of the current thread
+
+RETRYABLE_ERRORS = (requests.exceptions.ConnectionError,
+                    requests.exceptions.Timeout)
+# Request errors worth retrying
+
+BASE64_PLACEHOLDER = "autosub-base64-audio"
+BASE64_CHUNK_SIZE = 3 << 16
+# Json value replaced by the base64 of the audio in a request body
+# and the bytes of the audio encoded at a time
+
+
+def init_http_session(pool_size=constants.DEFAULT_CONCURRENCY):
+    """
+    Pool initializer to create a persistent http session for a worker process.
+    """
+    HTTP_SESSION["pool_size"] = pool_size
+    HTTP_SESSION_LOCAL.pid = None
+    return get_http_session()
+
+
+def get_http_session():
+    """
+    Return the persistent http session of the current thread
+    whose connections are kept alive and reused by every request.
+    """
+    # a session inherited through fork shares the parent's sockets
+    # and a session isn't thread-safe
+    if getattr(HTTP_SESSION_LOCAL, "pid", None) != os.getpid():
+        pool_size = HTTP_SESSION.get("pool_size", constants.DEFAULT_CONCURRENCY)
+        session = requests.Session()
+        adapter = adapters.HTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        HTTP_SESSION_LOCAL.session = session
+        HTTP_SESSION_LOCAL.pid = os.getpid()
+    return HTTP_SESSION_LOCAL.session
+
+
+def encode_json_body(
+        payload,
+        audio_data):
+    """
+    Give a json payload with BASE64_PLACEHOLDER in place of the audio
+    and the audio data and return the utf-8 request body.
+    The base64 of the audio is written into the body buffer chunk by chunk
+    so the body can be posted again on a retry without another copy.
+    """
+    prefix, suffix = json.dumps(payload, ensure_ascii=False).encode("utf-8").split(
+        BASE64_PLACEHOLDER.encode("utf-8"), 1)
+    body = bytearray(len(prefix) + (len(audio_data) + 2) // 3 * 4 + len(suffix))
+    body[:len(prefix)] = prefix
+    position = len(prefix)
+    audio_view = memoryview(audio_data)
+    for start in range(0, len(audio_data), BASE64_CHUNK_SIZE):
+        # a chunk of a multiple of 3 bytes has no padding
+        encoded = base64.b64encode(audio_view[start:start + BASE64_CHUNK_SIZE])
+        body[position:position + len(encoded)] = encoded
+        position = position + len(encoded)
+    body[position:] = suffix
+    return body
+
+
+def parse_rate_limits(rate_limits):
+    """
+    Give a list of rate limits like "gsv2=10/s"
+    and return a dict of the API names and their (count, period) limits.
+    """
+    limits_dict = {}
+    for rate_limit in rate_limits:
+        name, _, rate = rate_limit.partition("=")
+        count, _, period = rate.partition("/")
+        name = name.strip().lower()
+        period = period.strip().lower()
+        if name not in constants.RATE_LIMIT_API_NAMES:
+            raise ValueError(rate_limit)
+        try:
+            if period in constants.RATE_LIMIT_PERIODS:
+                period = constants.RATE_LIMIT_PERIODS[period]
+            else:
+                period = float(period)
+            count = float(count)
+        except ValueError as error:
+            raise ValueError(rate_limit) from error
+        if count <= 0 or period <= 0:
+            raise ValueError(rate_limit)
+        limits_dict.setdefault(name, []).append((count, period))
+    return limits_dict
+
+
+def lock_file(file_obj):
+    """
+    Lock a file exclusively across the processes.
+    """
+    if fcntl:
+        fcntl.flock(file_obj.fileno(), fcntl.LOCK_EX)
+    else:
+        file_obj.seek(0)
+        msvcrt.locking(file_obj.fileno(), msvcrt.LK_LOCK, 1)
+
+
+def unlock_file(file_obj):
+    """
+    Unlock a file locked by lock_file.
+    """
+    if fcntl:
+        fcntl.flock(file_obj.fileno(), fcntl.LOCK_UN)
+    else:
+        file_obj.seek(0)
+        msvcrt.locking(file_obj.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class RateLimiter:  # pylint: disable=too-few-public-methods
+    """
+    Class for limiting the request rate of an API by token buckets
+    whose state is kept in a locked local file.
+    Every worker process and every job on the same host
+    using the same file shares the buckets.
+    """
+    def __init__(self,
+                 name,
+                 limits,
+                 state_dir=constants.DEFAULT_RATE_LIMIT_DIR):
+        self.name = name
+        self.limits = limits
+        if not os.path.isdir(state_dir):
+            os.makedirs(state_dir, exist_ok=True)
+        self.state_file = os.path.join(state_dir, name + ".json")
+
+    def take(self):
+        """
+        Take a token from every bucket if all of them have one
+        and return 0 or return the seconds to wait for the tokens.
+        """
+        with open(self.state_file, "a+", encoding="utf-8") as state_file:
+            lock_file(state_file)
+            try:
+                state_file.seek(0)
+                try:
+                    state = json.loads(state_file.read())
+                except ValueError:
+                    state = {}
+                # the wall clock is shared by the processes
+                now = time.time()
+                elapsed = max(now - state.get("time", now), 0.0)
+                wait = 0.0
+                tokens_dict = {}
+                for count, period in self.limits:
+                    key = "{}/{}".format(count, period)
+                    tokens = min(count, state.get(key, count) + elapsed * count / period)
+                    tokens_dict[key] = tokens
+                    if tokens < 1.0:
+                        wait = max(wait, (1.0 - tokens) * period / count)
+                if wait <= 0:
+                    for key in tokens_dict:
+                        tokens_dict[key] = tokens_dict[key] - 1.0
+                tokens_dict["time"] = now
+                state_file.seek(0)
+                state_file.truncate()
+                state_file.write(json.dumps(tokens_dict))
+                state_file.flush()
+            finally:
+                unlock_file(state_file)
+        return wait
+
+    def acquire(self):
+        """
+        Wait until a request is allowed by every limit.
+        """
+        wait = self.take()
+        while wait > 0:
+            time.sleep(wait)
+            wait = self.take()
+
+    async def acquire_async(self):
+        """
+        Wait in the event loop until a request is allowed by every limit.
+        """
+        wait = self.take()
+        while wait > 0:
+            await asyncio.sleep(wait)
+            wait = self.take()
+
+
+def get_rate_limiter(
+        rate_limits,
+        name,
+        state_dir=constants.DEFAULT_RATE_LIMIT_DIR):
+    """
+    Give the parsed rate limits and an API name
+    and return its rate limiter or None if it isn't limited.
+    """
+    if not rate_limits or name not in rate_limits:
+        return None
+    return RateLimiter(name, rate_limits[name], state_dir)
+
+
+def get_proxies(proxy):
+    """
+    Give a proxy url and return the proxies dict used by requests.
+    """
+    if not proxy:
+        return None
+    return {"http": proxy, "https": proxy}
+
+
+class CredentialPool:
+    """
+    Class for spreading the speech-to-text requests
+    across several credentials and endpoints.
+    The credential least used today allowed by its own rate limits is chosen
+    and a credential returning quota errors is evicted for a while.
+    The daily usage and the evictions are kept in a locked local file
+    shared by every worker process and every job on the same host.
+    """
+    def __init__(self,
+                 name,
+                 credentials,
+                 state_dir=constants.DEFAULT_RATE_LIMIT_DIR,
+                 cooldown=constants.DEFAULT_CREDENTIAL_COOLDOWN):
+        self.name = name
+        self.credentials = credentials
+        self.cooldown = cooldown
+        if not os.path.isdir(state_dir):
+            os.makedirs(state_dir, exist_ok=True)
+        self.state_file = os.path.join(state_dir, name + "-credentials.json")
+        self.credential_ids = []
+        self.rate_limiters = []
+        for credential in credentials:
+            credential_id = hashlib.sha1(json.dumps(
+                credential, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+            self.credential_ids.append(credential_id)
+            if credential.get("rate_limit"):
+                self.rate_limiters.append(RateLimiter(
+                    "{}-{}".format(name, credential_id),
+                    parse_rate_limits(
+                        ["{}={}".format(name, rate)
+                         for rate in credential["rate_limit"]])[name],
+                    state_dir))
+            else:
+                self.rate_limiters.append(None)
+
+    def update_state(self, func):
+        """
+        Give a function to update the state dict
+        and return its result while the state file is locked.
+        """
+        with open(self.state_file, "a+", encoding="utf-8") as state_file:
+            lock_file(state_file)
+            try:
+                state_file.seek(0)
+                try:
+                    state = json.loads(state_file.read())
+                except ValueError:
+                    state = {}
+                # the usage is counted per day like the quotas of the APIs
+                today = time.strftime("%Y-%m-%d")
+                if state.get("day") != today:
+                    state["day"] = today
+                    state["used"] = {}
+                state.setdefault("evicted", {})
+                result = func(state)
+                state_file.seek(0)
+                state_file.truncate()
+                state_file.write(json.dumps(state))
+                state_file.flush()
+            finally:
+                unlock_file(state_file)
+        return result
+
+    def get_order(self, state):
+        """
+        Give the state dict and return the indexes of the available credentials
+        from the least used one or the seconds to wait for one.
+        """
+        now = time.time()
+        weights = [max(credential.get("weight", 1.0), 1e-6)
+                   for credential in self.credentials]
+        available = [index for index, credential_id in enumerate(self.credential_ids)
+                     if state["evicted"].get(credential_id, 0) <= now]
+        if not available:
+            return min(state["evicted"].get(credential_id, now)
+                       for credential_id in self.credential_ids) - now
+        return sorted(
+            available,
+            key=lambda index: state["used"].get(self.credential_ids[index], 0)
+            / weights[index])
+
+    def choose(self, state):
+        """
+        Give the state dict and count a request of an available credential
+        and return its index and the credential
+        or return the seconds to wait for one.
+        """
+        order = self.get_order(state)
+        if not isinstance(order, list):
+            return max(order, 0.001)
+        wait = None
+        for index in order:
+            rate_limiter = self.rate_limiters[index]
+            if rate_limiter:
+                index_wait = rate_limiter.take()
+                if index_wait > 0:
+                    if wait is None or index_wait < wait:
+                        wait = index_wait
+                    continue
+            credential_id = self.credential_ids[index]
+            state["used"][credential_id] = state["used"].get(credential_id, 0) + 1
+            return index, self.credentials[index]
+        return wait
+
+    def take(self):
+        """
+        Return the index and the credential of an available one
+        or return the seconds to wait for one.
+        """
+        # choose and count in one locked update
+        # so the workers don't pick the same credential
+        return self.update_state(self.choose)
+
+    def acquire(self):
+        """
+        Wait for an available credential
+        and return its index and the credential.
+        """
+        result = self.take()
+        while not isinstance(result, tuple):
+            time.sleep(result)
+            result = self.take()
+        return result
+
+    async def acquire_async(self):
+        """
+        Wait in the event loop for an available credential
+        and return its index and the credential.
+        """
+        result = self.take()
+        while not isinstance(result, tuple):
+            await asyncio.sleep(result)
+            result = self.take()
+        return result
+
+    def evict(self, index):
+        """
+        Evict the credential of the index for the cooldown seconds
+        after it returns a quota error.
+        """
+        credential_id = self.credential_ids[index]
+        until = time.time() + self.cooldown
+
+        def update(state):
+            state["evicted"][credential_id] = until
+
+        self.update_state(update)
+
+
+def get_credential_pool(
+        name,
+        credentials,
+        state_dir=constants.DEFAULT_RATE_LIMIT_DIR):
+    """
+    Give an API name and its credentials
+    and return a credential pool or None if there isn't any.
+    """
+    if not credentials:
+        return None
+    return CredentialPool(name, credentials, state_dir)
+
+
+def is_quota_status(status_code):
+    """
+    Give an http status code and return whether it means
+    the credential is out of its quota.
+    """
+    return status_code in (403, 429)
+
+
+CALL_FEEDBACK = threading.local()
+# Congestion signals of the speech-to-text call in the current thread
+
+
+class RetryPolicy:  # pylint: disable=too-few-public-methods
+    """
+    Class for retrying a speech-to-text request
+    with timeouts, exponential backoff with full jitter
+    and an overall deadline for each fragment.
+    """
+    def __init__(self,  # pylint: disable=too-many-arguments
+                 retries=constants.DEFAULT_SPEECH_RETRIES,
+                 connect_timeout=constants.DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout=constants.DEFAULT_READ_TIMEOUT,
+                 backoff_base=constants.DEFAULT_BACKOFF_BASE,
+                 backoff_max=constants.DEFAULT_BACKOFF_MAX,
+                 deadline=constants.DEFAULT_SPEECH_DEADLINE,
+                 rate_limiter=None):
+        self.retries = max(retries, 1)
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.deadline = deadline
+        self.rate_limiter = rate_limiter
+
+    def get_delay(self, attempt):
+        """
+        Give the number of the attempt and return the seconds to wait before it.
+        """
+        if not attempt:
+            return 0
+        return random.uniform(
+            0, min(self.backoff_max, self.backoff_base * (1 << attempt)))
+
+    def get_timeouts(self, start_time):
+        """
+        Give the start time of the first attempt
+        and return the (connect, read) timeouts within the deadline
+        or None if the deadline has passed.
+        """
+        remaining = self.deadline - (time.monotonic() - start_time)
+        if remaining <= 0:
+            return None
+        return (min(self.connect_timeout, remaining),
+                min(self.read_timeout, remaining))
+
+    def attempts(self):
+        """
+        Yield the (connect, read) timeouts of every attempt.
+        Sleep before a retry and stop when the retries are used up
+        or the deadline can't be met.
+        Every attempt waits for the rate limiter if there is one.
+        """
+        start_time = time.monotonic()
+        for attempt in range(self.retries):
+            delay = self.get_delay(attempt)
+            if delay:
+                if time.monotonic() - start_time + delay >= self.deadline:
+                    return
+                time.sleep(delay)
+            if self.rate_limiter:
+                self.rate_limiter.acquire()
+            timeouts = self.get_timeouts(start_time)
+            if not timeouts:
+                return
+            yield timeouts
+
+    async def attempts_async(self):
+        """
+        Yield the (connect, read) timeouts of every attempt
+        like attempts() without blocking the event loop.
+        """
+        start_time = time.monotonic()
+        for attempt in range(self.retries):
+            delay = self.get_delay(attempt)
+            if delay:
+                if time.monotonic() - start_time + delay >= self.deadline:
+                    return
+                await asyncio.sleep(delay)
+            if self.rate_limiter:
+                await self.rate_limiter.acquire_async()
+            timeouts = self.get_timeouts(start_time)
+            if not timeouts:
+                return
+            yield timeouts
+
+
+def is_congested_status(status_code):
+    """
+    Give an http status code and return whether it means
+    the provider is rate limiting or overloaded.
+    """
+    return status_code == 429 or status_code >= 500
+
+
+def report_congestion(feedback=None):
+    """
+    Mark the speech-to-text call in the current thread as congested
+    when it meets a rate limit, a server error or a connection error.
+    A coroutine marks its own feedback instead
+    because it shares the thread with the other calls.
+    """
+    if feedback:
+        feedback.is_congested = True
+    else:
+        CALL_FEEDBACK.is_congested = True
+
+
+class CallFeedback:  # pylint: disable=too-few-public-methods
+    """
+    Class for the congestion signal of a speech-to-text coroutine.
+    """
+    def __init__(self):
+        self.is_congested = False
+
+
+class MeasuredCall:  # pylint: disable=too-few-public-methods
+    """
+    Class for calling a speech-to-text recognizer
+    and returning its result with the latency and the congestion signal.
+    """
+    def __init__(self, func):
+        self.func = func
+        self.is_async = getattr(func, "is_async", False)
+
+    def __call__(self, *args):
+        CALL_FEEDBACK.is_congested = False
+        start_time = time.monotonic()
+        result = self.func(*args)
+        return result, time.monotonic() - start_time, CALL_FEEDBACK.is_congested
+
+    async def call_async(self, *args):
+        """
+        Await the coroutine of the recognizer
+        and return its result with the latency and the congestion signal.
+        """
+        feedback = CallFeedback()
+        start_time = time.monotonic()
+        result = await self.func.call_async(*args, feedback=feedback)
+        return result, time.monotonic() - start_time, feedback.is_congested
+
+
+class AIMDController:  # pylint: disable=too-many-instance-attributes
+    """
+    Class for adapting the number of in-flight speech-to-text requests
+    by additive increase and multiplicative decrease.
+    The limit grows by one per window of healthy results
+    and is cut when a result is congested
+    or the latency per second of audio keeps growing.
+    The latency is divided by the fragment duration
+    so long fragments don't look like a slow provider
+    and is compared with the fastest one of the fragments of similar durations
+    so the fixed cost of a request doesn't make short fragments look slow.
+    """
+    def __init__(self,  # pylint: disable=too-many-arguments
+                 initial_limit,
+                 max_limit,
+                 min_limit=1,
+                 decrease_factor=0.5,
+                 latency_factor=2.0,
+                 smoothing=0.2):
+        self.max_limit = max(max_limit, min_limit)
+        self.min_limit = min_limit
+        self.limit = float(min(max(initial_limit, min_limit), self.max_limit))
+        self.decrease_factor = decrease_factor
+        self.latency_factor = latency_factor
+        self.smoothing = smoothing
+        # the lowest latency per second of audio of every duration bucket
+        self.min_latencies = {}
+        self.avg_ratio = None
+        self.cooldown = 0
+        self.congested_count = 0
+
+    def get_limit(self):
+        """
+        Return the current limit of in-flight requests.
+        """
+        return int(self.limit)
+
+    def update_latency(self,
+                       latency,
+                       duration):
+        """
+        Give the latency and the audio duration in seconds of a completed request
+        and return whether the latency per second of audio keeps growing.
+        """
+        latency = latency / duration
+        bucket = int(math.floor(math.log(duration, 2)))
+        min_latency = self.min_latencies.get(bucket)
+        if min_latency is None or latency < min_latency:
+            min_latency = latency
+            self.min_latencies[bucket] = latency
+        ratio = latency / max(min_latency, 1e-6)
+        if self.avg_ratio is None:
+            self.avg_ratio = ratio
+        else:
+            self.avg_ratio = self.avg_ratio + self.smoothing * (ratio - self.avg_ratio)
+        return self.avg_ratio > self.latency_factor
+
+    def update(self,
+               is_congested,
+               latency=None,
+               duration=None):
+        """
+        Give the congestion signal, the latency
+        and the audio duration in seconds of a completed request
+        and adapt the limit.
+        The latency is only a signal when the duration is known.
+        """
+        is_slow = False
+        if latency is not None and duration and duration > 0:
+            is_slow = self.update_latency(latency, duration)
+
+        if is_congested:
+            self.congested_count = self.congested_count + 1
+        if self.cooldown > 0:
+            # the requests sent before the last decrease are still returning
+            self.cooldown = self.cooldown - 1
+            return
+
+        if is_congested or is_slow:
+            self.limit = max(float(self.min_limit), self.limit * self.decrease_factor)
+            self.cooldown = self.get_limit()
+            if is_slow:
+                # let the latency baseline follow the provider
+                scale = self.avg_ratio / self.latency_factor
+                for bucket in self.min_latencies:
+                    self.min_latencies[bucket] = self.min_latencies[bucket] * scale
+                self.avg_ratio = self.latency_factor
+        else:
+            self.limit = min(float(self.max_limit), self.limit + 1.0 / self.limit)
+
+
+class HedgedRequest:  # pylint: disable=too-few-public-methods
+    """
+    Class for a speech-to-text request in flight and its duplicate.
+    """
+    def __init__(self, item, async_result):
+        self.item = item
+        self.primary = async_result
+        self.results = [async_result]
+        self.start_time = time.monotonic()
+        self.is_hedged = False
+        self.fallback = None
+        self.error = None
+        self.measured_result = None
+
+    def is_pending(self):
+        """
+        Return whether no response has arrived yet.
+        """
+        return not any(async_result.ready() for async_result in self.results)
+
+
+class RequestHedger:  # pylint: disable=too-many-instance-attributes
+    """
+    Class for hedging the slow speech-to-text requests.
+    A duplicate request is sent once a request has been outstanding
+    longer than the percentile of the observed latencies
+    and the first successful response wins.
+    The duplicates are no more than the max ratio of the requests.
+    """
+    def __init__(self,  # pylint: disable=too-many-arguments
+                 concurrency,
+                 max_ratio=constants.DEFAULT_HEDGE_RATIO,
+                 percentile=constants.DEFAULT_HEDGE_PERCENTILE,
+                 min_samples=constants.DEFAULT_HEDGE_MIN_SAMPLES,
+                 window=constants.DEFAULT_HEDGE_WINDOW,
+                 poll_interval=0.01):
+        self.concurrency = max(concurrency, 1)
+        self.max_ratio = max_ratio
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.poll_interval = poll_interval
+        self.latencies = collections.deque(maxlen=window)
+        # spare workers for the duplicates
+        self.spare_workers = max(int(math.ceil(self.concurrency * max_ratio)), 1)
+        self.sent_count = 0
+        self.hedged_count = 0
+        self.won_count = 0
+
+    def get_threshold(self):
+        """
+        Return the age after which a request is hedged
+        or None if there aren't enough latency samples.
+        """
+        if len(self.latencies) < self.min_samples:
+            return None
+        latencies = sorted(self.latencies)
+        return latencies[int(self.percentile * (len(latencies) - 1))]
+
+    def send(self,
+             pool,
+             func,
+             item):
+        """
+        Send a request and return it.
+        """
+        self.sent_count = self.sent_count + 1
+        return HedgedRequest(item, pool.apply_async(func, (item,)))
+
+    def hedge(self,
+              pool,
+              func,
+              in_flight):
+        """
+        Send a duplicate of every request outstanding longer than the threshold
+        while the budget allows it.
+        Return the seconds until the next request is due to be hedged
+        or None if nothing is waiting to be hedged.
+        """
+        threshold = self.get_threshold()
+        if threshold is None:
+            return None
+        next_due = None
+        now = time.monotonic()
+        for request in in_flight:
+            if request.is_hedged or not request.is_pending():
+                continue
+            due = request.start_time + threshold - now
+            if due > 0:
+                if next_due is None or due < next_due:
+                    next_due = due
+                continue
+            if self.hedged_count >= self.max_ratio * self.sent_count:
+                return None
+            request.results.append(pool.apply_async(func, (request.item,)))
+            request.is_hedged = True
+            self.hedged_count = self.hedged_count + 1
+        return next_due
+
+    def poll(self, request):
+        """
+        Give a request in flight and return its first successful measured result
+        or None if it is still waiting for one.
+        """
+        if request.measured_result is not None:
+            return request.measured_result
+        for async_result in list(request.results):
+            if not async_result.ready():
+                continue
+            request.results.remove(async_result)
+            try:
+                measured_result = async_result.get()
+            except Exception as error:  # pylint: disable=broad-except
+                # the other request may still succeed
+                request.error = error
+                continue
+            self.latencies.append(measured_result[1])
+            if measured_result[0]:
+                if async_result is not request.primary:
+                    self.won_count = self.won_count + 1
+                self.cancel(request.results)
+                request.measured_result = measured_result
+                return measured_result
+            if request.fallback is None:
+                request.fallback = measured_result
+
+        if request.results:
+            return None
+        if request.fallback is None:
+            raise request.error
+        request.measured_result = request.fallback
+        return request.fallback
+
+    def wait(self,
+             pool,
+             func,
+             in_flight):
+        """
+        Hedge the requests due to be hedged
+        and wait a while for the oldest request in flight.
+        """
+        next_due = self.hedge(pool, func, in_flight)
+        if next_due is None:
+            timeout = self.poll_interval
+        else:
+            timeout = min(max(next_due, 0.001), self.poll_interval)
+        in_flight[0].results[0].wait(timeout)
+
+    @staticmethod
+    def cancel(results):
+        """
+        Cancel the requests losing the race.
+        A request already running is left to finish and its result is dropped.
+        """
+        for async_result in results:
+            cancel = getattr(async_result, "cancel", None)
+            if cancel:
+                cancel()
+
+
+class IndexedCall:  # pylint: disable=too-few-public-methods
+    """
+    Class for calling a speech-to-text recognizer with an indexed item
+    and returning the index with its result.
+    """
+    def __init__(self, func):
+        self.func = func
+        self.is_async = getattr(func, "is_async", False)
+
+    def __call__(self, indexed_item):
+        index, item = indexed_item
+        return index, self.func(item)
+
+    async def call_async(self, indexed_item):
+        """
+        Await the coroutine of the recognizer with an indexed item
+        and return the index with its result.
+        """
+        index, item = indexed_item
+        return index, await self.func.call_async(item)
+
+
+def reassemble(indexed_results):
+    """
+    Give the (index, result) pairs in completion order
+    and yield the results in index order
+    as soon as every earlier result has arrived.
+    """
+    buffer = {}
+    next_index = 0
+    for index, result in indexed_results:
+        buffer[index] = result
+        while next_index in buffer:
+            yield buffer.pop(next_index)
+            next_index = next_index + 1
+
+
+def windowed_imap(
+        pool,
+        func,
+        iterable,
+        window=constants.DEFAULT_REASSEMBLY_WINDOW,
+        on_result=None):
+    """
+    Give a pool, a callable and an iterable
+    and yield the results in order while the calls complete in any order.
+    No more than the window of items from the next result to yield
+    are submitted so a slow call holds up a bounded number of results.
+    If on_result is given, it is called with the index and the result
+    of every call as soon as it completes.
+    """
+    done_queue = queue.Queue()
+    indexed_func = IndexedCall(func)
+    buffer = {}
+    next_index = 0
+    submitted_count = 0
+    iterator = iter(iterable)
+    is_exhausted = False
+    while True:
+        while not is_exhausted and submitted_count < next_index + window:
+            try:
+                item = next(iterator)
+            except StopIteration:
+                is_exhausted = True
+                break
+            pool.apply_async(
+                indexed_func, ((submitted_count, item),),
+                callback=lambda result: done_queue.put((True, result)),
+                error_callback=lambda error: done_queue.put((False, error)))
+            submitted_count = submitted_count + 1
+        if next_index >= submitted_count:
+            break
+        is_done, indexed_result = done_queue.get()
+        if not is_done:
+            raise indexed_result
+        index, result = indexed_result
+        if on_result:
+            on_result(index, result)
+        buffer[index] = result
+        while next_index in buffer:
+            yield buffer.pop(next_index)
+            next_index = next_index + 1
+
+
+def get_lpt_order(items):
+    """
+    Give the audio fragments and return their indexes
+    from the largest file to the smallest one.
+    """
+    sizes = []
+    for item in items:
+        try:
+            sizes.append(os.path.getsize(item))
+        except (OSError, TypeError):
+            sizes.append(0)
+    return sorted(range(len(items)), key=lambda index: sizes[index], reverse=True)
+
+
+def record_measured_result(
+        on_result,
+        index,
+        measured_result):
+    """
+    Give the callback of the results, the index of a request
+    and its measured result and call the callback with the result.
+    """
+    on_result(index, measured_result[0])
+
+
+def get_region_duration(
+        regions,
+        index):
+    """
+    Give the regions of the audio fragments in milliseconds and an index
+    and return the duration of its region in seconds or None if it isn't known.
+    """
+    if regions is None or index >= len(regions):
+        return None
+    start_ms, end_ms = regions[index]
+    return (end_ms - start_ms) / 1000.0
+
+
+def speech_imap(  # pylint: disable=too-many-branches, too-many-arguments, too-many-locals,
+        # pylint: disable=too-many-statements
+        pool,
+        func,
+        iterable,
+        controller=None,
+        hedger=None,
+        schedule="timeline",
+        on_result=None,
+        regions=None):
+    """
+    Give a pool, a recognizer and the audio fragments
+    and yield the results in order.
+    If a controller is given, keep as many requests in flight
+    as its limit allows.
+    If a hedger is given, hedge the slow requests.
+    If the schedule is "lpt", dispatch the longest fragments first
+    and reassemble the results in order.
+    If on_result is given, it is called with the index and the result
+    of every fragment as soon as it completes.
+    The regions of the fragments give the controller
+    the latency per second of audio.
+    """
+    if schedule == "lpt":
+        items = list(iterable)
+        order = get_lpt_order(items)
+        lpt_regions = None
+        if regions is not None:
+            lpt_regions = [regions[index] for index in order]
+        lpt_on_result = None
+        if on_result:
+            def lpt_on_result(index, result):
+                on_result(order[index], result)
+        for result in reassemble(zip(order, speech_imap(
+                pool, func, [items[index] for index in order],
+                controller, hedger, on_result=lpt_on_result,
+                regions=lpt_regions))):
+            yield result
+        return
+
+    if not controller and not hedger:
+        # a slow result doesn't hold up the ones completed after it
+        for result in windowed_imap(pool, func, iterable, on_result=on_result):
+            yield result
+        return
+
+    measured_func = MeasuredCall(func)
+    in_flight = collections.deque()
+    iterator = iter(iterable)
+    is_exhausted = False
+    # the index of the first request in flight
+    next_index = 0
+    submitted_count = 0
+    recorded_indexes = set()
+    while True:
+        if controller:
+            limit = controller.get_limit()
+        else:
+            limit = hedger.concurrency
+        if hedger:
+            # a slow request doesn't hold up the ones after it
+            pending_count = sum(1 for request in in_flight if request.is_pending())
+        else:
+            pending_count = len(in_flight)
+        # the results completed behind a slow one wait in order
+        while not is_exhausted and pending_count < limit \
+                and len(in_flight) < constants.DEFAULT_REASSEMBLY_WINDOW:
+            try:
+                item = next(iterator)
+            except StopIteration:
+                is_exhausted = True
+                break
+            if hedger:
+                in_flight.append(hedger.send(pool, measured_func, item))
+            elif on_result:
+                in_flight.append(pool.apply_async(
+                    measured_func, (item,),
+                    callback=functools.partial(
+                        record_measured_result, on_result, submitted_count)))
+            else:
+                in_flight.append(pool.apply_async(measured_func, (item,)))
+            submitted_count = submitted_count + 1
+            pending_count = pending_count + 1
+        if not in_flight:
+            break
+        if hedger:
+            if on_result:
+                # the results completed behind the first one are recorded too
+                for index, request in enumerate(in_flight, next_index):
+                    if index not in recorded_indexes \
+                            and hedger.poll(request) is not None:
+                        recorded_indexes.add(index)
+                        on_result(index, request.measured_result[0])
+            measured_result = hedger.poll(in_flight[0])
+            if measured_result is None:
+                hedger.wait(pool, measured_func, in_flight)
+                continue
+            in_flight.popleft()
+        else:
+            measured_result = in_flight.popleft().get()
+        recorded_indexes.discard(next_index)
+        duration = get_region_duration(regions, next_index)
+        next_index = next_index + 1
+        result, latency, is_congested = measured_result
+        if controller:
+            controller.update(is_congested, latency, duration)
+        yield result
+
+
+class AsyncResult:  # pylint: disable=too-few-public-methods
+    """
+    Class for waiting for a call submitted to the ThreadSpeechPool.
+    """
+    def __init__(self, future):
+        self.future = future
+
+    def get(self, timeout=None):
+        """
+        Wait for the call and return its result.
+        """
+        return self.future.result(timeout=timeout)
+
+    def ready(self):
+        """
+        Return whether the call is done.
+        """
+        return self.future.done()
+
+    def wait(self, timeout=None):
+        """
+        Wait for the call to be done.
+        """
+        futures.wait([self.future], timeout=timeout)
+
+    def cancel(self):
+        """
+        Cancel the call if it hasn't started.
+        """
+        self.future.cancel()
+
+
+class ThreadSpeechPool:
+    """
+    Class for running speech-to-text calls in a bounded pool of threads
+    with the same interface as the multiprocessing.Pool methods used by autosub.
+    Each blocking call runs in one of the concurrency threads
+    which keeps its own http session.
+    A callable whose is_async is true is awaited by its call_async coroutine
+    in an asyncio event loop started for it instead,
+    so its concurrent calls don't hold a thread each.
+    """
+    def __init__(self,
+                 concurrency,
+                 initializer=None,
+                 initargs=()):
+        self.concurrency = max(concurrency, 1)
+        if initializer:
+            initializer(*initargs)
+        self.executor = futures.ThreadPoolExecutor(max_workers=self.concurrency)
+        self.loop = None
+        self.thread = None
+        self.pending = set()
+
+    def get_loop(self):
+        """
+        Return the event loop of the coroutine calls
+        and start it in its own thread on the first call.
+        """
+        if self.loop is None:
+            self.loop = asyncio.new_event_loop()
+            self.thread = threading.Thread(target=self.loop.run_forever)
+            self.thread.daemon = True
+            self.thread.start()
+        return self.loop
+
+    def submit(self, func, args):
+        """
+        Submit a call and return its future.
+        """
+        if getattr(func, "is_async", False):
+            # the coroutine keeps its per-call state in its own frame
+            future = asyncio.run_coroutine_threadsafe(
+                func.call_async(*args), self.get_loop())
+        else:
+            future = self.executor.submit(func, *args)
+        self.pending.add(future)
+        future.add_done_callback(self.pending.discard)
+        return future
+
+    def imap(self, func, iterable):
+        """
+        Give a callable and an iterable and yield the results in order
+        while keeping at most concurrency calls in flight.
+        """
+        in_flight = collections.deque()
+        for item in iterable:
+            in_flight.append(self.submit(func, (item,)))
+            if len(in_flight) >= self.concurrency:
+                yield in_flight.popleft().result()
+        while in_flight:
+            yield in_flight.popleft().result()
+
+    def imap_unordered(self, func, iterable):
+        """
+        Give a callable and an iterable and yield the results in completion order
+        while keeping at most concurrency calls in flight.
+        """
+        in_flight = set()
+        for item in iterable:
+            in_flight.add(self.submit(func, (item,)))
+            if len(in_flight) >= self.concurrency:
+                done, in_flight = futures.wait(
+                    in_flight, return_when=futures.FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        while in_flight:
+            done, in_flight = futures.wait(
+                in_flight, return_when=futures.FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+    def apply_async(self,
+                    func,
+                    args=(),
+                    callback=None,
+                    error_callback=None):
+        """
+        Submit a call and return an AsyncResult.
+        The callbacks are called with the result or the error like Pool's ones.
+        """
+        future = self.submit(func, args)
+
+        def on_done(done_future):
+            if done_future.cancelled():
+                return
+            error = done_future.exception()
+            if error is None:
+                if callback:
+                    callback(done_future.result())
+            elif error_callback:
+                error_callback(error)
+
+        if callback or error_callback:
+            future.add_done_callback(on_done)
+        return AsyncResult(future)
+
+    def stop_loop(self):
+        """
+        Stop the event loop if it is started.
+        """
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+
+    def close(self):
+        """
+        Wait for the pending calls and stop the threads.
+        """
+        futures.wait(list(self.pending))
+        self.stop_loop()
+        self.executor.shutdown(wait=False)
+
+    def terminate(self):
+        """
+        Cancel the pending calls and stop the threads.
+        """
+        for future in list(self.pending):
+            future.cancel()
+        self.stop_loop()
+        self.executor.shutdown(wait=False)
+
+    def join(self):
+        """
+        Wait for the event loop to stop if it is started.
+        """
+        if self.loop is not None:
+            self.thread.join()
+            self.loop.close()
+
+
+def get_speech_pool(
+        concurrency,
+        speech_engine="process",
+        hedger=None):
+    """
+    Give the speech engine and return a pool to run speech-to-text calls.
+    """
+    if hedger:
+        concurrency = concurrency + hedger.spare_workers
+    if speech_engine == "thread":
+        return ThreadSpeechPool(
+            concurrency,
+            initializer=init_http_session,
+            initargs=(concurrency,))
+    return multiprocessing.Pool(
+        concurrency,
+        initializer=init_http_session,
+        initargs=(concurrency,))
@@ -261,12 +261,17 @@ def get_cmd_parser():  # pylint: disable=too-many-statements
     speech_group.add_argument(
         '-skey', '--speech-key',
         metavar='key',
-        help=_("The API key for Google Speech-to-Text API. (arg_num = 1) "
+        nargs='+',
+        help=_("The API key for Google Speech-to-Text API. (arg_num >= 1) "
                "Currently support: "
                "gsv2: The API key for gsv2. (default: Free API key) "
                "gcsv1: The API key for gcsv1. "
                "(If used, override the credentials "
-               "given by\"-sa\"/\"--service-account\")"))
+               "given by\"-sa\"/\"--service-account\") "
+               "If several keys are given, the requests are spread across them "
+               "and a key returning quota errors is evicted for a while. "
+               "Xun Fei Yun and Baidu credentials are given by "
+               "the \"credentials\" list in \"-sconf\"/\"--speech-config\"."))
 
     speech_group.add_argument(
         '-sconf', '--speech-config',
@@ -318,6 +323,155 @@ def get_cmd_parser():  # pylint: disable=too-many-statements
         help=_("Number of concurrent Speech-to-Text requests to make. "
                "(arg_num = 1) (default: %(default)s)"))
 
+    speech_group.add_argument(
+        '-smc', '--speech-max-concurrency',
+        metavar='integer',
+        type=int,
+        help=_("Adapt the number of concurrent Speech-to-Text requests "
+               "between 1 and this value, starting from "
+               "\"-sc\"/\"--speech-concurrency\". "
+               "It increases while the requests succeed "
+               "and backs off on rate limits, server errors, "
+               "timeouts, connection errors, "
+               "the APIs' overload error codes "
+               "and a rising latency per second of audio. "
+               "A big value works better with "
+               "\"-se\"/\"--speech-engine\" thread. "
+               "(arg_num = 1)"))
+
+    speech_group.add_argument(
+        '-psub', '--partial-subtitles',
+        action='store_true',
+        help=_("Append the recognized text of every region "
+               "to a \"partial.srt\" file as soon as "
+               "all the regions before it are recognized "
+               "so a partial speech language subtitles file "
+               "is always on the disk. "
+               "(arg_num = 0)"))
+
+    speech_group.add_argument(
+        '-ssc', '--speech-schedule',
+        metavar=_('mode'),
+        default='timeline',
+        choices=["timeline", "lpt"],
+        help=_("Choose the order to dispatch the audio fragments "
+               "to the Speech-to-Text workers. "
+               "timeline: Dispatch them in the timeline order. "
+               "lpt: Dispatch the longest fragments first "
+               "to cut the time the workers wait for the last long fragment. "
+               "The results are still put in the timeline order. "
+               "It needs all the fragments "
+               "so it doesn't work with \"-stm\"/\"--streaming\". "
+               "(arg_num = 1) (default: %(default)s)"))
+
+    speech_group.add_argument(
+        '-sh', '--speech-hedge',
+        metavar='ratio',
+        type=float,
+        nargs='?',
+        const=constants.DEFAULT_HEDGE_RATIO,
+        help=_("Send a duplicate of a Speech-to-Text request "
+               "once it has been outstanding longer than "
+               "the 95th percentile of the observed latencies. "
+               "The first successful response wins. "
+               "The duplicates are no more than this ratio "
+               "of the requests. "
+               "If arg_num is 0, use const value. "
+               "(arg_num = 0 or 1) (const: %(const)s)"))
+
+    speech_group.add_argument(
+        '-sr', '--speech-retries',
+        metavar='integer',
+        type=int,
+        default=constants.DEFAULT_SPEECH_RETRIES,
+        help=_("Number of attempts of a Speech-to-Text request. "
+               "Connection errors, timeouts, rate limits, server errors "
+               "and the APIs' overload error codes are retried. "
+               "(arg_num = 1) (default: %(default)s)"))
+
+    speech_group.add_argument(
+        '-sto', '--speech-timeout',
+        metavar='second',
+        type=float,
+        nargs=2,
+        default=[constants.DEFAULT_CONNECT_TIMEOUT,
+                 constants.DEFAULT_READ_TIMEOUT],
+        help=_("Connect timeout and read timeout "
+               "of a Speech-to-Text request. "
+               "(arg_num = 2) (default: %(default)s)"))
+
+    speech_group.add_argument(
+        '-sbo', '--speech-backoff',
+        metavar='second',
+        type=float,
+        nargs=2,
+        default=[constants.DEFAULT_BACKOFF_BASE,
+                 constants.DEFAULT_BACKOFF_MAX],
+        help=_("Base and max of the exponential backoff "
+               "between the attempts of a Speech-to-Text request. "
+               "A random delay between 0 and min(max, base * 2^attempt) "
+               "is waited before a retry. "
+               "(arg_num = 2) (default: %(default)s)"))
+
+    speech_group.add_argument(
+        '-sdl', '--speech-deadline',
+        metavar='second',
+        type=float,
+        default=constants.DEFAULT_SPEECH_DEADLINE,
+        help=_("Overall deadline of all the attempts "
+               "of a Speech-to-Text request. "
+               "(arg_num = 1) (default: %(default)s)"))
+
+    speech_group.add_argument(
+        '-se', '--speech-engine',
+        metavar=_('engine'),
+        default='process',
+        choices=["process", "thread"],
+        help=_("Choose how to run the concurrent Speech-to-Text requests. "
+               "process: Run them in a pool of \"-sc\"/\"--speech-concurrency\" "
+               "worker processes. "
+               "thread: Run them in a pool of \"-sc\"/\"--speech-concurrency\" "
+               "threads of a single process, "
+               "each with its own http session. "
+               "The Xun Fei Yun sessions run as coroutines "
+               "in an asyncio event loop instead "
+               "when websockets is installed. "
+               "(arg_num = 1) (default: %(default)s)"))
+
+    speech_group.add_argument(
+        '-rs', '--resume',
+        action='store_true',
+        help=_("Record the speech regions "
+               "and every Speech-to-Text result to the journal "
+               "\"<output>.journal.jsonl\" as soon as it completes. "
+               "When the journal of the same job exists, "
+               "resume from it and only recognize the regions "
+               "without results. "
+               "\"-stm\"/\"--streaming\" is ignored. "
+               "(arg_num = 0)"))
+
+    speech_group.add_argument(
+        '-tc', '--transcript-cache',
+        nargs='?', metavar=_('path'),
+        const=constants.DEFAULT_CACHE_PATH,
+        help=_("Directory to save the transcript cache. "
+               "Speech-to-Text results are cached by the hash of "
+               "the audio fragment, the API, the language, the config "
+               "and the min confidence, "
+               "so the same fragment isn't sent to the API again. "
+               "If arg_num is 0, use the cache directory \"{cache}\". "
+               "(arg_num = 0 or 1)").format(cache=constants.DEFAULT_CACHE_PATH))
+
+    speech_group.add_argument(
+        '-tcs', '--transcript-cache-size',
+        metavar='integer',
+        type=int,
+        default=constants.DEFAULT_TRANSCRIPT_CACHE_SIZE >> 20,
+        help=_("Max size in MB of the transcript cache. "
+               "The least recently used results are evicted "
+               "at the end of the run. "
+               "(arg_num = 1) (default: %(default)s)"))
+
     trans_group.add_argument(
         '-tapi', '--translation-api',
         metavar=_('API_code'),
@@ -481,6 +635,28 @@ def get_cmd_parser():  # pylint: disable=too-many-statements
         help=_("Set proxy password. "
                "(arg_num = 1)"))
 
+    network_group.add_argument(
+        '-rl', '--rate-limit',
+        metavar='API=COUNT/PERIOD',
+        nargs='+',
+        help=_("Limit the request rate of an API by a token bucket "
+               "shared by every worker process "
+               "and every job on the same host. "
+               "API can be gsv2, gcsv1, xfyun, baidu or googletrans. "
+               "PERIOD can be s, m, h or seconds. "
+               "An API can have several limits. "
+               "E.g. \"gsv2=10/s gsv2=300/m googletrans=1/s\". "
+               "(arg_num >= 1)"))
+
+    network_group.add_argument(
+        '-rld', '--rate-limit-dir',
+        metavar='path',
+        default=constants.DEFAULT_RATE_LIMIT_DIR,
+        help=_("Directory of the token bucket files "
+               "used by \"-rl\"/\"--rate-limit\". "
+               "The jobs using the same directory share the limits. "
+               "(arg_num = 1) (default: %(default)s)"))
+
     options_group.add_argument(
         '-h', '--help',
         action='help',
@@ -565,6 +741,46 @@ def get_cmd_parser():  # pylint: disable=too-many-statements
                "meaning you can't remove them. "
                "(arg_num = 1) (default: %(default)s)"))
 
+    audio_prcs_group.add_argument(
+        '-aim', '--audio-in-memory',
+        action='store_true',
+        help=_("Decode the input audio through the ffmpeg stdout pipe "
+               "into memory for speech regions detection "
+               "instead of converting it into a temporary wav file. "
+               "The wav file is only written "
+               "when \"-k\"/\"--keep\" is given. "
+               "(arg_num = 0)"))
+
+    audio_prcs_group.add_argument(
+        '-asm', '--audio-split-mode',
+        metavar=_('mode'),
+        default='ffmpeg',
+        choices=["ffmpeg", "pcm", "segment"],
+        help=_("Choose how to split the speech regions "
+               "into short-term audio fragments. "
+               "ffmpeg: Run the audio split command once per region. "
+               "pcm: Decode the input only once "
+               "by the audio conversion command "
+               "and cut the regions from the in-memory pcm data. "
+               "\".pcm\" and \".wav\" fragments are written directly "
+               "and other suffixes are encoded by ffmpeg through the stdin pipe. "
+               "segment: Split a batch of regions "
+               "by a single ffmpeg command "
+               "which seeks an input to every region. "
+               "\"-asc\"/\"--audio-split-cmd\" is ignored "
+               "in the last two modes. "
+               "(arg_num = 1) (default: %(default)s)"))
+
+    audio_prcs_group.add_argument(
+        '-stm', '--streaming',
+        action='store_true',
+        help=_("Split and recognize the speech regions "
+               "as soon as they are detected "
+               "instead of waiting for the whole detection. "
+               "The regions from the external file "
+               "and the auditok options optimization are not streamed. "
+               "(arg_num = 0)"))
+
     audio_prcs_group.add_argument(
         '-asc', '--audio-split-cmd',
         metavar=_('command'),
@@ -660,6 +876,36 @@ def get_cmd_parser():  # pylint: disable=too-many-statements
                "Ref: https://auditok.readthedocs.io/en/latest/core.html#class-summary "
                "(arg_num = 0)"))
 
+    auditok_group.add_argument(
+        '-ve', '--vad-engine',
+        metavar=_('engine'),
+        default='auditok',
+        choices=["auditok", "numpy"],
+        help=_("Choose which voice activity detection engine "
+               "to find the speech regions. "
+               "auditok: Use auditok's StreamTokenizer frame by frame. "
+               "numpy: Compute the frame energies of the whole audio "
+               "in a vectorized way and tokenize them "
+               "by the same rules as auditok. "
+               "Long audio is split into shards at silent points "
+               "and processed by \"-ac\"/\"--audio-concurrency\" processes. "
+               "Require numpy installed. "
+               "(arg_num = 1) (default: %(default)s)"))
+
+    auditok_group.add_argument(
+        '-ei', '--energy-index',
+        nargs='?', metavar=_('path'),
+        const=constants.DEFAULT_CACHE_PATH,
+        help=_("Directory to save the frame energy index of the input. "
+               "The index is keyed by the input path, size, mtime "
+               "and the audio conversion command. "
+               "When a matching index exists, "
+               "the speech regions are derived from it "
+               "without decoding the input again. "
+               "Only used by \"-ve\"/\"--vad-engine\" numpy. "
+               "If arg_num is 0, use the cache directory \"{cache}\". "
+               "(arg_num = 0 or 1)").format(cache=constants.DEFAULT_CACHE_PATH))
+
     auditok_group.add_argument(
         '-aconf', '--auditok-config',
         nargs='?', metavar=_('path'),
@@ -5,7 +5,6 @@ Defines subtitle formatters used by autosub.
 """
 # pylint: disable=too-many-lines
 # Import built-in modules
-import wave
 import json
 import gettext
 import os
@@ -19,6 +18,7 @@ from fuzzywuzzy import fuzz
 
 # Any changes to the path and your own modules
 from autosub import constants
+from autosub import auditok_utils
 
 SUB_UTILS_TEXT = gettext.translation(domain=__name__,
                                      localedir=constants.LOCALE_PATH,
@@ -627,9 +627,7 @@ def sub_to_speech_regions(
     Give an input audio_wav file and subtitles file and generate proper speech regions.
     """
     regions = []
-    reader = wave.open(audio_wav)
-    audio_file_length = int(float(reader.getnframes()) / float(reader.getframerate())) * 1000
-    reader.close()
+    audio_file_length = auditok_utils.get_audio_length(audio_wav)
 
     ext_regions = pysubs2.SSAFile.load(sub_file)
 
@@ -797,6 +795,54 @@ def pysubs2_ssa_event_add(  # pylint: disable=too-many-branches, too-many-statem
             i = i + 1
 
 
+def ms_to_srt_timestamp(ms_time):
+    """
+    Give a time in milliseconds and return its srt timestamp.
+    """
+    ms_time = max(int(ms_time), 0)
+    hours, ms_time = divmod(ms_time, 3600000)
+    minutes, ms_time = divmod(ms_time, 60000)
+    seconds, ms_time = divmod(ms_time, 1000)
+    return "{:02d}:{:02d}:{:02d},{:03d}".format(hours, minutes, seconds, ms_time)
+
+
+class PartialSrtWriter:
+    """
+    Class for appending the recognized text of every region
+    to a srt file as soon as it arrives in the timeline order
+    so a partial subtitles file is always on the disk.
+    """
+    def __init__(self,
+                 output,
+                 regions,
+                 is_empty_dropped=False,
+                 encoding=constants.DEFAULT_ENCODING):
+        self.output = output
+        # regions may still be growing while they are detected
+        self.regions = regions
+        self.is_empty_dropped = is_empty_dropped
+        self.count = 0
+        self.output_file = open(output, "w", encoding=encoding)
+
+    def __call__(self, index, text):
+        if self.is_empty_dropped and not text:
+            return
+        start, end = self.regions[index]
+        self.count = self.count + 1
+        self.output_file.write("{count}\n{start} --> {end}\n{text}\n\n".format(
+            count=self.count,
+            start=ms_to_srt_timestamp(start),
+            end=ms_to_srt_timestamp(end),
+            text=text))
+        self.output_file.flush()
+
+    def close(self):
+        """
+        Close the file.
+        """
+        self.output_file.close()
+
+
 def list_to_vtt_str(subtitles):
     """
     Serialize a list of subtitles according to the VTT format.
@@ -0,0 +1,686 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Defines the vectorized energy voice activity detection used by autosub.
+"""
+# Import built-in modules
+import os
+import json
+import hashlib
+import wave
+import multiprocessing
+
+# Import third-party modules
+import auditok
+import pysubs2
+
+# Any changes to the path and your own modules
+from autosub import constants
+from autosub import auditok_utils
+
+numpy = constants.numpy_  # pylint: disable=invalid-name
+
+BLOCK_DURATION = 0.01
+# Frame duration in seconds, same as auditok's default block duration
+
+CHUNK_BLOCKS = 1 << 16
+# Number of frames to compute energies at once
+
+MIN_SHARD_BLOCKS = 1 << 15
+# Minimum number of frames in a shard to tokenize in parallel
+
+SHARED_ENERGIES = {}
+# Frame energies shared with the worker processes
+
+SHARED_AUDIO = {}
+# Audio file path or in-memory pcm data shared with the worker processes
+
+
+def frame_log_energies(
+        data,
+        sample_width,
+        frame_width):
+    """
+    Give raw audio data and return the log energy of every frame in it.
+    The last frame can be shorter than the others.
+    """
+    if sample_width == 1:
+        signal = numpy.frombuffer(data, dtype=numpy.int8)
+    elif sample_width == 2:
+        signal = numpy.frombuffer(data, dtype=numpy.int16)
+    else:
+        signal = numpy.frombuffer(data, dtype=numpy.int32)
+
+    full_count = len(signal) // frame_width
+    if sample_width > 2:
+        # avoid overflow of the squares' sum
+        frames = signal[:full_count * frame_width].astype(numpy.float64)
+    else:
+        # exact sum of squares as auditok's float64 dot product
+        frames = signal[:full_count * frame_width].astype(numpy.int64)
+    frames = frames.reshape(full_count, frame_width)
+    energies = numpy.einsum("ij,ij->i", frames, frames) / float(frame_width)
+
+    if len(signal) > full_count * frame_width:
+        rest = signal[full_count * frame_width:].astype(numpy.float64)
+        energies = numpy.append(energies, numpy.dot(rest, rest) / float(len(rest)))
+
+    log_energies = numpy.full(len(energies), -200.0)
+    is_positive = energies > 0
+    log_energies[is_positive] = 10. * numpy.log10(energies[is_positive])
+    return log_energies
+
+
+def get_frame_format(
+        audio_wav,
+        block_dur=BLOCK_DURATION):
+    """
+    Give an audio file path or an in-memory pcm buffer
+    and return its sample width, channel number,
+    frame size in samples and frame number.
+    """
+    if auditok_utils.is_pcm_buffer(audio_wav):
+        sample_width = constants.AUDITOK_SAMPLE_WIDTH
+        channel = constants.AUDITOK_CHANNEL
+        block_size = int(constants.AUDITOK_SAMPLE_RATE * block_dur)
+        sample_count = len(audio_wav) // (sample_width * channel)
+    else:
+        reader = wave.open(audio_wav)
+        sample_width = reader.getsampwidth()
+        channel = reader.getnchannels()
+        block_size = int(reader.getframerate() * block_dur)
+        sample_count = reader.getnframes()
+        reader.close()
+    block_count = (sample_count + block_size - 1) // block_size
+    return sample_width, channel, block_size, block_count
+
+
+def gen_frame_energies(
+        audio_wav,
+        block_dur=BLOCK_DURATION,
+        chunk_blocks=CHUNK_BLOCKS):
+    """
+    Give an audio file path or an in-memory pcm buffer
+    and return the log energies of its frames as an array.
+    """
+    energy_list = []
+    if auditok_utils.is_pcm_buffer(audio_wav):
+        sample_width = constants.AUDITOK_SAMPLE_WIDTH
+        channel = constants.AUDITOK_CHANNEL
+        frame_width = int(constants.AUDITOK_SAMPLE_RATE * block_dur) * channel
+        chunk_size = frame_width * sample_width * chunk_blocks
+        audio_view = memoryview(audio_wav)
+        for i in range(0, len(audio_view), chunk_size):
+            energy_list.append(frame_log_energies(
+                data=audio_view[i:i + chunk_size],
+                sample_width=sample_width,
+                frame_width=frame_width))
+    else:
+        reader = wave.open(audio_wav)
+        sample_width = reader.getsampwidth()
+        channel = reader.getnchannels()
+        block_size = int(reader.getframerate() * block_dur)
+        while True:
+            data = reader.readframes(block_size * chunk_blocks)
+            if not data:
+                break
+            energy_list.append(frame_log_energies(
+                data=data,
+                sample_width=sample_width,
+                frame_width=block_size * channel))
+        reader.close()
+
+    if not energy_list:
+        return numpy.array([], dtype=numpy.float64)
+    return numpy.concatenate(energy_list)
+
+
+def init_shared_audio(audio_wav):
+    """
+    Pool initializer to share the audio with a worker process.
+    """
+    SHARED_AUDIO["audio_wav"] = audio_wav
+
+
+def shard_frame_energies(shard):
+    """
+    Give a shard of the shared audio as (first frame, frame number)
+    and return the log energies of its frames.
+    """
+    first_block, block_count = shard
+    audio_wav = SHARED_AUDIO["audio_wav"]
+    sample_width, channel, block_size, _ = get_frame_format(audio_wav)
+    if auditok_utils.is_pcm_buffer(audio_wav):
+        block_width = block_size * channel * sample_width
+        data = memoryview(audio_wav)[
+            first_block * block_width:(first_block + block_count) * block_width]
+    else:
+        reader = wave.open(audio_wav)
+        reader.setpos(first_block * block_size)
+        data = reader.readframes(block_count * block_size)
+        reader.close()
+    return frame_log_energies(
+        data=data,
+        sample_width=sample_width,
+        frame_width=block_size * channel)
+
+
+def parallel_gen_frame_energies(
+        audio_wav,
+        concurrency=constants.DEFAULT_CONCURRENCY,
+        chunk_blocks=CHUNK_BLOCKS):
+    """
+    Give an audio file path or an in-memory pcm buffer
+    and return the log energies of its frames
+    computed by the worker processes shard by shard.
+    """
+    block_count = get_frame_format(audio_wav)[3]
+    if concurrency <= 1 or block_count < chunk_blocks * 2:
+        return gen_frame_energies(audio_wav, chunk_blocks=chunk_blocks)
+
+    shards = [(i, min(chunk_blocks, block_count - i))
+              for i in range(0, block_count, chunk_blocks)]
+    pool = multiprocessing.Pool(
+        concurrency,
+        initializer=init_shared_audio,
+        initargs=(audio_wav,))
+    try:
+        energy_list = pool.map(shard_frame_energies, shards)
+    finally:
+        pool.terminate()
+        pool.join()
+    return numpy.concatenate(energy_list)
+
+
+def get_valid_runs(is_valid):
+    """
+    Give a boolean array of the frames' validity
+    and return its runs as a list of (is_valid, length).
+    """
+    if not len(is_valid):  # pylint: disable=len-as-condition
+        return []
+    run_starts = numpy.flatnonzero(is_valid[1:] != is_valid[:-1]) + 1
+    run_starts = numpy.concatenate(([0], run_starts))
+    run_lengths = numpy.diff(numpy.append(run_starts, len(is_valid)))
+    return list(zip(is_valid[run_starts].tolist(), run_lengths.tolist()))
+
+
+class EnergyTokenizer:  # pylint: disable=too-many-instance-attributes, too-few-public-methods
+    """
+    Class for tokenizing the runs of the frames' validity
+    by the same rules as auditok's StreamTokenizer.
+    """
+    SILENCE = 0
+    NOISE = 1
+    POSSIBLE_SILENCE = 2
+
+    def __init__(self,
+                 min_length,
+                 max_length,
+                 max_continuous_silence,
+                 mode=auditok.StreamTokenizer.STRICT_MIN_LENGTH):
+        self.min_length = min_length
+        self.max_length = max_length
+        self.max_continuous_silence = max_continuous_silence
+        self.strict_min_length = \
+            (mode & auditok.StreamTokenizer.STRICT_MIN_LENGTH) != 0
+        self.drop_trailing_silence = \
+            (mode & auditok.StreamTokenizer.DROP_TRAILING_SILENCE) != 0
+        self.tokens = []
+        self.state = self.SILENCE
+        self.data_len = 0
+        self.silence_length = 0
+        self.start_frame = 0
+        self.current_frame = -1
+        self.contiguous_token = False
+
+    def tokenize(self,
+                 valid_runs,
+                 first_frame=0,
+                 contiguous_token=False):
+        """
+        Give the runs of the frames' validity from the first frame
+        and return the tokens as a list of (start, end) frame indexes.
+        """
+        self.tokens = []
+        self.state = self.SILENCE
+        self.data_len = 0
+        self.silence_length = 0
+        self.current_frame = first_frame - 1
+        self.contiguous_token = contiguous_token
+
+        for is_valid, length in valid_runs:
+            position = self.current_frame + 1
+            run_end = position + length
+            while position < run_end:
+                position = self.process_run(is_valid, position, run_end)
+
+        if self.state in (self.NOISE, self.POSSIBLE_SILENCE):
+            if self.data_len > 0 and self.data_len > self.silence_length:
+                self.end_of_detection()
+
+        return self.tokens
+
+    def process_run(  # pylint: disable=too-many-return-statements
+            self,
+            is_valid,
+            position,
+            run_end):
+        """
+        Process the frames of a run from the position
+        as far as the state doesn't change
+        and return the position of the next unprocessed frame.
+        """
+        if self.state == self.SILENCE:
+            if not is_valid:
+                self.current_frame = run_end - 1
+                return run_end
+            # a valid frame after a silence
+            self.current_frame = position
+            self.start_frame = position
+            self.data_len = 1
+            self.silence_length = 0
+            self.state = self.NOISE
+            if self.data_len >= self.max_length:
+                self.end_of_detection(truncated=True)
+            return position + 1
+
+        if self.state == self.NOISE:
+            if is_valid:
+                step = min(self.max_length - self.data_len, run_end - position)
+                self.data_len += step
+                self.current_frame = position + step - 1
+                if self.data_len >= self.max_length:
+                    self.end_of_detection(truncated=True)
+                return position + step
+
+            self.current_frame = position
+            if self.max_continuous_silence <= 0:
+                self.end_of_detection()
+                self.state = self.SILENCE
+                return position + 1
+            # the first silent frame following a valid one is tolerated
+            self.silence_length = 1
+            self.data_len += 1
+            self.state = self.POSSIBLE_SILENCE
+            if self.data_len == self.max_length:
+                self.end_of_detection(truncated=True)
+            return position + 1
+
+        if is_valid:
+            self.current_frame = position
+            self.data_len += 1
+            self.silence_length = 0
+            self.state = self.NOISE
+            if self.data_len >= self.max_length:
+                self.end_of_detection(truncated=True)
+            return position + 1
+
+        if self.silence_length >= self.max_continuous_silence:
+            self.current_frame = position
+            if self.silence_length < self.data_len:
+                # deliver only if the gathered frames aren't all silent
+                self.end_of_detection()
+            else:
+                self.data_len = 0
+            self.state = self.SILENCE
+            self.silence_length = 0
+            return position + 1
+
+        step = min(self.max_continuous_silence - self.silence_length,
+                   self.max_length - self.data_len,
+                   run_end - position)
+        self.data_len += step
+        self.silence_length += step
+        self.current_frame = position + step - 1
+        if self.data_len >= self.max_length:
+            # don't reset the silence length
+            # because the total number of silent frames is still needed
+            self.end_of_detection(truncated=True)
+        return position + step
+
+    def end_of_detection(self, truncated=False):
+        """
+        Deliver the gathered frames as a token if they are long enough.
+        """
+        if not truncated and self.drop_trailing_silence and self.silence_length > 0:
+            self.data_len = max(self.data_len - self.silence_length, 0)
+
+        if self.data_len >= self.min_length or \
+                (self.data_len > 0 and not self.strict_min_length
+                 and self.contiguous_token):
+            self.tokens.append((self.start_frame,
+                                self.start_frame + self.data_len - 1))
+            if truncated:
+                # the next token is contiguous with the delivered one
+                self.start_frame = self.current_frame + 1
+                self.contiguous_token = True
+            else:
+                self.contiguous_token = False
+        else:
+            self.contiguous_token = False
+
+        self.data_len = 0
+
+
+class ShardTokenizer:  # pylint: disable=too-few-public-methods
+    """
+    Class for tokenizing a shard of the runs of the frames' validity.
+    """
+
+    def __init__(self,
+                 min_length,
+                 max_length,
+                 max_continuous_silence,
+                 mode=auditok.StreamTokenizer.STRICT_MIN_LENGTH):
+        self.min_length = min_length
+        self.max_length = max_length
+        self.max_continuous_silence = max_continuous_silence
+        self.mode = mode
+
+    def __call__(self, shard, contiguous_token=False):
+        first_frame, valid_runs = shard
+        tokenizer = EnergyTokenizer(
+            min_length=self.min_length,
+            max_length=self.max_length,
+            max_continuous_silence=self.max_continuous_silence,
+            mode=self.mode)
+        tokens = tokenizer.tokenize(
+            valid_runs,
+            first_frame=first_frame,
+            contiguous_token=contiguous_token)
+        return tokens, tokenizer.contiguous_token
+
+
+def split_valid_runs(
+        valid_runs,
+        shard_count,
+        min_silence,
+        min_shard_blocks=MIN_SHARD_BLOCKS):
+    """
+    Give the runs of the frames' validity and split them
+    into shards as a list of (first frame, runs).
+    A shard is only cut after a silent run of min_silence frames,
+    which ends any token before the cut.
+    """
+    total_count = sum(length for _, length in valid_runs)
+    shard_size = max(total_count // max(shard_count, 1), min_shard_blocks)
+    shards = []
+    shard_runs = []
+    first_frame = 0
+    position = 0
+    next_cut = shard_size
+    for is_valid, length in valid_runs:
+        run_end = position + length
+        if not is_valid and length >= min_silence \
+                and run_end >= next_cut and total_count - run_end >= min_shard_blocks:
+            cut = max(position + min_silence, min(next_cut, run_end))
+            shard_runs.append((is_valid, cut - position))
+            shards.append((first_frame, shard_runs))
+            first_frame = cut
+            shard_runs = []
+            if run_end > cut:
+                shard_runs.append((is_valid, run_end - cut))
+            while next_cut <= cut:
+                next_cut = next_cut + shard_size
+        else:
+            shard_runs.append((is_valid, length))
+        position = run_end
+    shards.append((first_frame, shard_runs))
+    return shards
+
+
+def parallel_tokenize(  # pylint: disable=too-many-arguments
+        valid_runs,
+        min_length,
+        max_length,
+        max_continuous_silence,
+        mode=auditok.StreamTokenizer.STRICT_MIN_LENGTH,
+        concurrency=constants.DEFAULT_CONCURRENCY,
+        min_shard_blocks=MIN_SHARD_BLOCKS):
+    """
+    Give the runs of the frames' validity, tokenize the shards of them
+    by the worker processes and stitch the tokens back together.
+    """
+    tokenizer = ShardTokenizer(
+        min_length=min_length,
+        max_length=max_length,
+        max_continuous_silence=max_continuous_silence,
+        mode=mode)
+    shards = split_valid_runs(
+        valid_runs,
+        shard_count=concurrency,
+        min_silence=max(max_continuous_silence, 0) + 1,
+        min_shard_blocks=min_shard_blocks)
+    if concurrency <= 1 or len(shards) <= 1:
+        return tokenizer((0, valid_runs))[0]
+
+    pool = multiprocessing.Pool(concurrency)
+    try:
+        results = pool.map(tokenizer, shards)
+    finally:
+        pool.terminate()
+        pool.join()
+
+    tokens = []
+    contiguous_token = False
+    is_strict = (mode & auditok.StreamTokenizer.STRICT_MIN_LENGTH) != 0
+    for shard, (shard_tokens, shard_contiguous) in zip(shards, results):
+        if contiguous_token and not is_strict:
+            # the contiguous state passes through the cut
+            shard_tokens, shard_contiguous = tokenizer(shard, contiguous_token=True)
+        tokens.extend(shard_tokens)
+        contiguous_token = shard_contiguous
+    return tokens
+
+
+def numpy_gen_speech_regions(  # pylint: disable=too-many-arguments
+        audio_wav,
+        energy_threshold=constants.DEFAULT_ENERGY_THRESHOLD,
+        min_region_size=constants.DEFAULT_MIN_REGION_SIZE,
+        max_region_size=constants.DEFAULT_MAX_REGION_SIZE,
+        max_continuous_silence=constants.DEFAULT_CONTINUOUS_SILENCE,
+        mode=auditok.StreamTokenizer.STRICT_MIN_LENGTH,
+        is_ssa_event=False,
+        concurrency=1):
+    """
+    Give an input audio/video file, generate proper speech regions
+    by the frame energies computed in a vectorized way.
+    """
+    return energies_to_speech_regions(
+        energies=parallel_gen_frame_energies(audio_wav, concurrency=concurrency),
+        energy_threshold=energy_threshold,
+        min_region_size=min_region_size,
+        max_region_size=max_region_size,
+        max_continuous_silence=max_continuous_silence,
+        mode=mode,
+        is_ssa_event=is_ssa_event,
+        concurrency=concurrency)
+
+
+def energies_to_speech_regions(  # pylint: disable=too-many-arguments
+        energies,
+        energy_threshold=constants.DEFAULT_ENERGY_THRESHOLD,
+        min_region_size=constants.DEFAULT_MIN_REGION_SIZE,
+        max_region_size=constants.DEFAULT_MAX_REGION_SIZE,
+        max_continuous_silence=constants.DEFAULT_CONTINUOUS_SILENCE,
+        mode=auditok.StreamTokenizer.STRICT_MIN_LENGTH,
+        is_ssa_event=False,
+        concurrency=1):
+    """
+    Give the frame energies, generate proper speech regions.
+    """
+    tokens = parallel_tokenize(
+        get_valid_runs(energies >= energy_threshold),
+        min_length=int(min_region_size * 100),
+        max_length=int(max_region_size * 100),
+        max_continuous_silence=int(max_continuous_silence * 100),
+        mode=mode,
+        concurrency=concurrency)
+
+    regions = []
+    if not is_ssa_event:
+        for token in tokens:
+            # get start and end times
+            regions.append((token[0] * 10, token[1] * 10))
+    else:
+        for token in tokens:
+            # get start and end times
+            regions.append(pysubs2.SSAEvent(
+                start=token[0] * 10,
+                end=token[1] * 10))
+    return regions
+
+
+def energies_trim_regions(  # pylint: disable=too-many-arguments
+        energies,
+        events,
+        include_before,
+        include_after,
+        energy_threshold=constants.DEFAULT_ENERGY_THRESHOLD,
+        min_region_size=constants.DEFAULT_MIN_REGION_SIZE,
+        max_region_size=constants.DEFAULT_MAX_REGION_SIZE,
+        max_continuous_silence=constants.DEFAULT_CONTINUOUS_SILENCE,
+        mode=auditok.StreamTokenizer.STRICT_MIN_LENGTH):
+    """
+    Give the frame energies of the whole audio and the events
+    and return the speech regions inside each event's window
+    relative to the window's start.
+    The window is the same as the fragment split for the event.
+    """
+    is_valid = energies >= energy_threshold
+    tokenizer = EnergyTokenizer(
+        min_length=int(min_region_size * 100),
+        max_length=int(max_region_size * 100),
+        max_continuous_silence=int(max_continuous_silence * 100),
+        mode=mode)
+    block_ms = int(BLOCK_DURATION * 1000)
+    regions_list = []
+    for event in events:
+        if event.start > include_before:
+            window_start = event.start - include_before
+        else:
+            window_start = event.start
+        window_end = event.end + include_after
+        tokens = tokenizer.tokenize(get_valid_runs(
+            is_valid[window_start // block_ms:
+                     (window_end + block_ms - 1) // block_ms]))
+        regions_list.append(
+            [(token[0] * block_ms, token[1] * block_ms) for token in tokens])
+    return regions_list
+
+
+def share_energies(energies):
+    """
+    Give the frame energies and copy them into a shared memory array
+    which can be passed to the worker processes.
+    """
+    shared_array = multiprocessing.RawArray("d", len(energies))
+    if len(energies):  # pylint: disable=len-as-condition
+        numpy.frombuffer(shared_array, dtype=numpy.float64)[:] = energies
+    return shared_array
+
+
+def init_shared_energies(shared_array):
+    """
+    Pool initializer to share the frame energies with a worker process.
+    """
+    if len(shared_array):  # pylint: disable=len-as-condition
+        SHARED_ENERGIES["energies"] = numpy.frombuffer(shared_array, dtype=numpy.float64)
+    else:
+        SHARED_ENERGIES["energies"] = numpy.array([], dtype=numpy.float64)
+
+
+def energy_gen_stats_regions(auditok_stats):
+    """
+    Give an AuditokSTATS and return itself with regions
+    tokenized from the shared frame energies.
+    """
+    tokenizer = EnergyTokenizer(
+        min_length=int(auditok_stats.mnrs * 100),
+        max_length=int(auditok_stats.mxrs * 100),
+        max_continuous_silence=int(auditok_stats.mxcs * 100),
+        mode=auditok_stats.mode)
+    tokens = tokenizer.tokenize(get_valid_runs(
+        SHARED_ENERGIES["energies"] >= auditok_stats.energy_t))
+    return auditok_utils.set_stats_regions(auditok_stats, tokens)
+
+
+def get_energy_index_key(
+        input_,
+        conversion_cmd):
+    """
+    Give an input file and the audio conversion command
+    and return the key of its energy index.
+    """
+    file_stat = os.stat(input_)
+    key_list = [os.path.abspath(input_),
+                file_stat.st_size,
+                file_stat.st_mtime,
+                conversion_cmd,
+                constants.AUDITOK_SAMPLE_RATE,
+                constants.AUDITOK_CHANNEL,
+                BLOCK_DURATION]
+    return hashlib.sha1(json.dumps(key_list).encode("utf-8")).hexdigest()
+
+
+def get_energy_index_path(
+        input_,
+        index_dir,
+        index_key):
+    """
+    Give an input file and return the path of its energy index.
+    """
+    return os.path.join(
+        index_dir,
+        "{base}.{key}.npz".format(
+            base=os.path.basename(input_),
+            key=index_key[:16]))
+
+
+def load_energy_index(
+        index_file,
+        index_key):
+    """
+    Give an energy index path and return the frame energies in it.
+    Return None if it doesn't exist, doesn't match the key
+    or its frames don't cover the audio duration.
+    """
+    if not os.path.isfile(index_file):
+        return None
+    try:
+        with numpy.load(index_file) as index:
+            if str(index["key"]) != index_key:
+                return None
+            energies = index["energies"]
+            duration = int(index["duration"])
+    except (OSError, ValueError, KeyError):
+        return None
+    # the duration of a wav file is counted in whole seconds
+    covered = len(energies) * int(BLOCK_DURATION * 1000) - duration
+    if covered < 0 or covered >= 1000 + int(BLOCK_DURATION * 1000):
+        return None
+    return energies
+
+
+def save_energy_index(
+        index_file,
+        index_key,
+        energies,
+        duration):
+    """
+    Save the frame energies and the audio duration in milliseconds
+    to the energy index.
+    """
+    index_dir = os.path.dirname(index_file)
+    if index_dir and not os.path.isdir(index_dir):
+        os.makedirs(index_dir)
+    temp_file = index_file + ".temp"
+    with open(temp_file, "wb") as out_file:
+        numpy.savez_compressed(
+            out_file,
+            key=numpy.array(index_key),
+            energies=energies,
+            duration=numpy.array(duration))
+    os.replace(temp_file, index_file)
+    return index_file
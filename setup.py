@@ -43,5 +43,9 @@ setup(
         'python-docx>=0.8.10',
         'send2trash>=1.5.0'
     ],
+    extras_require={
+        'numpy': ['numpy>=1.13.0'],
+        'xfyun-async': ['websockets>=8.0'],
+    },
     license=open(os.path.join(here, "LICENSE")).read()
 )
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for the in-memory pcm buffer audio source.
+"""
+# Import built-in modules
+import os
+import random
+import struct
+import wave
+
+# Any changes to the path and your own modules
+from autosub import auditok_utils
+from autosub import constants
+
+
+def gen_pcm_buffer(seed, seconds):
+    """
+    Give a random seed and return an s16le pcm buffer
+    of random loud bursts separated by silence.
+    """
+    rand = random.Random(seed)
+    samples = []
+    length = int(seconds * constants.AUDITOK_SAMPLE_RATE)
+    is_loud = False
+    while len(samples) < length:
+        run = rand.randint(2, 15) * constants.AUDITOK_SAMPLE_RATE // 10
+        amplitude = 8000 if is_loud else 0
+        samples.extend(rand.randint(-amplitude, amplitude) for _ in range(run))
+        is_loud = not is_loud
+    samples = samples[:length]
+    return bytearray(struct.pack("<{}h".format(len(samples)), *samples))
+
+
+def test_is_pcm_buffer():
+    assert auditok_utils.is_pcm_buffer(b"")
+    assert auditok_utils.is_pcm_buffer(bytearray(b"\0\0"))
+    assert not auditok_utils.is_pcm_buffer("audio.wav")
+
+
+def test_pcm_buffer_to_wav(tmp_path):
+    audio_buffer = gen_pcm_buffer(0, 2)
+    audio_wav = os.path.join(str(tmp_path), "audio.wav")
+    assert auditok_utils.pcm_buffer_to_wav(
+        audio_buffer=audio_buffer, audio_wav=audio_wav) == audio_wav
+
+    reader = wave.open(audio_wav)
+    assert reader.getnchannels() == constants.AUDITOK_CHANNEL
+    assert reader.getsampwidth() == constants.AUDITOK_SAMPLE_WIDTH
+    assert reader.getframerate() == constants.AUDITOK_SAMPLE_RATE
+    assert reader.readframes(reader.getnframes()) == bytes(audio_buffer)
+    reader.close()
+
+
+def test_get_audio_source_from_pcm_buffer():
+    audio_buffer = gen_pcm_buffer(1, 1)
+    asource = auditok_utils.get_audio_source(audio_buffer, record=False)
+    assert asource.get_sampling_rate() == constants.AUDITOK_SAMPLE_RATE
+    assert asource.get_sample_width() == constants.AUDITOK_SAMPLE_WIDTH
+    assert asource.get_channels() == constants.AUDITOK_CHANNEL
+
+    asource.open()
+    data = bytearray()
+    while True:
+        block = asource.read()
+        if not block:
+            break
+        data += block
+    asource.close()
+    assert data == audio_buffer
+
+
+def test_pcm_buffer_matches_wav_file(tmp_path):
+    audio_buffer = gen_pcm_buffer(2, 30)
+    audio_wav = auditok_utils.pcm_buffer_to_wav(
+        audio_buffer=audio_buffer,
+        audio_wav=os.path.join(str(tmp_path), "audio.wav"))
+
+    assert auditok_utils.get_audio_length(audio_buffer) == \
+        auditok_utils.get_audio_length(audio_wav)
+    regions = auditok_utils.auditok_gen_speech_regions(audio_buffer)
+    assert regions
+    assert regions == auditok_utils.auditok_gen_speech_regions(audio_wav)
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for the persistent transcript cache.
+"""
+# Import built-in modules
+import os
+
+# Any changes to the path and your own modules
+from autosub import cache_utils
+
+
+def test_get_cache_key():
+    key = cache_utils.get_cache_key(b"audio", "gsv2", {"lang": "en"})
+    assert key == cache_utils.get_cache_key(b"audio", "gsv2", {"lang": "en"})
+    assert key != cache_utils.get_cache_key(b"audio", "gsv2", {"lang": "zh"})
+    assert key != cache_utils.get_cache_key(b"audio", "gcsv1", {"lang": "en"})
+    assert key != cache_utils.get_cache_key(b"other", "gsv2", {"lang": "en"})
+    assert key != cache_utils.get_cache_key(
+        b"audio", "gsv2", {"lang": "en"}, min_confidence=0.5)
+
+
+def test_strip_url_key():
+    assert cache_utils.strip_url_key(
+        "http://www.google.com/speech-api/v2/recognize?lang=en&key=secret") == \
+        "http://www.google.com/speech-api/v2/recognize?lang=en"
+
+
+def test_transcript_cache(tmp_path):
+    cache_file = os.path.join(str(tmp_path), "cache", "transcripts.sqlite")
+    cache = cache_utils.TranscriptCache(cache_file)
+    assert cache.get("a") == (False, None)
+    cache.put("a", {"text": "字幕"})
+    cache.put("b", [])
+    assert cache.get("a") == (True, {"text": "字幕"})
+    assert cache.get("b") == (False, None)
+    hits, misses, count, _ = cache.get_stats()
+    assert (hits, misses, count) == (1, 2, 1)
+
+    # another run shares the results but counts its own lookups
+    other = cache_utils.TranscriptCache(cache_file)
+    assert other.get("a") == (True, {"text": "字幕"})
+    assert other.get_stats()[:3] == (1, 0, 1)
+    other.close()
+    cache.close()
+
+
+def test_transcript_cache_evict_least_recently_used(tmp_path):
+    cache_file = os.path.join(str(tmp_path), "transcripts.sqlite")
+    cache = cache_utils.TranscriptCache(cache_file)
+    for key in ("a", "b", "c"):
+        cache.put(key, "x" * 100)
+    assert cache.get("a")[0]
+    cache.max_size = 250
+    assert cache.evict() == 1
+    assert cache.get("b") == (False, None)
+    assert cache.get("a")[0]
+    assert cache.get("c")[0]
+    cache.close()
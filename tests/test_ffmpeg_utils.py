@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for decoding audio to an in-memory pcm buffer through ffmpeg.
+"""
+# Import built-in modules
+import math
+import os
+import struct
+import wave
+
+# Import third-party modules
+import pytest
+
+# Any changes to the path and your own modules
+from autosub import cmdline_utils
+from autosub import constants
+from autosub import exceptions
+from autosub import ffmpeg_utils
+
+requires_ffmpeg = pytest.mark.skipif(
+    not constants.FFMPEG_CMD, reason="ffmpeg is not installed")
+
+
+@pytest.mark.parametrize("output", [
+    "\"{out_}\"",
+    "'{out_}'",
+    "{out_}",
+])
+def test_get_pcm_decode_cmd_replaces_output(output):
+    command = ffmpeg_utils.get_pcm_decode_cmd(
+        input_="in put.mp4",
+        conversion_cmd="ffmpeg -y -i \"{in_}\" -vn -ac {channel} "
+                       "-ar {sample_rate} " + output + " -loglevel error",
+        channel=1,
+        sample_rate=16000)
+    assert command == "ffmpeg -y -i \"in put.mp4\" -vn -ac 1 " \
+                      "-ar 16000 -f s16le - -loglevel error"
+
+
+def test_get_pcm_decode_cmd_appends_output():
+    command = ffmpeg_utils.get_pcm_decode_cmd(
+        input_="input.mp4",
+        conversion_cmd="ffmpeg -y -i \"{in_}\" -ac {channel} -ar {sample_rate}",
+        channel=1,
+        sample_rate=16000)
+    assert command == "ffmpeg -y -i \"input.mp4\" -ac 1 -ar 16000 -f s16le -"
+
+
+def gen_sine_wav(path, seconds):
+    """
+    Give a path and write a stereo 44.1 kHz sine wave to it.
+    """
+    samples = []
+    for i in range(int(seconds * 44100)):
+        sample = int(8000 * math.sin(2 * math.pi * 440 * i / 44100))
+        samples.extend((sample, sample))
+    writer = wave.open(path, "wb")
+    writer.setnchannels(2)
+    writer.setsampwidth(2)
+    writer.setframerate(44100)
+    writer.writeframes(struct.pack("<{}h".format(len(samples)), *samples))
+    writer.close()
+    return path
+
+
+@requires_ffmpeg
+def test_ffmpeg_pipe_to_buffer(tmp_path):
+    audio_wav = gen_sine_wav(os.path.join(str(tmp_path), "sine.wav"), 1)
+    audio_buffer = ffmpeg_utils.ffmpeg_decode_pcm(
+        input_=audio_wav,
+        conversion_cmd=constants.DEFAULT_AUDIO_CVT_CMD,
+        channel=constants.AUDITOK_CHANNEL,
+        sample_rate=constants.AUDITOK_SAMPLE_RATE)
+    assert len(audio_buffer) == constants.AUDITOK_SAMPLE_RATE \
+        * constants.AUDITOK_SAMPLE_WIDTH * constants.AUDITOK_CHANNEL
+
+
+@requires_ffmpeg
+def test_ffmpeg_pipe_to_buffer_raises_on_failure(tmp_path):
+    with pytest.raises(exceptions.ConversionException):
+        ffmpeg_utils.ffmpeg_decode_pcm(
+            input_=os.path.join(str(tmp_path), "missing.wav"),
+            conversion_cmd=constants.DEFAULT_AUDIO_CVT_CMD,
+            channel=constants.AUDITOK_CHANNEL,
+            sample_rate=constants.AUDITOK_SAMPLE_RATE)
+
+
+@requires_ffmpeg
+def test_convert_pcm_keeps_wav(tmp_path):
+    audio_wav = gen_sine_wav(os.path.join(str(tmp_path), "sine.wav"), 2)
+    output_ = os.path.join(str(tmp_path), "output")
+    audio_buffer = cmdline_utils.convert_pcm(
+        input_=audio_wav,
+        conversion_cmd=constants.DEFAULT_AUDIO_CVT_CMD,
+        output_=output_,
+        keep=True)
+
+    reader = wave.open(output_ + ".used.wav")
+    assert reader.getframerate() == constants.AUDITOK_SAMPLE_RATE
+    assert reader.getnchannels() == constants.AUDITOK_CHANNEL
+    assert reader.readframes(reader.getnframes()) == bytes(audio_buffer)
+    reader.close()
+
+
+@requires_ffmpeg
+def test_convert_pcm_without_keep(tmp_path):
+    audio_wav = gen_sine_wav(os.path.join(str(tmp_path), "sine.wav"), 1)
+    output_ = os.path.join(str(tmp_path), "output")
+    assert cmdline_utils.convert_pcm(
+        input_=audio_wav,
+        conversion_cmd=constants.DEFAULT_AUDIO_CVT_CMD,
+        output_=output_)
+    assert not os.path.exists(output_ + ".used.wav")
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for the recognition journal used to resume an interrupted job.
+"""
+# Import built-in modules
+import os
+
+# Any changes to the path and your own modules
+from autosub import journal_utils
+from autosub import net_utils
+
+REGIONS = [(0, 1000), (1000, 2500), (3000, 4000), (5000, 7000)]
+
+
+def recognize(fragment):
+    """
+    Give a fragment and return its text or an empty result.
+    """
+    if fragment % 2:
+        return ""
+    return "text {}".format(fragment)
+
+
+def test_journal_resumes_missing_results(tmp_path):
+    journal_file = os.path.join(str(tmp_path), "output.journal.jsonl")
+    journal = journal_utils.RecognitionJournal(journal_file, "job")
+    assert not journal.load()
+    journal.record_regions(REGIONS)
+    assert journal.get_missing_indexes() == [0, 1, 2, 3]
+    journal.record_missing_result(2, "c")
+    journal.record_missing_result(1, "")
+    journal.close()
+    # the job dies while writing a record
+    with open(journal_file, "a", encoding="utf-8") as out_file:
+        out_file.write("{\"index\": 0, \"res")
+
+    journal = journal_utils.RecognitionJournal(journal_file, "job")
+    assert journal.load()
+    assert journal.regions == REGIONS
+    assert journal.get_missing_indexes() == [0, 3]
+    journal.record_missing_result(1, "d")
+    assert list(journal.merge_results(["a", "d"])) == ["a", "", "c", "d"]
+    journal.close()
+
+    journal = journal_utils.RecognitionJournal(journal_file, "job")
+    assert journal.load()
+    assert journal.get_missing_indexes() == [0]
+    journal.close()
+
+
+def test_journal_of_another_job_restarts(tmp_path):
+    journal_file = os.path.join(str(tmp_path), "output.journal.jsonl")
+    journal = journal_utils.RecognitionJournal(journal_file, "job")
+    journal.load()
+    journal.record_regions(REGIONS)
+    journal.close()
+
+    journal = journal_utils.RecognitionJournal(journal_file, "other job")
+    assert not journal.load()
+    assert journal.regions is None
+    journal.close()
+
+
+def test_speech_imap_records_every_result_on_completion(tmp_path):
+    journal_file = os.path.join(str(tmp_path), "output.journal.jsonl")
+    journal = journal_utils.RecognitionJournal(journal_file, "job")
+    journal.load()
+    journal.record_regions(REGIONS * 5)
+    pool = net_utils.ThreadSpeechPool(3)
+    results = list(net_utils.speech_imap(
+        pool, recognize, range(len(REGIONS) * 5),
+        on_result=journal.record_missing_result))
+    pool.close()
+    pool.join()
+    journal.close()
+    assert results == [recognize(fragment) for fragment in range(len(REGIONS) * 5)]
+
+    journal = journal_utils.RecognitionJournal(journal_file, "job")
+    assert journal.load()
+    assert journal.get_missing_indexes() == []
+    assert list(journal.merge_results([])) == results
+    journal.close()
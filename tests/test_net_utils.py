@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for the network utilities used by the speech-to-text api clients.
+"""
+# Import built-in modules
+import asyncio
+import base64
+import json
+import os
+import queue
+import random
+import time
+
+# Import third-party modules
+import pytest
+
+# Any changes to the path and your own modules
+from autosub import net_utils
+
+
+def square(number):
+    """
+    Give a number and return its square after a random short delay.
+    """
+    time.sleep(random.random() * 0.01)
+    return number * number
+
+
+def fail(number):
+    """
+    Give a number and raise a ValueError.
+    """
+    raise ValueError(number)
+
+
+class AsyncSquare:  # pylint: disable=too-few-public-methods
+    """
+    Class for squaring a number in a coroutine.
+    """
+    is_async = True
+
+    def __call__(self, number):
+        return number * number
+
+    async def call_async(self, number):
+        """
+        Give a number and return its square after a random short delay.
+        """
+        await asyncio.sleep(random.random() * 0.01)
+        return number * number
+
+
+def test_thread_speech_pool_imap():
+    pool = net_utils.ThreadSpeechPool(3)
+    assert list(pool.imap(square, range(20))) == [number * number for number in range(20)]
+    assert sorted(pool.imap_unordered(square, range(20))) == \
+        [number * number for number in range(20)]
+    pool.close()
+    pool.join()
+    assert pool.loop is None
+
+
+def test_thread_speech_pool_apply_async():
+    pool = net_utils.ThreadSpeechPool(2)
+    done_queue = queue.Queue()
+    async_result = pool.apply_async(
+        square, (3,), callback=lambda result: done_queue.put((True, result)))
+    assert async_result.get() == 9
+    assert done_queue.get(timeout=1) == (True, 9)
+    pool.apply_async(
+        fail, (4,), error_callback=lambda error: done_queue.put((False, error)))
+    is_done, error = done_queue.get(timeout=1)
+    assert not is_done
+    assert isinstance(error, ValueError)
+    pool.close()
+    pool.join()
+
+
+def test_thread_speech_pool_awaits_coroutines():
+    pool = net_utils.ThreadSpeechPool(2)
+    assert list(pool.imap(AsyncSquare(), range(20))) == \
+        [number * number for number in range(20)]
+    assert pool.loop is not None
+    pool.close()
+    pool.join()
+    assert pool.loop.is_closed()
+
+
+def test_aimd_controller_congestion():
+    controller = net_utils.AIMDController(4, 32)
+    for _ in range(20):
+        controller.update(False)
+    limit = controller.limit
+    assert 4 < limit <= 32
+    controller.update(True)
+    assert controller.limit == limit * 0.5
+    cut_limit = controller.limit
+    # the requests sent before the cut don't cut it again
+    for _ in range(controller.get_limit()):
+        controller.update(True)
+    assert controller.limit == cut_limit
+    assert controller.congested_count == 1 + int(cut_limit)
+
+
+def test_aimd_controller_normalizes_latency_by_duration():
+    rand = random.Random(0)
+    controller = net_utils.AIMDController(4, 32)
+    for _ in range(2000):
+        duration = rand.uniform(1, 15)
+        # a fixed cost of a request and a cost per second of audio
+        controller.update(False, 0.3 + 0.5 * duration, duration)
+    assert controller.get_limit() == 32
+
+    # the provider slows down
+    for _ in range(50):
+        duration = rand.uniform(1, 15)
+        controller.update(False, 3 * (0.3 + 0.5 * duration), duration)
+    assert controller.get_limit() < 32
+
+
+def test_aimd_controller_ignores_latency_without_duration():
+    controller = net_utils.AIMDController(4, 8)
+    for latency in range(1, 200):
+        controller.update(False, latency, None)
+    assert controller.get_limit() == 8
+
+
+def test_retry_policy_delay_is_bounded():
+    policy = net_utils.RetryPolicy(backoff_base=0.5, backoff_max=4.0)
+    assert policy.get_delay(0) == 0
+    for attempt in range(1, 10):
+        for _ in range(20):
+            delay = policy.get_delay(attempt)
+            assert 0 <= delay <= min(4.0, 0.5 * (1 << attempt))
+
+
+def test_retry_policy_attempts():
+    policy = net_utils.RetryPolicy(
+        retries=3,
+        connect_timeout=2,
+        read_timeout=5,
+        backoff_base=0.001,
+        backoff_max=0.001,
+        deadline=10)
+    assert list(policy.attempts()) == [(2, 5)] * 3
+    assert len(list(net_utils.RetryPolicy(retries=0).attempts())) == 1
+
+
+def test_retry_policy_stops_at_deadline():
+    policy = net_utils.RetryPolicy(
+        retries=5,
+        connect_timeout=2,
+        read_timeout=5,
+        backoff_base=10,
+        backoff_max=10,
+        deadline=1)
+    timeouts = list(policy.attempts())
+    # the first attempt is clipped to the deadline
+    # and no backoff fits in the rest of it
+    assert len(timeouts) <= 2
+    assert all(connect <= 1 and read <= 1 for connect, read in timeouts)
+    assert policy.get_timeouts(time.monotonic() - 2) is None
+
+
+class ReadyResult:
+    """
+    Class for a result of a call that is done or still pending.
+    """
+    def __init__(self, result=None, is_ready=True):
+        self.result = result
+        self.is_ready = is_ready
+        self.is_cancelled = False
+
+    def ready(self):
+        """
+        Return whether the call is done.
+        """
+        return self.is_ready
+
+    def get(self):
+        """
+        Return the result of the call.
+        """
+        return self.result
+
+    def cancel(self):
+        """
+        Cancel the call.
+        """
+        self.is_cancelled = True
+
+
+class PendingPool:  # pylint: disable=too-few-public-methods
+    """
+    Class for a pool whose calls never complete.
+    """
+    def apply_async(self, func, args):  # pylint: disable=unused-argument, no-self-use
+        """
+        Return a pending result.
+        """
+        return ReadyResult(is_ready=False)
+
+
+def test_request_hedger_threshold():
+    hedger = net_utils.RequestHedger(4, percentile=0.5, min_samples=3)
+    assert hedger.get_threshold() is None
+    hedger.latencies.extend([3.0, 1.0, 2.0, 10.0])
+    assert hedger.get_threshold() == 2.0
+
+
+def test_request_hedger_budget():
+    hedger = net_utils.RequestHedger(4, max_ratio=0.5, min_samples=1)
+    hedger.latencies.append(0.0)
+    pool = PendingPool()
+    in_flight = [hedger.send(pool, square, item) for item in range(4)]
+    assert hedger.hedge(pool, square, in_flight) is None
+    assert hedger.hedged_count == 2
+    assert [request.is_hedged for request in in_flight] == [True, True, False, False]
+
+
+def test_request_hedger_duplicate_wins():
+    hedger = net_utils.RequestHedger(4)
+    primary = ReadyResult(is_ready=False)
+    request = net_utils.HedgedRequest("fragment", primary)
+    assert hedger.poll(request) is None
+    request.results.append(ReadyResult(("text", 0.5, False)))
+    assert hedger.poll(request) == ("text", 0.5, False)
+    assert primary.is_cancelled
+    assert hedger.won_count == 1
+    assert list(hedger.latencies) == [0.5]
+
+
+def test_request_hedger_falls_back_to_empty_result():
+    hedger = net_utils.RequestHedger(4)
+    request = net_utils.HedgedRequest("fragment", ReadyResult(("", 0.5, False)))
+    assert hedger.poll(request) == ("", 0.5, False)
+    assert hedger.poll(request) == ("", 0.5, False)
+
+
+def test_rate_limiter_shared_by_instances(tmp_path):
+    limits = net_utils.parse_rate_limits(["gsv2=2/m"])["gsv2"]
+    assert limits == [(2.0, 60)]
+    first = net_utils.RateLimiter("gsv2", limits, str(tmp_path))
+    second = net_utils.RateLimiter("gsv2", limits, str(tmp_path))
+    assert first.take() == 0
+    assert second.take() == 0
+    wait = first.take()
+    assert 29 < wait <= 30
+    assert second.take() > 0
+
+
+def test_rate_limiter_all_limits(tmp_path):
+    limiter = net_utils.RateLimiter(
+        "gsv2", [(100.0, 1.0), (1.0, 60.0)], str(tmp_path))
+    assert limiter.take() == 0
+    assert limiter.take() > 1
+
+
+def test_parse_rate_limits_rejects_invalid():
+    for rate_limit in ["unknown=1/s", "gsv2=0/s", "gsv2=1/x", "gsv2=a/s"]:
+        with pytest.raises(ValueError):
+            net_utils.parse_rate_limits([rate_limit])
+    assert net_utils.get_rate_limiter({}, "gsv2") is None
+
+
+def test_credential_pool_spreads_usage(tmp_path):
+    credentials = [{"key": "a"}, {"key": "b", "weight": 2}]
+    pool = net_utils.CredentialPool("gsv2", credentials, str(tmp_path))
+    other = net_utils.CredentialPool("gsv2", credentials, str(tmp_path))
+    keys = [pool.take()[1]["key"] for _ in range(3)] + \
+        [other.take()[1]["key"] for _ in range(3)]
+    assert keys.count("a") == 2
+    assert keys.count("b") == 4
+
+
+def test_credential_pool_evict(tmp_path):
+    credentials = [{"key": "a"}, {"key": "b"}]
+    pool = net_utils.CredentialPool(
+        "gsv2", credentials, str(tmp_path), cooldown=60)
+    pool.evict(0)
+    assert [pool.take()[0] for _ in range(3)] == [1, 1, 1]
+    pool.evict(1)
+    wait = pool.take()
+    assert 59 < wait <= 60
+
+
+def test_credential_pool_rate_limit(tmp_path):
+    credentials = [{"key": "a", "rate_limit": ["1/m"]}, {"key": "b", "weight": 0.001}]
+    pool = net_utils.CredentialPool("gsv2", credentials, str(tmp_path))
+    assert pool.take()[0] == 0
+    # the rate limit of the least used one falls back to the other one
+    assert pool.take()[0] == 1
+    assert pool.take()[0] == 1
+
+
+def test_credential_pool_resets_usage_every_day(tmp_path):
+    credentials = [{"key": "a"}, {"key": "b"}]
+    pool = net_utils.CredentialPool("gsv2", credentials, str(tmp_path))
+    with open(pool.state_file, "w", encoding="utf-8") as state_file:
+        json.dump({"day": "2000-01-01",
+                   "used": {pool.credential_ids[0]: 0,
+                            pool.credential_ids[1]: 100},
+                   "evicted": {}}, state_file)
+    assert pool.take()[0] == 0
+    assert pool.take()[0] == 1
+    with open(pool.state_file, encoding="utf-8") as state_file:
+        state = json.load(state_file)
+    assert state["day"] == time.strftime("%Y-%m-%d")
+    assert sorted(state["used"].values()) == [1, 1]
+
+
+def test_get_lpt_order(tmp_path):
+    items = []
+    for index, size in enumerate([10, 30, 20]):
+        item = os.path.join(str(tmp_path), "{}.flac".format(index))
+        with open(item, "wb") as out_file:
+            out_file.write(b"\0" * size)
+        items.append(item)
+    items.append(os.path.join(str(tmp_path), "missing.flac"))
+    assert net_utils.get_lpt_order(items) == [1, 2, 0, 3]
+
+
+def test_speech_imap_lpt_yields_in_order(tmp_path):
+    items = []
+    for index in range(10):
+        item = os.path.join(str(tmp_path), "{}.flac".format(index))
+        with open(item, "wb") as out_file:
+            out_file.write(b"\0" * random.Random(index).randint(1, 100))
+        items.append(item)
+    pool = net_utils.ThreadSpeechPool(3)
+    assert list(net_utils.speech_imap(pool, os.path.getsize, items, schedule="lpt")) == \
+        [os.path.getsize(item) for item in items]
+    pool.close()
+    pool.join()
+
+
+def test_reassemble_yields_in_order_as_soon_as_possible():
+    yielded = []
+    completions = [(2, "c"), (0, "a"), (3, "d"), (1, "b"), (4, "e")]
+
+    def gen_completions():
+        for completion in completions:
+            yielded.append(completion[0])
+            yield completion
+
+    results = net_utils.reassemble(gen_completions())
+    assert next(results) == "a"
+    assert yielded == [2, 0]
+    assert next(results) == "b"
+    assert yielded == [2, 0, 3, 1]
+    assert list(results) == ["c", "d", "e"]
+
+
+def test_windowed_imap_bounds_the_window():
+    pool = net_utils.ThreadSpeechPool(4)
+    submitted = []
+
+    def gen_items():
+        for number in range(50):
+            submitted.append(number)
+            yield number
+
+    results = net_utils.windowed_imap(pool, square, gen_items(), window=5)
+    assert next(results) == 0
+    assert len(submitted) <= 6
+    assert list(results) == [number * number for number in range(1, 50)]
+    pool.close()
+    pool.join()
+
+
+@pytest.mark.parametrize("audio_size", [
+    0, 1, 2, 3, 100,
+    net_utils.BASE64_CHUNK_SIZE,
+    net_utils.BASE64_CHUNK_SIZE * 2 + 1,
+])
+def test_encode_json_body(audio_size):
+    audio_data = bytes(random.Random(audio_size).getrandbits(8)
+                       for _ in range(audio_size))
+    payload = {
+        "config": {"language": "zh-CN", "text": "字幕"},
+        "audio": {"content": net_utils.BASE64_PLACEHOLDER},
+    }
+    body = net_utils.encode_json_body(payload, audio_data)
+    payload["audio"]["content"] = base64.b64encode(audio_data).decode("ascii")
+    assert bytes(body) == json.dumps(payload, ensure_ascii=False).encode("utf-8")
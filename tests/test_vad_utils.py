@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for the vectorized energy voice activity detection.
+"""
+# Import built-in modules
+import random
+
+# Import third-party modules
+import auditok
+import pytest
+
+# Any changes to the path and your own modules
+from autosub import vad_utils
+
+numpy = pytest.importorskip("numpy")
+
+MODES = [
+    0,
+    auditok.StreamTokenizer.STRICT_MIN_LENGTH,
+    auditok.StreamTokenizer.DROP_TRAILING_SILENCE,
+    auditok.StreamTokenizer.STRICT_MIN_LENGTH
+    | auditok.StreamTokenizer.DROP_TRAILING_SILENCE,
+]
+
+
+class FrameValidator(auditok.DataValidator):
+    """
+    Class for validating the "1" frames of a string.
+    """
+    def is_valid(self, data):
+        return data == "1"
+
+
+def gen_validity(seed, length, max_run):
+    """
+    Give a random seed and return a string of the frames' validity
+    made of random runs.
+    """
+    rand = random.Random(seed)
+    frames = []
+    is_valid = rand.random() < 0.5
+    while len(frames) < length:
+        frames.append(("1" if is_valid else "0") * rand.randint(1, max_run))
+        is_valid = not is_valid
+    return "".join(frames)[:length]
+
+
+def auditok_tokens(
+        validity,
+        min_length,
+        max_length,
+        max_continuous_silence,
+        mode):
+    """
+    Give a string of the frames' validity
+    and return the (start, end) tokens found by auditok.
+    """
+    tokenizer = auditok.StreamTokenizer(
+        validator=FrameValidator(),
+        min_length=min_length,
+        max_length=max_length,
+        max_continuous_silence=max_continuous_silence,
+        mode=mode)
+    return [(start, end) for _, start, end
+            in tokenizer.tokenize(auditok.StringDataSource(validity))]
+
+
+def energy_tokens(
+        validity,
+        min_length,
+        max_length,
+        max_continuous_silence,
+        mode):
+    """
+    Give a string of the frames' validity
+    and return the (start, end) tokens found by EnergyTokenizer.
+    """
+    is_valid = numpy.array([frame == "1" for frame in validity], dtype=bool)
+    tokenizer = vad_utils.EnergyTokenizer(
+        min_length=min_length,
+        max_length=max_length,
+        max_continuous_silence=max_continuous_silence,
+        mode=mode)
+    return tokenizer.tokenize(vad_utils.get_valid_runs(is_valid))
+
+
+def test_get_valid_runs():
+    is_valid = numpy.array([1, 1, 0, 0, 0, 1, 0], dtype=bool)
+    assert vad_utils.get_valid_runs(is_valid) == \
+        [(True, 2), (False, 3), (True, 1), (False, 1)]
+    assert vad_utils.get_valid_runs(numpy.array([], dtype=bool)) == []
+
+
+@pytest.mark.parametrize("mode", MODES)
+@pytest.mark.parametrize("min_length, max_length, max_continuous_silence", [
+    (1, 1, 0),
+    (3, 10, 0),
+    (3, 10, 2),
+    (5, 8, 7),
+    (20, 50, 5),
+    (1, 1000, 30),
+])
+def test_energy_tokenizer_matches_auditok(
+        min_length,
+        max_length,
+        max_continuous_silence,
+        mode):
+    for seed in range(20):
+        validity = gen_validity(seed, 2000, max_run=40)
+        assert energy_tokens(
+            validity, min_length, max_length, max_continuous_silence, mode) == \
+            auditok_tokens(
+                validity, min_length, max_length, max_continuous_silence, mode)
+
+
+@pytest.mark.parametrize("mode", MODES)
+def test_parallel_tokenize_matches_single_process(mode):
+    validity = gen_validity(7, 20000, max_run=60)
+    is_valid = numpy.array([frame == "1" for frame in validity], dtype=bool)
+    valid_runs = vad_utils.get_valid_runs(is_valid)
+    shards = vad_utils.split_valid_runs(
+        valid_runs, shard_count=4, min_silence=11, min_shard_blocks=500)
+    assert len(shards) > 1
+    assert sum(length for _, runs in shards for _, length in runs) == len(validity)
+
+    tokens = vad_utils.parallel_tokenize(
+        valid_runs,
+        min_length=5,
+        max_length=40,
+        max_continuous_silence=10,
+        mode=mode,
+        concurrency=4,
+        min_shard_blocks=500)
+    assert tokens == auditok_tokens(validity, 5, 40, 10, mode)